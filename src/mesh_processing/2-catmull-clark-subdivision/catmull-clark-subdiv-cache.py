@@ -0,0 +1,107 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: catmull-clark-subdiv-cache.py
+description: Subdivides every frame of an animated mesh (a PC2 point cache, e.g. baked by the skinning scripts)
+             using the Catmull-Clark algorithm. The topology never changes between frames, so the subdivision rules
+             are built once as a sparse stencil matrix S (cached on disk by a hash of the topology) and every frame
+             is subdivided by one sparse product S @ positions. The POINT attributes and the vertex group weights
+             of the mesh go through the same S, the CORNER attributes (corner colors, UV maps) through the
+             face-varying corner stencil. With LEVELS > 1 the stencils of all levels are composed into one matrix,
+             so a frame is still a single product and the intermediate levels are never built.
+
+how to use:
+    1. Open Blender file
+    2. Open the Python Console
+    3. Open the script file on the Python Console
+    4. *** Change OBJECT_NAME, INPUT_CACHE_PATH, OUTPUT_CACHE_PATH and LEVELS in the script ***
+    5. *** Change ATTRIBUTE_NAMES to the attributes you want to interpolate (None for all) ***
+    6. Run the script: the object gets the subdivided rest mesh and a Mesh Cache modifier playing OUTPUT_CACHE_PATH
+'''
+
+import bpy
+import os
+import sys
+import time
+
+# Make the subdivision engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "..", "utils"))
+from mesh_data import MeshData, float_attribute_names
+from subdivision_engine import load_or_build_operator
+from point_cache import open_point_cache, create_point_cache
+from vertex_group_io import read_group_matrix, write_group_matrix
+
+OBJECT_NAME = "jumpingjacks"
+# Point cache of the base mesh, e.g. written by linear-blend-skinning.py in bake mode
+INPUT_CACHE_PATH = "//skinning_cache/lbs.pc2"
+# Point cache of the subdivided mesh
+OUTPUT_CACHE_PATH = "//skinning_cache/lbs_subdiv.pc2"
+# Stencil matrices, keyed by the topology of the base mesh
+OPERATOR_CACHE_DIR = "//subdivision_cache"
+MODIFIER_NAME = "SubdivisionCache"
+# Number of subdivision levels
+LEVELS = 1
+# POINT and CORNER attributes to interpolate, e.g. ['Attribute', 'UVMap']; None for every float attribute
+ATTRIBUTE_NAMES = None
+
+obj = bpy.data.objects.get(OBJECT_NAME)
+if obj is None or obj.type != 'MESH':
+    raise ValueError(f"Mesh object '{OBJECT_NAME}' not found!")
+
+bpy.ops.object.mode_set(mode='OBJECT')
+mesh = obj.data
+
+attribute_names = float_attribute_names(mesh) if ATTRIBUTE_NAMES is None else ATTRIBUTE_NAMES
+for name in attribute_names:
+    if name not in mesh.attributes or mesh.attributes[name].domain not in ('POINT', 'CORNER'):
+        raise ValueError(f"'{name}' is not a POINT or CORNER attribute of the mesh.")
+mesh_data = MeshData.from_blender(mesh, attribute_names)
+
+frames, start_frame, sample_rate = open_point_cache(bpy.path.abspath(INPUT_CACHE_PATH))
+if frames.shape[1] != mesh_data.num_vertices:
+    raise ValueError(f"The point cache has {frames.shape[1]} points, the mesh has {mesh_data.num_vertices} vertices.")
+
+# Stencils and subdivided topology, built once per topology
+start_time = time.time()
+operator, cached = load_or_build_operator(bpy.path.abspath(OPERATOR_CACHE_DIR), mesh_data.face_offsets,
+                                          mesh_data.face_indices, mesh_data.num_vertices, LEVELS)
+print(f"Subdivision operator {'loaded' if cached else 'built'}: {operator.stencil.shape[0]} x "
+      f"{operator.stencil.shape[1]}, {operator.stencil.nnz} entries. Time: {time.time() - start_time:.2f}s")
+
+# Subdivided rest mesh with its attributes, and the vertex group weights through the same stencils
+subdivided = operator.mesh(mesh_data.positions, mesh_data.attributes, mesh_data.attribute_domains)
+group_weights = operator.stencil @ read_group_matrix(obj)
+group_names = [vgroup.name for vgroup in obj.vertex_groups]
+new_mesh = bpy.data.meshes.new("SubdividedMesh")
+subdivided.to_blender(new_mesh)
+obj.data = new_mesh
+# The vertex group names are stored on the mesh (Blender 3.0+), so the new mesh starts without groups
+vgroups = [obj.vertex_groups.new(name=name) for name in group_names]
+write_group_matrix(vgroups, group_weights)
+
+# One sparse product per frame, streamed into the output cache
+start_time = time.time()
+output_path = bpy.path.abspath(OUTPUT_CACHE_PATH)
+os.makedirs(os.path.dirname(output_path), exist_ok=True)
+output = create_point_cache(output_path, operator.num_vertices, len(frames), start_frame, sample_rate)
+for f in range(len(frames)):
+    output[f] = operator.apply(frames[f])
+output.flush()
+del output, frames
+print(f"Subdivided {operator.stencil.shape[0]} vertices per frame. Time: {time.time() - start_time:.2f}s")
+
+# Mesh Cache modifiers of the base mesh no longer match; play the subdivided cache instead
+for modifier in [m for m in obj.modifiers if m.type == 'MESH_CACHE']:
+    obj.modifiers.remove(modifier)
+modifier = obj.modifiers.new(MODIFIER_NAME, 'MESH_CACHE')
+modifier.cache_format = 'PC2'
+modifier.filepath = output_path
+modifier.play_mode = 'SCENE'
+modifier.time_mode = 'FRAME'
+modifier.frame_start = start_frame
+modifier.frame_scale = 1.0
+
+print("Catmull-Clark subdivision of the point cache complete")
@@ -4,241 +4,124 @@ Animating an object from single monocular video
 
 name: catmull-clark-subdiv-partial-geo.py
 description: Subdivides selected faces of a mesh using the Catmull-Clark algorithm (geometry only).
+             The face and edge points of the selected sub-mesh are computed on NumPy arrays (see
+             subdivision_engine.py); the original vertices are kept in place and the new quads are
+             stitched into the mesh with BMesh. The faces around the selection get the new points of their
+             shared edges, so the mesh stays crack-free.
+             With ADAPTIVE_METRIC the faces are picked automatically instead: the faces with the largest
+             dihedral angle to their neighbors ("angle") or the longest edges ("length").
 
 how to use:
     1. Open Blender file
     2. Open the Python Console
     3. Open the script file on the Python Console
-    4. Select the faces you want to subdivide in Edit Mode
-    5. Run the script
+    4. Select the faces you want to subdivide in Edit Mode,
+       or set ADAPTIVE_METRIC and ADAPTIVE_THRESHOLD / ADAPTIVE_FRACTION to pick them automatically
+    5. *** Change LEVELS to subdivide the selection several times in one run ***
+    6. Run the script
 '''
 
 import bpy
 import bmesh
-from mathutils import Vector
-
-def is_hole_edge(edge_faces):
-    return len(edge_faces) == 1
-
-def is_hole_vertex(num_edges, num_faces):
-    return num_edges != num_faces
-
-def midpoint(co1, co2):
-    return (co1 + co2) / 2.0
-
-# Switch to object mode to access the BMesh
+import os
+import sys
+import numpy as np
+
+# Make the subdivision engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "..", "utils"))
+from mesh_data import MeshData
+from subdivision_engine import (SubdivisionOperator, level_topologies, extract_faces, face_scores, select_faces,
+                                 stitch_neighbors)
+
+# Number of subdivision levels of the selected faces
+LEVELS = 1
+# Faces to subdivide: None for the faces selected in Edit Mode, "angle" or "length" to pick them by that metric
+ADAPTIVE_METRIC = None
+# Faces whose metric is above ADAPTIVE_THRESHOLD (radians or mesh units), or if None the top ADAPTIVE_FRACTION
+ADAPTIVE_THRESHOLD = None
+ADAPTIVE_FRACTION = 0.2
+
+# Switch to object mode to access the mesh
 bpy.ops.object.mode_set(mode='OBJECT')
 obj = bpy.context.active_object
 if obj is None or obj.type != 'MESH':
     raise ValueError("Active object must be a mesh")
 
 mesh = obj.data
-bm = bmesh.new()
-bm.from_mesh(mesh)
-bm.verts.ensure_lookup_table()
-bm.edges.ensure_lookup_table()
-bm.faces.ensure_lookup_table()
 
 # The user must have selected faces in Edit Mode beforehand
 bpy.ops.object.mode_set(mode='EDIT')
 bpy.ops.mesh.select_mode(type='FACE')
 bpy.ops.object.mode_set(mode='OBJECT')
 
-bm.clear()
-bm.from_mesh(mesh)
-bm.verts.ensure_lookup_table()
-bm.edges.ensure_lookup_table()
-bm.faces.ensure_lookup_table()
+mesh_data = MeshData.from_blender(mesh)
 
 # Identify selected faces
-selected_faces = [f for f in bm.faces if f.select]
-if not selected_faces:
-    bm.free()
+if ADAPTIVE_METRIC is None:
+    selected = np.zeros(len(mesh.polygons), dtype=bool)
+    mesh.polygons.foreach_get("select", selected)
+else:
+    selected = select_faces(face_scores(mesh_data, ADAPTIVE_METRIC), ADAPTIVE_THRESHOLD, ADAPTIVE_FRACTION)
+    print(f"Adaptive subdivision: {selected.sum()} of {len(selected)} faces by {ADAPTIVE_METRIC}")
+if not selected.any():
     raise ValueError("No faces selected. Exiting.")
 
 # Extract sub-mesh (faces, edges, verts) from selected faces
-selected_faces_indices = []
-for f in selected_faces:
-    selected_faces_indices.append([v.index for v in f.verts])
-
-sub_vert_indices = set()
-sub_edge_set = set()
-for face_verts in selected_faces_indices:
-    for v_i in face_verts:
-        sub_vert_indices.add(v_i)
-    # Collect edges from these faces
-    f_len = len(face_verts)
-    for i in range(f_len):
-        e_key = frozenset({face_verts[i], face_verts[(i+1)%f_len]})
-        sub_edge_set.add(e_key)
-
-sub_vert_indices = list(sub_vert_indices)
-old_to_new_vert = {v_i: i for i, v_i in enumerate(sub_vert_indices)}
-
-sub_vert_coords = [bm.verts[v_i].co.copy() for v_i in sub_vert_indices]
-
-sub_faces = []
-for f_verts in selected_faces_indices:
-    sub_faces.append([old_to_new_vert[v_i] for v_i in f_verts])
-
-# Build adjacency
-vert_faces_map = [[] for _ in sub_vert_coords]
-for f_i, f_verts in enumerate(sub_faces):
-    for v_i in f_verts:
-        vert_faces_map[v_i].append(f_i)
-
-edge_map = {}
-for f_i, f_verts in enumerate(sub_faces):
-    f_len = len(f_verts)
-    for i in range(f_len):
-        key = frozenset({f_verts[i], f_verts[(i+1)%f_len]})
-        if key not in edge_map:
-            edge_map[key] = []
-        edge_map[key].append(f_i)
+sub_vert_indices, sub_face_offsets, sub_face_indices = extract_faces(mesh_data.face_offsets,
+                                                                     mesh_data.face_indices, selected)
+sub_vert_coords = mesh_data.positions[sub_vert_indices]
 
-original_edges_data = []
-vert_edges_map = [[] for _ in sub_vert_coords]
-for ei, (vs, flist) in enumerate(edge_map.items()):
-    vs_l = list(vs)
-    v1_i, v2_i = vs_l
-    original_edges_data.append((v1_i, v2_i, flist))
-    vert_edges_map[v1_i].append(ei)
-    vert_edges_map[v2_i].append(ei)
+# Stencils of all levels composed into one operator; the original vertices keep their positions
+# (identity rows), so they stay the first vertices of every level
+topologies = level_topologies(sub_face_offsets, sub_face_indices, len(sub_vert_indices), LEVELS)
+operator = SubdivisionOperator.from_topologies(topologies, keep_vertices=True)
+new_points = operator.apply(sub_vert_coords)[len(sub_vert_indices):]
 
-# Catmull-Clark on sub-mesh
-# Face points
-face_points = []
-for f_i, f_verts in enumerate(sub_faces):
-    coords = [sub_vert_coords[v_i] for v_i in f_verts]
-    fp = sum(coords, Vector()) / len(coords)
-    face_points.append(fp)
+# Subdivided faces, indexing the sub-mesh vertices, then the new face and edge points of every level
+new_faces = operator.face_indices.reshape(-1, 4)
 
-# Edge points
-edge_points = []
-for (v1_i, v2_i, f_list) in original_edges_data:
-    v1_co = sub_vert_coords[v1_i]
-    v2_co = sub_vert_coords[v2_i]
-    if is_hole_edge(f_list):
-        ep = midpoint(v1_co, v2_co)
-    else:
-        if len(f_list) == 2:
-            F1, F2 = f_list
-            ep = (v1_co + v2_co + face_points[F1] + face_points[F2]) / 4.0
-        elif len(f_list) == 1:
-            F = f_list[0]
-            ep = (v1_co + v2_co + face_points[F]) / 3.0
-        else:
-            ep = midpoint(v1_co, v2_co)
-    edge_points.append(ep)
-
-# Vertex points
-new_vertex_positions = []
-for vi, P in enumerate(sub_vert_coords):
-    adj_faces = vert_faces_map[vi]
-    adj_edges = vert_edges_map[vi]
-    n = len(adj_faces)
-
-    if is_hole_vertex(len(adj_edges), len(adj_faces)):
-        avg_midpoints = Vector((0,0,0))
-        hole_edge_count = 0
-        for ei in adj_edges:
-            v1_i, v2_i, flist = original_edges_data[ei]
-            if is_hole_edge(flist):
-                m = midpoint(sub_vert_coords[v1_i], sub_vert_coords[v2_i])
-                avg_midpoints += m
-                hole_edge_count += 1
-        if hole_edge_count > 0:
-            V_new = (avg_midpoints + P) / (hole_edge_count + 1)
-        else:
-            V_new = P
-    else:
-        if n == 0:
-            V_new = P
-        else:
-            F_avg = sum((face_points[f_i] for f_i in adj_faces), Vector()) / n
-            edge_midpoints = []
-            for ei in adj_edges:
-                v1_i, v2_i, _ = original_edges_data[ei]
-                edge_midpoints.append(midpoint(sub_vert_coords[v1_i], sub_vert_coords[v2_i]))
-            R_avg = sum(edge_midpoints, Vector()) / len(edge_midpoints)
-            V_new = (F_avg + 2*R_avg + (n-3)*P) / n
-
-    new_vertex_positions.append(V_new)
-
-# Reconstruct subdivided faces
-edge_lookup = {}
-for ei, (v1_i, v2_i, flist) in enumerate(original_edges_data):
-    edge_lookup[frozenset({v1_i,v2_i})] = ei
-
-subdiv_verts = new_vertex_positions + face_points + edge_points
-v_count_original = len(new_vertex_positions)
-v_count_face = len(face_points)
-v_count_edge = len(edge_points)
-
-new_faces = []
-for fi, f_verts in enumerate(sub_faces):
-    Fv_i = v_count_original + fi
-    f_len = len(f_verts)
-    for i in range(f_len):
-        v_curr_i = f_verts[i]
-        v_next_i = f_verts[(i+1)%f_len]
-        v_prev_i = f_verts[(i-1)%f_len]
-
-        ei_current = edge_lookup[frozenset({v_curr_i, v_next_i})]
-        ei_prev = edge_lookup[frozenset({v_prev_i, v_curr_i})]
-
-        EP_current_i = v_count_original + v_count_face + ei_current
-        EP_prev_i = v_count_original + v_count_face + ei_prev
-
-        new_faces.append([v_curr_i, EP_current_i, Fv_i, EP_prev_i])
+# Neighbor faces with the new points of the edges they share with the selection, indexing the mesh vertices,
+# then the new points
+neighbor_faces, neighbor_offsets, neighbor_indices, _ = stitch_neighbors(
+    mesh_data.face_offsets, mesh_data.face_indices, mesh_data.num_vertices, selected, sub_vert_indices, topologies)
 
 # Replace original selected faces with subdivided faces
-bm.clear()
+bm = bmesh.new()
 bm.from_mesh(mesh)
 bm.verts.ensure_lookup_table()
 bm.edges.ensure_lookup_table()
 bm.faces.ensure_lookup_table()
+bm_faces = bm.faces[:]
 
 # Remove selected faces
-for f in bm.faces[:]:
-    if f.select:
-        bm.faces.remove(f)
-
-bm.verts.ensure_lookup_table()
-# Map subdiv mesh indices to BMVert
-subdiv_to_bmvert = {}
-
-# Original vertices (reuse)
-for i, old_vi in enumerate(sub_vert_indices):
-    subdiv_to_bmvert[i] = bm.verts[old_vi]
-
-# Create new BMVerts for face points
-for i in range(v_count_face):
-    co = face_points[i]
-    subdiv_to_bmvert[v_count_original + i] = bm.verts.new(co)
+for f in np.flatnonzero(selected).tolist():
+    bm.faces.remove(bm_faces[f])
 
-# Create new BMVerts for edge points
-for i in range(v_count_edge):
-    co = edge_points[i]
-    subdiv_to_bmvert[v_count_original + v_count_face + i] = bm.verts.new(co)
+# Mesh vertices, then new BMVerts for the new points
+bm_verts = bm.verts[:] + [bm.verts.new(co) for co in new_points.tolist()]
+# Map subdiv mesh indices to BMVert: original vertices (reused), then the new points
+subdiv_to_bmvert = [bm_verts[old_vi] for old_vi in sub_vert_indices.tolist()]
+subdiv_to_bmvert += bm_verts[mesh_data.num_vertices:]
 
 bm.verts.index_update()
 # Create new faces
-for nf in new_faces:
-    face_verts = [subdiv_to_bmvert[idx] for idx in nf]
-    bm.faces.new(face_verts)
+for nf in new_faces.tolist():
+    bm.faces.new([subdiv_to_bmvert[idx] for idx in nf])
+
+# Replace the neighbor faces by their split version
+for f, start, end in zip(neighbor_faces.tolist(), neighbor_offsets[:-1].tolist(), neighbor_offsets[1:].tolist()):
+    old_face = bm_faces[f]
+    face = bm.faces.new([bm_verts[idx] for idx in neighbor_indices[start:end].tolist()])
+    face.material_index, face.smooth = old_face.material_index, old_face.smooth
+    bm.faces.remove(old_face)
 
 bm.faces.index_update()
 bm.verts.index_update()
 bm.edges.index_update()
 
-# bm.to_mesh(mesh)
-# mesh.update()
-
 # Delete the unconnected edges
-bpy.ops.object.mode_set(mode='OBJECT')
-
-# Ensure lookup tables are up-to-date
 bm.verts.ensure_lookup_table()
 bm.edges.ensure_lookup_table()
 bm.faces.ensure_lookup_table()
@@ -262,4 +145,4 @@ bm.free()
 bpy.ops.object.mode_set(mode='EDIT')
 
 print("Unconnected edges removed")
-print("Partial Catmull-Clark subdivision complete (geometry-only)")
+print("Partial Catmull-Clark subdivision complete (geometry-only)")
\ No newline at end of file
@@ -0,0 +1,633 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: subdivision_engine.py
+description: Array-based Catmull-Clark subdivision on the face CSR of MeshData, shared by the catmull-clark-subdiv-*.py scripts.
+The combinatorics of one step are computed once with NumPy: the edges are the unique (min, max) vertex pairs of the
+face corners (np.unique inverse, numbered in order of first occurrence like the original edge dict), and the
+face, edge and vertex points are segmented reductions and scatter-adds over the corners and edges.
+Any per-vertex values (positions, colors, ...) go through the same rules:
+    face point   = mean of the face's vertices
+    edge point   = (v1 + v2 + f1 + f2) / 4 for an edge with two faces, the midpoint otherwise (holes, non-manifold)
+    vertex point = (F + 2R + (n - 3) P) / n, with F the mean of the adjacent face points, R the mean of the adjacent
+                   edge midpoints and n the number of adjacent faces; on a hole boundary (edge count != face count)
+                   the mean of P and the midpoints of its boundary edges
+The subdivided mesh lists the vertex points first, then the face points, then the edge points, and every face
+corner becomes the quad (vertex, next edge point, face point, previous edge point).
+CatmullClarkTopology.stencil emits the same rules as a sparse (new vertices x old vertices) matrix S. As the
+topology of an animated mesh never changes, S and the output faces are cached on disk by a hash of the topology
+(SubdivisionOperator), and every frame (or color / weight layer) is then subdivided by one sparse product.
+CORNER domain values (UVs, corner colors) are face-varying: CatmullClarkTopology.corner_stencil interpolates them
+linearly inside every face (corner, edge midpoints, face mean), so seams are kept. apply_attributes stacks all the
+attributes of a domain column-wise and subdivides them with one product.
+For several levels the stencils of all levels are composed into one operator from the base mesh, built from the
+topology of every level only, so evaluating it never allocates the geometry of the intermediate levels.
+Partial (selected or adaptive) subdivision keeps the region's vertices in place; face_scores / select_faces pick the
+faces from a per-face metric, and stitch_neighbors inserts the edge points of the region's border into the faces
+around it, so the refined region stays conforming with the rest of the mesh (no T-junctions or cracks).
+This module does not import bpy.
+
+how to use:
+    Imported by catmull-clark-subdiv-all.py, catmull-clark-subdiv-all-geo.py,
+    catmull-clark-subdiv-partial.py and catmull-clark-subdiv-partial-geo.py
+'''
+
+import os
+import hashlib
+import numpy as np
+
+from mesh_data import MeshData
+from sparse_matrix import CSRMatrix
+
+# Color of vertices without a color (no corners of a CORNER domain attribute)
+DEFAULT_COLOR = (1.0, 1.0, 1.0, 1.0)
+# Per-face metrics of face_scores
+ADAPTIVE_METRICS = ("angle", "length", "color")
+# Layout of the operator files; part of the cache key, so files of an older layout are rebuilt
+OPERATOR_FORMAT = 2
+
+
+def _edge_keys(first, second, num_vertices):
+    """Order-independent int64 key of every (first, second) vertex pair."""
+    return np.minimum(first, second) * num_vertices + np.maximum(first, second)
+
+
+def _scatter_add(index, values, size):
+    """Sum the rows of a (M, C) array into size bins with one bincount per column."""
+    result = np.empty((size, values.shape[1]))
+    for column in range(values.shape[1]):
+        result[:, column] = np.bincount(index, weights=values[:, column], minlength=size)
+    return result
+
+
+class CatmullClarkTopology:
+    """
+    Combinatorics of one Catmull-Clark step of a polygon mesh.
+
+    face_offsets, face_indices: Face CSR of the mesh (see MeshData).
+    num_vertices: Number of vertices N.
+    """
+    def __init__(self, face_offsets, face_indices, num_vertices):
+        self.face_offsets = np.asarray(face_offsets, dtype=np.int64)
+        self.face_indices = np.asarray(face_indices, dtype=np.int64)
+        self.num_vertices = int(num_vertices)
+        self.num_faces = len(self.face_offsets) - 1
+        num_corners = len(self.face_indices)
+
+        sizes = np.diff(self.face_offsets)
+        self.corner_faces = np.repeat(np.arange(self.num_faces, dtype=np.int64), sizes)
+        self.corner_next = np.arange(1, num_corners + 1, dtype=np.int64)
+        self.corner_next[self.face_offsets[1:] - 1] = self.face_offsets[:-1]
+        self.corner_prev = np.empty(num_corners, dtype=np.int64)
+        self.corner_prev[self.corner_next] = np.arange(num_corners)
+
+        # Edge (corner -> next corner) of every corner, numbered in order of first occurrence
+        first_vertex, second_vertex = self.face_indices, self.face_indices[self.corner_next]
+        keys = _edge_keys(first_vertex, second_vertex, self.num_vertices)
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty(len(first), dtype=np.int64)
+        rank[order] = np.arange(len(first))
+        self.corner_edges = rank[inverse.ravel()]
+        self.edges = np.stack([first_vertex[first[order]], second_vertex[first[order]]], axis=1)
+        self.num_edges = len(self.edges)
+
+        self.edge_face_counts = np.bincount(self.corner_edges, minlength=self.num_edges)
+        self.vertex_face_counts = np.bincount(self.face_indices, minlength=self.num_vertices)
+        self.vertex_edge_counts = np.bincount(self.edges.ravel(), minlength=self.num_vertices)
+        self.hole_edges = self.edge_face_counts == 1
+        self.hole_vertices = self.vertex_edge_counts != self.vertex_face_counts
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        return cls(mesh.face_offsets, mesh.face_indices, mesh.num_vertices)
+
+    @property
+    def num_subdivided_vertices(self):
+        return self.num_vertices + self.num_faces + self.num_edges
+
+    def face_points(self, values):
+        """(F, C) mean of the values of every face's vertices."""
+        values = np.asarray(values, dtype=np.float64).reshape(self.num_vertices, -1)
+        if self.num_faces == 0:
+            return np.empty((0, values.shape[1]))
+        sums = np.add.reduceat(values[self.face_indices], self.face_offsets[:-1], axis=0)
+        return sums / np.diff(self.face_offsets)[:, None]
+
+    def edge_points(self, values, face_points):
+        """(E, C) edge points: with the two face points for edges of two faces, the midpoint otherwise."""
+        values = np.asarray(values, dtype=np.float64).reshape(self.num_vertices, -1)
+        ends = values[self.edges[:, 0]] + values[self.edges[:, 1]]
+        face_sums = _scatter_add(self.corner_edges, face_points[self.corner_faces], self.num_edges)
+        two_faces = (self.edge_face_counts == 2)[:, None]
+        return np.where(two_faces, (ends + face_sums) / 4.0, ends / 2.0)
+
+    def vertex_points(self, values, face_points):
+        """(N, C) moved original vertices."""
+        values = np.asarray(values, dtype=np.float64).reshape(self.num_vertices, -1)
+        midpoints = (values[self.edges[:, 0]] + values[self.edges[:, 1]]) / 2.0
+        endpoints = self.edges.T.ravel()
+        n = self.vertex_face_counts[:, None].astype(np.float64)
+
+        # Hole boundary: mean of the vertex and the midpoints of its hole edges
+        hole_pairs = np.tile(self.hole_edges, 2)
+        hole_sums = _scatter_add(endpoints[hole_pairs], np.tile(midpoints, (2, 1))[hole_pairs], self.num_vertices)
+        hole_counts = np.bincount(endpoints[hole_pairs], minlength=self.num_vertices)[:, None]
+        hole_points = (hole_sums + values) / (hole_counts + 1)
+
+        # Interior: (F + 2R + (n - 3) P) / n
+        face_average = _scatter_add(self.face_indices, face_points[self.corner_faces], self.num_vertices) \
+            / np.maximum(n, 1)
+        edge_average = _scatter_add(endpoints, np.tile(midpoints, (2, 1)), self.num_vertices) \
+            / np.maximum(self.vertex_edge_counts[:, None], 1)
+        interior_points = (face_average + 2 * edge_average + (n - 3) * values) / np.maximum(n, 1)
+
+        points = np.where(self.hole_vertices[:, None], hole_points, interior_points)
+        # Isolated vertices stay where they are
+        return np.where((n == 0) & ~self.hole_vertices[:, None], values, points)
+
+    def subdivide_values(self, values):
+        """
+        Per-vertex values of the subdivided mesh: vertex points, face points, then edge points.
+        values: (N,) or (N, C) per-vertex values, e.g. positions or colors.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.reshape(self.num_vertices, -1)
+        face_points = self.face_points(flat)
+        result = np.concatenate([self.vertex_points(flat, face_points), face_points,
+                                 self.edge_points(flat, face_points)])
+        return result.reshape((-1,) + values.shape[1:])
+
+    def _face_entries(self, corners, scales):
+        """
+        Stencil entries of the face points of the faces of the given corners, times scales:
+        (position in corners, face corner, scale / face size) for every corner of each face.
+        """
+        faces = self.corner_faces[corners]
+        sizes = np.diff(self.face_offsets)[faces]
+        owners = np.repeat(np.arange(len(corners)), sizes)
+        face_corners = np.repeat(self.face_offsets[faces] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        return owners, face_corners, np.repeat(scales / sizes, sizes)
+
+    def stencil(self, keep_vertices=False):
+        """
+        The subdivision rules as a sparse (N + F + E, N) matrix S: subdivide_values(values) == S @ values.
+        Rows are the vertex points, the face points and the edge points.
+        keep_vertices: Identity rows for the original vertices, which stay in place (partial subdivision).
+        """
+        n = self.vertex_face_counts.astype(np.float64)
+        vertices = np.arange(self.num_vertices)
+        edge_base = self.num_vertices + self.num_faces
+        rows, cols, values = [], [], []
+
+        # Face points: mean of the face's vertices
+        first_corners = self.face_offsets[:-1]
+        owners, face_corners, weights = self._face_entries(first_corners, np.ones(self.num_faces))
+        rows.append(self.num_vertices + owners)
+        cols.append(self.face_indices[face_corners])
+        values.append(weights)
+
+        # Edge points: ends with 1/4 and both face points with 1/4 on edges of two faces, midpoints otherwise
+        two_faces = self.edge_face_counts == 2
+        end_weight = np.where(two_faces, 0.25, 0.5)
+        for end in range(2):
+            rows.append(edge_base + np.arange(self.num_edges))
+            cols.append(self.edges[:, end])
+            values.append(end_weight)
+        corners = np.flatnonzero(two_faces[self.corner_edges])
+        owners, face_corners, weights = self._face_entries(corners, np.full(len(corners), 0.25))
+        rows.append(edge_base + self.corner_edges[corners][owners])
+        cols.append(self.face_indices[face_corners])
+        values.append(weights)
+
+        if keep_vertices:
+            rows.append(vertices)
+            cols.append(vertices)
+            values.append(np.ones(self.num_vertices))
+            return CSRMatrix.from_coo(np.concatenate(rows), np.concatenate(cols), np.concatenate(values),
+                                      (self.num_subdivided_vertices, self.num_vertices), sum_duplicates=True)
+
+        # Vertex points
+        interior = (n > 0) & ~self.hole_vertices
+        hole_counts = np.bincount(self.edges[self.hole_edges].ravel(), minlength=self.num_vertices)
+        rows.append(vertices)
+        cols.append(vertices)
+        values.append(np.where(self.hole_vertices, 1.0 / (hole_counts + 1),
+                               np.where(interior, (n - 3) / np.maximum(n, 1), 1.0)))
+
+        # Hole boundary: the midpoints of the hole edges, 1 / (2 (h + 1)) for both ends
+        for end in range(2):
+            for other in range(2):
+                vertex = self.edges[:, end]
+                use = self.hole_edges & self.hole_vertices[vertex]
+                rows.append(vertex[use])
+                cols.append(self.edges[use, other])
+                values.append(0.5 / (hole_counts[vertex[use]] + 1))
+
+        # Interior: F / n with F the mean of the adjacent face points, and 2 R / n with R the mean edge midpoint
+        corners = np.flatnonzero(interior[self.face_indices])
+        corner_vertices = self.face_indices[corners]
+        owners, face_corners, weights = self._face_entries(corners, 1.0 / n[corner_vertices] ** 2)
+        rows.append(corner_vertices[owners])
+        cols.append(self.face_indices[face_corners])
+        values.append(weights)
+        for end in range(2):
+            for other in range(2):
+                vertex = self.edges[:, end]
+                use = interior[vertex]
+                rows.append(vertex[use])
+                cols.append(self.edges[use, other])
+                values.append(1.0 / (n[vertex[use]] * self.vertex_edge_counts[vertex[use]]))
+
+        return CSRMatrix.from_coo(np.concatenate(rows), np.concatenate(cols), np.concatenate(values),
+                                  (self.num_subdivided_vertices, self.num_vertices), sum_duplicates=True)
+
+    def corner_stencil(self):
+        """
+        Face-varying linear rules of CORNER domain values as a sparse (4L, L) matrix: the quad of corner c (see quads)
+        gets the value of c, its midpoint with the next corner, the mean of the face's corners and its midpoint with
+        the previous corner. Only corners of the same face are mixed, so seams between faces are kept.
+        """
+        num_corners = len(self.face_indices)
+        corners = np.arange(num_corners)
+        owners, face_corners, weights = self._face_entries(corners, np.ones(num_corners))
+        half = np.full(num_corners, 0.5)
+        rows = [4 * corners, 4 * corners + 1, 4 * corners + 1, 4 * owners + 2, 4 * corners + 3, 4 * corners + 3]
+        cols = [corners, corners, self.corner_next, face_corners, corners, self.corner_prev]
+        values = [np.ones(num_corners), half, half, weights, half, half]
+        return CSRMatrix.from_coo(np.concatenate(rows), np.concatenate(cols), np.concatenate(values),
+                                  (4 * num_corners, num_corners), sum_duplicates=True)
+
+    def quads(self):
+        """(L, 4) faces of the subdivided mesh, one quad per corner of the original faces."""
+        edge_base = self.num_vertices + self.num_faces
+        return np.stack([self.face_indices,
+                         edge_base + self.corner_edges,
+                         self.num_vertices + self.corner_faces,
+                         edge_base + self.corner_edges[self.corner_prev]], axis=1)
+
+    def edge_ids(self, first, second):
+        """Index of the edge of every (first, second) vertex pair (arrays of any shape)."""
+        keys = _edge_keys(self.edges[:, 0], self.edges[:, 1], self.num_vertices)
+        order = np.argsort(keys)
+        query = _edge_keys(np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64), self.num_vertices)
+        ids = order[np.clip(np.searchsorted(keys[order], query), 0, max(len(keys) - 1, 0))]
+        if len(keys) == 0 or not np.array_equal(keys[ids], query):
+            raise ValueError("Vertex pairs that are not edges of the mesh.")
+        return ids
+
+    def subdivided_edges(self):
+        """(2E + L, 2) edges of the subdivided mesh: both halves of every edge, then face point to edge point."""
+        edge_base = self.num_vertices + self.num_faces
+        edge_points = edge_base + np.arange(self.num_edges)
+        return np.concatenate([np.stack([self.edges[:, 0], edge_points], axis=1),
+                               np.stack([edge_points, self.edges[:, 1]], axis=1),
+                               np.stack([edge_base + self.corner_edges, self.num_vertices + self.corner_faces], axis=1)])
+
+
+def subdivide(mesh, levels=1):
+    """
+    Catmull-Clark subdivision of a MeshData (positions only), one level after the other.
+    Returns (subdivided MeshData, list of the topology of every level).
+    """
+    if levels < 1:
+        raise ValueError(f"levels must be at least 1, got {levels}.")
+    topologies = []
+    for _ in range(levels):
+        topology = CatmullClarkTopology.from_mesh(mesh)
+        quads = topology.quads()
+        mesh = MeshData(topology.subdivide_values(mesh.positions), np.arange(0, quads.size + 1, 4),
+                        quads.ravel(), topology.subdivided_edges())
+        topologies.append(topology)
+    return mesh, topologies
+
+
+class SubdivisionOperator:
+    """
+    One subdivision step precomputed for a fixed topology.
+
+    stencil: (M, N) CSRMatrix mapping per-vertex values of the base mesh to the subdivided mesh.
+    face_offsets, face_indices, edges: Topology of the subdivided mesh.
+    corner_stencil: (K, L) CSRMatrix mapping CORNER domain values of the base mesh to the subdivided mesh.
+    """
+    def __init__(self, stencil, face_offsets, face_indices, edges, corner_stencil):
+        self.stencil = stencil
+        self.corner_stencil = corner_stencil
+        self.face_offsets = np.asarray(face_offsets, dtype=np.int64)
+        self.face_indices = np.asarray(face_indices, dtype=np.int64)
+        self.edges = np.asarray(edges, dtype=np.int64)
+
+    @classmethod
+    def from_topology(cls, topology, keep_vertices=False):
+        quads = topology.quads()
+        return cls(topology.stencil(keep_vertices), np.arange(0, quads.size + 1, 4), quads.ravel(),
+                   topology.subdivided_edges(), topology.corner_stencil())
+
+    @classmethod
+    def from_topologies(cls, topologies, keep_vertices=False):
+        """Operator of several levels (see level_topologies): the stencils composed into S_levels @ ... @ S_1."""
+        operator = cls.from_topology(topologies[0], keep_vertices)
+        for topology in topologies[1:]:
+            step = cls.from_topology(topology, keep_vertices)
+            operator = cls(step.stencil @ operator.stencil, step.face_offsets, step.face_indices, step.edges,
+                           step.corner_stencil @ operator.corner_stencil)
+        return operator
+
+    @property
+    def num_vertices(self):
+        return self.stencil.shape[0]
+
+    def apply(self, values):
+        """Subdivide (N,) or (N, C) per-vertex values (positions of a frame, colors, weights) with one product."""
+        values = np.asarray(values, dtype=np.float64)
+        return self.stencil @ values
+
+    def apply_attributes(self, attributes, domains):
+        """
+        Subdivide named POINT and CORNER attributes (colors, UVs, weights, ...) with one product per domain.
+        attributes: name -> (N, ...) or (L, ...) array; domains: name -> domain (default 'POINT').
+        Returns name -> subdivided float64 array; attributes of other domains are left out.
+        """
+        result = {}
+        for domain, stencil in (('POINT', self.stencil), ('CORNER', self.corner_stencil)):
+            names = [name for name in attributes if domains.get(name, 'POINT') == domain]
+            if names:
+                stacked, layout = stack_attributes([attributes[name] for name in names])
+                result.update(zip(names, unstack_attributes(stencil @ stacked, layout)))
+        return result
+
+    def mesh(self, positions, attributes=None, attribute_domains=None):
+        """The subdivided MeshData of the base positions, with the POINT and CORNER attributes subdivided too."""
+        attribute_domains = attribute_domains or {}
+        subdivided = self.apply_attributes(attributes or {}, attribute_domains)
+        return MeshData(self.apply(positions), self.face_offsets, self.face_indices, self.edges, subdivided,
+                        {name: attribute_domains.get(name, 'POINT') for name in subdivided})
+
+    def save(self, filepath):
+        arrays = {}
+        for prefix, matrix in (("", self.stencil), ("corner_", self.corner_stencil)):
+            arrays.update({prefix + "indptr": matrix.indptr, prefix + "indices": matrix.indices,
+                           prefix + "data": matrix.data, prefix + "shape": np.asarray(matrix.shape)})
+        np.savez(filepath, face_offsets=self.face_offsets, face_indices=self.face_indices, edges=self.edges,
+                 **arrays)
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as data:
+            stencil, corner_stencil = [CSRMatrix(data[prefix + "indptr"], data[prefix + "indices"],
+                                                 data[prefix + "data"], tuple(data[prefix + "shape"]))
+                                       for prefix in ("", "corner_")]
+            return cls(stencil, data["face_offsets"], data["face_indices"], data["edges"], corner_stencil)
+
+
+def level_topologies(face_offsets, face_indices, num_vertices, levels=1):
+    """Topology of every level, each built from the quads of the previous one (no geometry)."""
+    if levels < 1:
+        raise ValueError(f"levels must be at least 1, got {levels}.")
+    topologies = [CatmullClarkTopology(face_offsets, face_indices, num_vertices)]
+    for _ in range(levels - 1):
+        quads = topologies[-1].quads()
+        topologies.append(CatmullClarkTopology(np.arange(0, quads.size + 1, 4), quads.ravel(),
+                                               topologies[-1].num_subdivided_vertices))
+    return topologies
+
+
+def build_operator(face_offsets, face_indices, num_vertices, levels=1, keep_vertices=False):
+    """
+    Subdivision operator from the base mesh to the given level.
+    The topology of every level is built once from the quads of the previous one (no geometry), and the
+    stencils are composed into a single matrix S_levels @ ... @ S_1.
+    keep_vertices: Keep the vertices of every level in place (see CatmullClarkTopology.stencil); the base
+                   vertices are then the first rows of the operator at every level.
+    """
+    return SubdivisionOperator.from_topologies(level_topologies(face_offsets, face_indices, num_vertices, levels),
+                                               keep_vertices)
+
+
+def topology_key(face_offsets, face_indices, num_vertices, levels=1, keep_vertices=False):
+    """SHA-1 of the face topology and the options, the only things the stencils depend on."""
+    digest = hashlib.sha1()
+    for array in (face_offsets, face_indices):
+        array = np.ascontiguousarray(array, dtype=np.int64)
+        digest.update(f"{array.shape}".encode())
+        digest.update(array.tobytes())
+    digest.update(repr((OPERATOR_FORMAT, int(num_vertices), int(levels), bool(keep_vertices))).encode())
+    return digest.hexdigest()
+
+
+def load_or_build_operator(cache_dir, face_offsets, face_indices, num_vertices, levels=1, keep_vertices=False):
+    """
+    Return the subdivision operator of a topology from cache_dir, building and storing it on a cache miss.
+    Returns (operator, cached) where cached tells whether it was loaded from disk.
+    """
+    key = topology_key(face_offsets, face_indices, num_vertices, levels, keep_vertices)
+    cache_path = os.path.join(cache_dir, f"subdiv_{key}.npz")
+    if os.path.exists(cache_path):
+        return SubdivisionOperator.load(cache_path), True
+
+    operator = build_operator(face_offsets, face_indices, num_vertices, levels, keep_vertices)
+    os.makedirs(cache_dir, exist_ok=True)
+    operator.save(cache_path)
+    return operator, False
+
+
+def stack_attributes(arrays):
+    """
+    Stack (R,) or (R, ...) arrays column-wise into one (R, C) float64 array, so they go through a stencil together.
+    Returns (stacked, layout); unstack_attributes(stacked rows, layout) splits them again.
+    """
+    arrays = [np.asarray(array, dtype=np.float64) for array in arrays]
+    layout = [array.shape[1:] for array in arrays]
+    return np.concatenate([array.reshape(len(array), -1) for array in arrays], axis=1), layout
+
+
+def unstack_attributes(stacked, layout):
+    """Split a (R, C) array of stack_attributes back into (R, ...) arrays."""
+    bounds = np.cumsum([int(np.prod(shape)) for shape in layout])[:-1]
+    return [part.reshape((len(stacked),) + shape) for part, shape in zip(np.split(stacked, bounds, axis=1), layout)]
+
+
+def average_corners(face_indices, corner_values, num_vertices, default=DEFAULT_COLOR):
+    """Per-vertex mean of CORNER domain values; vertices without corners get default."""
+    corner_values = np.asarray(corner_values, dtype=np.float64).reshape(len(face_indices), -1)
+    counts = np.bincount(face_indices, minlength=num_vertices)[:, None]
+    sums = _scatter_add(face_indices, corner_values, num_vertices)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.asarray(default, dtype=np.float64))
+
+
+def extract_faces(face_offsets, face_indices, face_mask):
+    """
+    Sub-mesh made of the faces in face_mask.
+    Returns ((M,) original index of every sub-mesh vertex, sub-mesh face_offsets, sub-mesh face_indices).
+    """
+    face_offsets = np.asarray(face_offsets, dtype=np.int64)
+    sizes = np.diff(face_offsets)[face_mask]
+    corner_mask = np.repeat(np.asarray(face_mask, dtype=bool), np.diff(face_offsets))
+    corners = np.asarray(face_indices, dtype=np.int64)[corner_mask]
+    vertices, local_indices = np.unique(corners, return_inverse=True)
+    local_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=local_offsets[1:])
+    return vertices, local_offsets, local_indices.ravel()
+
+
+def face_scores(mesh, metric, colors=None):
+    """
+    (F,) refinement score of every face of a MeshData; the higher, the more the face needs subdividing.
+    metric: "angle": largest dihedral angle (radians) to the faces across its edges, a curvature estimate
+            "length": longest edge of the face
+            "color": variance of the (N, C) per-vertex colors over the face's vertices, summed over the channels
+    """
+    if metric not in ADAPTIVE_METRICS:
+        raise ValueError(f"metric must be one of {ADAPTIVE_METRICS}, got {metric!r}.")
+    starts = mesh.face_offsets[:-1]
+    if metric == "length":
+        lengths = np.linalg.norm(mesh.positions[mesh.face_indices[mesh.corner_next()]]
+                                 - mesh.positions[mesh.face_indices], axis=1)
+        return np.maximum.reduceat(lengths, starts)
+
+    if metric == "color":
+        if colors is None:
+            raise ValueError("The color metric needs per-vertex colors.")
+        values = np.asarray(colors, dtype=np.float64).reshape(mesh.num_vertices, -1)[mesh.face_indices]
+        sizes = mesh.face_sizes[:, None]
+        means = np.add.reduceat(values, starts, axis=0) / sizes
+        squares = (values - means[mesh.corner_faces()]) ** 2
+        return (np.add.reduceat(squares, starts, axis=0) / sizes).sum(axis=1)
+
+    # Angle between the normals of the two faces of every manifold edge; 0 on boundaries
+    topology = CatmullClarkTopology.from_mesh(mesh)
+    order = np.argsort(topology.corner_edges, kind="stable")
+    edge_starts = np.zeros(topology.num_edges + 1, dtype=np.int64)
+    np.cumsum(topology.edge_face_counts, out=edge_starts[1:])
+    two_faces = np.flatnonzero(topology.edge_face_counts == 2)
+    normals = mesh.face_normals()
+    first = topology.corner_faces[order[edge_starts[two_faces]]]
+    second = topology.corner_faces[order[edge_starts[two_faces] + 1]]
+    edge_angles = np.zeros(topology.num_edges)
+    edge_angles[two_faces] = np.arccos(np.clip(np.sum(normals[first] * normals[second], axis=1), -1.0, 1.0))
+    return np.maximum.reduceat(edge_angles[topology.corner_edges], starts)
+
+
+def select_faces(scores, threshold=None, fraction=None):
+    """
+    Mask of the faces to subdivide: the scores above threshold, or else the top fraction of the faces.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if threshold is not None:
+        return scores > threshold
+    if fraction is None or not 0.0 < fraction <= 1.0:
+        raise ValueError(f"fraction must be in (0, 1] when no threshold is given, got {fraction}.")
+    count = int(np.ceil(fraction * len(scores)))
+    mask = np.zeros(len(scores), dtype=bool)
+    mask[np.argpartition(-scores, count - 1)[:count]] = True
+    return mask
+
+
+def edge_chains(topologies, edges):
+    """
+    Vertices along edges of the base mesh after the levels of topologies (vertices kept in place, so the
+    vertices of every level stay valid at the next one).
+    Returns a (K, 2 ** levels + 1) array from edges[:, 0] to edges[:, 1] through the inserted edge points.
+    """
+    chains = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    for topology in topologies:
+        points = topology.num_vertices + topology.num_faces + topology.edge_ids(chains[:, :-1], chains[:, 1:])
+        split = np.empty((len(chains), 2 * chains.shape[1] - 1), dtype=np.int64)
+        split[:, ::2] = chains
+        split[:, 1::2] = points
+        chains = split
+    return chains
+
+
+def insert_edge_points(face_offsets, face_indices, edges, chains):
+    """
+    Faces with the inner vertices of chains inserted along their edges: the edge (a, b) of every (a, b) row of
+    edges becomes the path chains[k] (reversed when the face runs from b to a); other edges are unchanged.
+    Returns the new (face_offsets, face_indices, corner stencil); the (L', L) corner stencil maps CORNER domain
+    values to the new corners, linear along the split edges.
+    """
+    face_offsets = np.asarray(face_offsets, dtype=np.int64)
+    face_indices = np.asarray(face_indices, dtype=np.int64)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    inner = np.asarray(chains, dtype=np.int64)[:, 1:-1]
+    if len(face_indices) == 0 or len(edges) == 0 or inner.shape[1] == 0:
+        return face_offsets, face_indices, CSRMatrix.identity(len(face_indices))
+
+    num_vertices = int(max(face_indices.max(), edges.max())) + 1
+    following = np.arange(1, len(face_indices) + 1, dtype=np.int64)
+    following[face_offsets[1:] - 1] = face_offsets[:-1]
+    keys = _edge_keys(edges[:, 0], edges[:, 1], num_vertices)
+    order = np.argsort(keys)
+    corner_keys = _edge_keys(face_indices, face_indices[following], num_vertices)
+    slots = order[np.clip(np.searchsorted(keys[order], corner_keys), 0, len(keys) - 1)]
+    split = np.flatnonzero(keys[slots] == corner_keys)
+    slots = slots[split]
+
+    counts = np.ones(len(face_indices), dtype=np.int64)
+    counts[split] += inner.shape[1]
+    starts = np.cumsum(counts) - counts
+    result = np.empty(counts.sum(), dtype=np.int64)
+    result[starts] = face_indices
+    forward = (face_indices[split] == edges[slots, 0])[:, None]
+    result[starts[split][:, None] + 1 + np.arange(inner.shape[1])] = np.where(forward, inner[slots],
+                                                                              inner[slots, ::-1])
+    offsets = np.zeros(len(face_offsets), dtype=np.int64)
+    np.cumsum(np.add.reduceat(counts, face_offsets[:-1]), out=offsets[1:])
+
+    # Kept corners copy their value; inserted corner k of a split corner is at (k + 1) / segments to the next one
+    segments = inner.shape[1] + 1
+    inserted = (starts[split][:, None] + 1 + np.arange(inner.shape[1])).ravel()
+    t = np.tile(np.arange(1, segments) / segments, len(split))
+    rows = np.concatenate([starts, inserted, inserted])
+    cols = np.concatenate([np.arange(len(face_indices)), np.repeat(split, segments - 1),
+                           np.repeat(following[split], segments - 1)])
+    values = np.concatenate([np.ones(len(face_indices)), 1.0 - t, t])
+    corner_stencil = CSRMatrix.from_coo(rows, cols, values, (len(result), len(face_indices)), sum_duplicates=True)
+    return offsets, result, corner_stencil
+
+
+def stitch_neighbors(face_offsets, face_indices, num_vertices, face_mask, sub_vertices, topologies):
+    """
+    Keep a partially subdivided region conforming with the rest of the mesh: the faces outside face_mask that share
+    an edge with the region get the edge points that the subdivision inserted on that edge.
+    face_offsets, face_indices, num_vertices: Face CSR of the whole mesh and its number of vertices N.
+    face_mask, sub_vertices, topologies: The subdivided faces, the region's vertices (see extract_faces) and the
+                                         level topologies of the region (see level_topologies), vertices kept.
+    Returns (indices of the faces to replace, their new face_offsets, their new face_indices, corner stencil):
+    the face_indices index the N mesh vertices followed by the new vertices of the region in operator order, and
+    the corner stencil maps CORNER domain values of the whole mesh to the corners of the new faces.
+    """
+    face_offsets = np.asarray(face_offsets, dtype=np.int64)
+    face_indices = np.asarray(face_indices, dtype=np.int64)
+    sub_vertices = np.asarray(sub_vertices, dtype=np.int64)
+    base = topologies[0]
+
+    # Edges of the region used by the other faces
+    outside = np.repeat(~np.asarray(face_mask, dtype=bool), np.diff(face_offsets))
+    following = np.arange(1, len(face_indices) + 1, dtype=np.int64)
+    following[face_offsets[1:] - 1] = face_offsets[:-1]
+    corner_keys = _edge_keys(face_indices, face_indices[following], num_vertices)
+    region_edges = sub_vertices[base.edges]
+    shared = np.isin(_edge_keys(region_edges[:, 0], region_edges[:, 1], num_vertices), corner_keys[outside])
+
+    # Their chains, in mesh numbering: region vertex i is sub_vertices[i], new vertex j is N + j - M
+    chains = edge_chains(topologies, base.edges[shared])
+    mesh_index = np.concatenate([sub_vertices, num_vertices + np.arange(topologies[-1].num_subdivided_vertices
+                                                                        - base.num_vertices)])
+    edges = region_edges[shared]
+    shared_keys = _edge_keys(edges[:, 0], edges[:, 1], num_vertices)
+
+    # The other faces on these edges, with the chains inserted
+    sizes = np.diff(face_offsets)
+    corner_faces = np.repeat(np.arange(len(sizes)), sizes)
+    faces = np.unique(corner_faces[outside & np.isin(corner_keys, shared_keys)])
+    neighbor = np.zeros(len(sizes), dtype=bool)
+    neighbor[faces] = True
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum(sizes[faces], out=offsets[1:])
+    corners = np.flatnonzero(np.repeat(neighbor, sizes))
+    offsets, indices, stencil = insert_edge_points(offsets, face_indices[corners], edges, mesh_index[chains])
+    corner_stencil = CSRMatrix(stencil.indptr, corners[stencil.indices], stencil.data,
+                               (stencil.shape[0], len(face_indices)))
+    return faces, offsets, indices, corner_stencil
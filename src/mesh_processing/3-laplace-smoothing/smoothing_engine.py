@@ -0,0 +1,89 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: smoothing_engine.py
+description: Vectorized Laplace smoothing on MeshData.
+Every iteration moves all interior vertices at once towards the average of their neighbors (read from the
+previous iteration), using the vertex adjacency CSR of MeshData. Boundary and isolated vertices stay fixed.
+This module does not import bpy.
+
+how to use:
+    Imported by laplace-smoothing.py
+'''
+
+import numpy as np
+
+PRESERVATION_METHODS = ('none', 'centroid', 'local_volume', 'tangential')
+
+
+def neighbor_average(positions, offsets, neighbors):
+    """(N, 3) average position of the neighbors of every vertex (0 for isolated vertices)."""
+    degree = np.diff(offsets)
+    owner = np.repeat(np.arange(len(positions)), degree)
+    sums = np.empty((len(positions), 3))
+    for axis in range(3):
+        sums[:, axis] = np.bincount(owner, weights=positions[neighbors, axis], minlength=len(positions))
+    return sums / np.maximum(degree, 1)[:, None]
+
+
+def local_volume(positions, previous, offsets, neighbors):
+    """
+    Sum of the tetrahedral volumes formed by every vertex, each of its neighbors and the origin.
+
+    positions: (N, 3) positions used for the vertices themselves.
+    previous: (N, 3) positions used for the neighbors.
+    """
+    owner = np.repeat(np.arange(len(positions)), np.diff(offsets))
+    v1, v2 = positions[owner], previous[neighbors]
+    volumes = np.abs(np.sum(np.cross(v1, v2) * (v2 - v1), axis=1)) / 6.0
+    return np.bincount(owner, weights=volumes, minlength=len(positions))
+
+
+def laplace_smooth_positions(mesh, iterations=1, lambda_factor=0.5, preservation_method='none'):
+    """
+    Laplace smoothing of MeshData positions with optional volume preservation.
+
+    mesh: MeshData to smooth.
+    iterations: Number of smoothing iterations.
+    lambda_factor: Smoothing factor (0 < lambda_factor < 1).
+    preservation_method: Preservation method ('none', 'centroid', 'local_volume', 'tangential').
+    Returns the (N, 3) smoothed positions; the mesh is not modified.
+    """
+    if preservation_method not in PRESERVATION_METHODS:
+        raise ValueError(f"Unknown preservation method '{preservation_method}'.")
+
+    offsets, neighbors = mesh.vertex_adjacency()
+    # Boundary vertices and vertices without edges are skipped
+    movable = ~mesh.boundary_vertices() & (np.diff(offsets) > 0)
+    normals = mesh.vertex_normals() if preservation_method == 'tangential' else None
+    positions = mesh.positions.copy()
+
+    for _ in range(iterations):
+        # Neighbors are read from the positions of the previous iteration
+        previous = positions.copy()
+        smoothed = (1 - lambda_factor) * previous + lambda_factor * neighbor_average(previous, offsets, neighbors)
+
+        if preservation_method == 'centroid':
+            # Adjust for global centroid-based volume preservation
+            centroid = previous.mean(axis=0)
+            new_positions = smoothed + (previous - centroid) * (1 - lambda_factor) * 0.001
+        elif preservation_method == 'local_volume':
+            initial_volume = local_volume(previous, previous, offsets, neighbors)
+            new_volume = local_volume(smoothed, previous, offsets, neighbors)
+            ratio = np.where(new_volume > 0,
+                             np.minimum(1.0, new_volume / np.where(initial_volume > 0, initial_volume, 1.0)), 0.0)
+            # An invalid initial volume leaves the smoothing unchanged
+            ratio = np.where(initial_volume > 0, ratio, 1.0)
+            new_positions = previous + (smoothed - previous) * ratio[:, None]
+        elif preservation_method == 'tangential':
+            # Restrict movement to the tangential plane of the original normals
+            movement = smoothed - previous
+            tangential = movement - np.sum(movement * normals, axis=1, keepdims=True) * normals
+            new_positions = previous + 0.1 * tangential
+        else:
+            # No preservation, standard Laplace smoothing
+            new_positions = smoothed
+
+        positions[movable] = new_positions[movable]
+    return positions
@@ -0,0 +1,118 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: center-of-rotation-skinning.py
+description: Perform skinning with optimized Centers of Rotation (CoR) on a mesh object using an armature
+Run this script AFTER ASSIGNING WEIGHTS to the mesh object
+Each vertex rotates by its blended bone rotation around a precomputed rest-pose center of rotation,
+which avoids both the candy-wrapper collapse of LBS and the joint bulging of DQS.
+The centers are cached in CENTERS_CACHE_DIR and only recomputed when the mesh, the weights or SIGMA change.
+The rest pose is kept in the "rest_position" attribute, so running the script again does not compound the deformation.
+reference: Le and Hodgins, "Real-time Skeletal Skinning with Optimized Centers of Rotation", SIGGRAPH 2016
+
+how to use:
+    1. Open Blender file
+    2. Open the Python Console
+    3. Open the script file on the Python Console
+    4. *** Change OBJECT_NAME and ARMATURE_NAME in the script (set REBUILD_INFLUENCES after editing weights) ***
+    5. *** Set MODE: "pose" skins the current pose, "bake" skins every frame of the armature action into CACHE_PATH ***
+    6. Run the script (the first run precomputes the centers of rotation, which can take a while on dense meshes)
+'''
+
+import bpy
+import os
+import sys
+
+# Make the shared skinning engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "utils"))
+from skinning_engine import (read_rest_positions, read_rest_normals, write_positions, write_normals,
+                             build_palette, action_frames, bake_frames, attach_point_cache, stop_live_skinning)
+from influences import ensure_influences
+from center_of_rotation import read_triangles, load_or_compute_centers, center_of_rotation_skinning
+from point_cache import create_point_cache, create_normal_cache
+
+OBJECT_NAME = "jumpingjacks"
+ARMATURE_NAME = "metarig"
+
+# Number of strongest bones kept per vertex
+MAX_INFLUENCES = 4
+# Rebuild the influences stored on the mesh, e.g. after the weights were edited
+REBUILD_INFLUENCES = False
+
+# Width of the weight similarity kernel used to find the centers of rotation
+SIGMA = 0.1
+# Worker processes for the center precomputation; more than 1 splits the vertices over processes
+WORKERS = 1
+# Directory of the cached centers, one .npz file per mesh and weight fingerprint
+CENTERS_CACHE_DIR = "//skinning_cache"
+
+# Skin the rest normals too: custom split normals in pose mode, a "<cache>_normals.npy" file in bake mode
+SKIN_NORMALS = True
+
+# Mode: ["pose", "bake"]
+MODE = "pose"
+# Point cache written in bake mode and played back with a Mesh Cache modifier
+CACHE_PATH = "//skinning_cache/cor.pc2"
+
+# Access the objects
+obj = bpy.data.objects.get(OBJECT_NAME)
+armature = bpy.data.objects.get(ARMATURE_NAME)
+if not obj or not armature:
+    raise ValueError("Object or armature not found.")
+
+print(f"Using object: {OBJECT_NAME}, armature: {ARMATURE_NAME}")
+
+# Ensure we're in Object Mode
+bpy.ops.object.mode_set(mode='OBJECT')
+
+# Access the mesh data
+mesh = obj.data
+bone_names = [bone.name for bone in armature.pose.bones]
+rest_positions = read_rest_positions(mesh)
+rest_normals = read_rest_normals(mesh, rest_positions) if SKIN_NORMALS else None
+
+# Step 1: Read and normalize weights
+influences = ensure_influences(obj, bone_names, MAX_INFLUENCES, rebuild=REBUILD_INFLUENCES)
+indices, weights = influences.indices, influences.weights
+print(f"Weights normalized! ({influences.max_influences} influences per vertex)")
+
+# Step 2: Precompute the center of rotation of every vertex (or load it from the cache)
+centers, cached = load_or_compute_centers(bpy.path.abspath(CENTERS_CACHE_DIR), rest_positions, read_triangles(mesh),
+                                          indices, weights, sigma=SIGMA, workers=WORKERS)
+print("Centers of rotation loaded from cache!" if cached else "Centers of rotation computed and cached!")
+
+# Step 3: Perform skinning with the centers of rotation
+# Blended quaternion rotation around each center, and the centers moved with LBS
+def skin_pose(palette):
+    return center_of_rotation_skinning(rest_positions, centers, indices, weights, palette, rest_normals)
+
+stop_live_skinning(obj)
+
+if MODE == "pose":
+    positions, normals = skin_pose(build_palette(armature, bone_names))
+    write_positions(mesh, positions)
+    if normals is not None:
+        write_normals(mesh, normals)
+    print("Center of Rotation Skinning applied!")
+elif MODE == "bake":
+    frames = action_frames(armature)
+    cache_path = bpy.path.abspath(CACHE_PATH)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    cache = create_point_cache(cache_path, len(rest_positions), len(frames), start_frame=frames[0])
+    normals_cache = None
+    if SKIN_NORMALS:
+        normals_path = os.path.splitext(cache_path)[0] + "_normals.npy"
+        normals_cache = create_normal_cache(normals_path, len(rest_positions), len(frames))
+    bake_frames(bpy.context.scene, armature, bone_names, frames, skin_pose, cache, normals_cache)
+    del cache, normals_cache
+
+    # Keep the mesh in its rest pose; the Mesh Cache modifier plays the baked clip
+    write_positions(mesh, rest_positions)
+    attach_point_cache(obj, cache_path, frames[0])
+    print(f"Center of Rotation Skinning baked for frames {frames[0]}-{frames[-1]} to {cache_path}")
+else:
+    raise ValueError(f"Unknown MODE '{MODE}'.")
@@ -0,0 +1,225 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: center_of_rotation.py
+description: Skinning with optimized centers of rotation (CoR).
+Every vertex gets a rest-pose center of rotation p*, the area-weighted average of the triangle centroids
+whose skinning weights are similar to the vertex weights. At runtime the vertex is rotated by the blended
+bone quaternion R around p*, and p* itself is moved with linear blend skinning:
+    v' = R (v - p*) + LBS(p*)
+This keeps the volume of bent joints like DQS without its bulging artifacts.
+The O(N * T) center precomputation is vectorized per bone pair, split over vertex chunks in a process pool,
+and cached in a .npz file keyed by a fingerprint of the rest mesh, the influences and sigma.
+reference: Le and Hodgins, "Real-time Skeletal Skinning with Optimized Centers of Rotation", SIGGRAPH 2016
+This module does not import bpy.
+
+how to use:
+    Imported by center-of-rotation-skinning.py
+'''
+
+import os
+import hashlib
+import numpy as np
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+from skinning_engine import (blend_matrices, apply_matrices, matrices_to_dual_quaternions,
+                             blend_dual_quaternions, rotate_by_quaternions)
+from parallel_skinning import share_array, attach_arrays, release_blocks, detached_main
+
+DEFAULT_SIGMA = 0.1
+# Vertices per task of the center precomputation
+CHUNK_SIZE = 2048
+# Upper bound of vertex x triangle similarity entries evaluated at once
+BLOCK_ENTRIES = 1 << 22
+
+# Shared state of a worker process, set up once by _attach_worker
+_worker = {}
+
+
+def read_triangles(mesh):
+    """Read the loop triangles of a mesh as an (T, 3) vertex index array."""
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    return triangles.reshape(-1, 3)
+
+
+def triangle_influences(triangles, indices, weights, num_bones):
+    """
+    Average the vertex weights over every triangle, as a bone -> triangle CSR.
+    Returns (offsets, triangle ids, values); the triangles of bone b are ids[offsets[b]:offsets[b + 1]], sorted.
+    """
+    if len(triangles) == 0:
+        return np.zeros(num_bones + 1, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    k = indices.shape[1]
+    tris = np.repeat(np.arange(len(triangles), dtype=np.int64), 3 * k)
+    bones = indices[triangles].reshape(-1).astype(np.int64)
+    values = weights[triangles].reshape(-1).astype(np.float64) / 3.0
+    keep = values > 0
+    tris, bones, values = tris[keep], bones[keep], values[keep]
+
+    keys, inverse = np.unique(bones * len(triangles) + tris, return_inverse=True)
+    values = np.bincount(inverse, weights=values)
+    offsets = np.zeros(num_bones + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // len(triangles), minlength=num_bones), out=offsets[1:])
+    return offsets, keys % len(triangles), values
+
+
+def _pair_triangles(offsets, tri_ids, tri_values, j, k):
+    """Triangles influenced by both bones j and k, with their weights for j and k."""
+    a, b = slice(offsets[j], offsets[j + 1]), slice(offsets[k], offsets[k + 1])
+    common, ia, ib = np.intersect1d(tri_ids[a], tri_ids[b], assume_unique=True, return_indices=True)
+    return common, tri_values[a][ia], tri_values[b][ib]
+
+
+def accumulate_centers(indices, weights, offsets, tri_ids, tri_values, areas, centroids, sigma=DEFAULT_SIGMA):
+    """
+    Similarity-weighted sums of the triangle centroids for a chunk of vertices.
+
+    The similarity of the weights of vertex i and triangle t sums over the bone pairs (j, k) of the vertex:
+        2 * w_ij * w_ik * w_tj * w_tk * exp(-(w_ij * w_tk - w_ik * w_tj)^2 / sigma^2)
+    All vertices of the chunk that share a bone pair are evaluated against that pair's triangles at once.
+    Returns (numerator (C, 3), denominator (C,)); the center of a vertex is their quotient.
+    """
+    numerator = np.zeros((len(indices), 3))
+    denominator = np.zeros(len(indices))
+    weights = weights.astype(np.float64)
+    weighted_centroids = centroids * areas[:, None]
+    num_bones = len(offsets) - 1
+    max_influences = indices.shape[1]
+
+    for a in range(max_influences):
+        for b in range(a + 1, max_influences):
+            rows = np.flatnonzero((weights[:, a] > 0) & (weights[:, b] > 0))
+            if len(rows) == 0:
+                continue
+            # Order every pair as (lower bone, higher bone) and group the vertices by pair
+            bone_a, bone_b = indices[rows, a].astype(np.int64), indices[rows, b].astype(np.int64)
+            swap = bone_a > bone_b
+            lo, hi = np.where(swap, bone_b, bone_a), np.where(swap, bone_a, bone_b)
+            w_lo = np.where(swap, weights[rows, b], weights[rows, a])
+            w_hi = np.where(swap, weights[rows, a], weights[rows, b])
+            pairs, inverse = np.unique(lo * num_bones + hi, return_inverse=True)
+
+            for p, pair in enumerate(pairs):
+                tris, t_lo, t_hi = _pair_triangles(offsets, tri_ids, tri_values, pair // num_bones, pair % num_bones)
+                if len(tris) == 0:
+                    continue
+                members = np.flatnonzero(inverse == p)
+                step = max(1, BLOCK_ENTRIES // len(tris))
+                for start in range(0, len(members), step):
+                    block = members[start:start + step]
+                    v_lo, v_hi = w_lo[block, None], w_hi[block, None]
+                    similarity = 2.0 * (v_lo * v_hi) * (t_lo * t_hi)[None, :]
+                    similarity *= np.exp(-np.square(v_lo * t_hi[None, :] - v_hi * t_lo[None, :]) / sigma ** 2)
+                    numerator[rows[block]] += similarity @ weighted_centroids[tris]
+                    denominator[rows[block]] += similarity @ areas[tris]
+    return numerator, denominator
+
+
+def _attach_worker(specs, sigma):
+    """Pool initializer: map the shared mesh and influence arrays once per worker."""
+    _worker["blocks"] = []
+    _worker["arrays"] = attach_arrays(specs, _worker["blocks"])
+    _worker["sigma"] = sigma
+
+
+def _accumulate_chunk(start, stop):
+    arrays = _worker["arrays"]
+    return start, accumulate_centers(arrays["indices"][start:stop], arrays["weights"][start:stop],
+                                     arrays["offsets"], arrays["tri_ids"], arrays["tri_values"],
+                                     arrays["areas"], arrays["centroids"], _worker["sigma"])
+
+
+def compute_rotation_centers(rest_positions, triangles, indices, weights, sigma=DEFAULT_SIGMA, workers=1):
+    """
+    Compute the optimized center of rotation of every vertex.
+
+    rest_positions: (N, 3) rest positions.
+    triangles: (T, 3) vertex indices, e.g. from read_triangles.
+    indices, weights: (N, K) influence layout.
+    sigma: Width of the weight similarity kernel.
+    workers: Number of worker processes; vertex chunks are distributed over them.
+    Vertices without a similar triangle (e.g. rigidly bound to a single bone) get their own rest position,
+    which makes their CoR skinning identical to LBS; so do all vertices of a mesh without triangles.
+    """
+    rest_positions = np.asarray(rest_positions, dtype=np.float64)
+    if len(rest_positions) == 0 or len(triangles) == 0:
+        return rest_positions.astype(np.float32)
+    corners = rest_positions[triangles]
+    areas = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    centroids = corners.mean(axis=1)
+    num_bones = int(indices.max()) + 1 if indices.size else 0
+    offsets, tri_ids, tri_values = triangle_influences(triangles, indices, weights, num_bones)
+
+    numerator = np.zeros((len(rest_positions), 3))
+    denominator = np.zeros(len(rest_positions))
+    chunks = [(start, min(start + CHUNK_SIZE, len(rest_positions)))
+              for start in range(0, len(rest_positions), CHUNK_SIZE)]
+    if workers <= 1:
+        for start, stop in chunks:
+            numerator[start:stop], denominator[start:stop] = accumulate_centers(
+                indices[start:stop], weights[start:stop], offsets, tri_ids, tri_values, areas, centroids, sigma)
+    else:
+        blocks = []
+        try:
+            arrays = {"indices": indices, "weights": weights, "offsets": offsets, "tri_ids": tri_ids,
+                      "tri_values": tri_values, "areas": areas, "centroids": centroids}
+            specs = {key: share_array(np.ascontiguousarray(array), blocks) for key, array in arrays.items()}
+            with detached_main(), ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                                       initializer=_attach_worker, initargs=(specs, sigma)) as pool:
+                for start, (num, den) in pool.map(_accumulate_chunk, *zip(*chunks)):
+                    numerator[start:start + len(den)], denominator[start:start + len(den)] = num, den
+        finally:
+            release_blocks(blocks)
+
+    centers = rest_positions.copy()
+    found = denominator > 1e-12
+    centers[found] = numerator[found] / denominator[found, None]
+    return centers.astype(np.float32)
+
+
+def fingerprint(rest_positions, triangles, indices, weights, sigma=DEFAULT_SIGMA):
+    """SHA-1 of everything the centers depend on."""
+    digest = hashlib.sha1()
+    for array in (rest_positions, triangles, indices, weights):
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+    digest.update(repr(float(sigma)).encode())
+    return digest.hexdigest()
+
+
+def load_or_compute_centers(cache_dir, rest_positions, triangles, indices, weights, sigma=DEFAULT_SIGMA, workers=1):
+    """
+    Return the centers of rotation from cache_dir, computing and storing them on a cache miss.
+    Returns (centers, cached) where cached tells whether they were loaded from disk.
+    """
+    key = fingerprint(rest_positions, triangles, indices, weights, sigma)
+    cache_path = os.path.join(cache_dir, f"cor_{key}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return data["centers"], True
+
+    centers = compute_rotation_centers(rest_positions, triangles, indices, weights, sigma, workers)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_path, centers=centers)
+    return centers, False
+
+
+def center_of_rotation_skinning(rest_positions, centers, indices, weights, palette, rest_normals=None):
+    """
+    Skin positions (and optionally normals) around the optimized centers of rotation.
+
+    centers: (N, 3) rest-pose centers of rotation.
+    palette: (B, 4, 4) skinning matrices.
+    Returns (positions, normals); normals is None if rest_normals is None.
+    """
+    # Blended rotation with the same antipodality fix as DQS, and the LBS-transformed centers
+    rotations = blend_dual_quaternions(indices, weights, matrices_to_dual_quaternions(palette))[:, :4]
+    moved_centers = apply_matrices(blend_matrices(indices, weights, palette), centers)
+    positions = rotate_by_quaternions(rotations, rest_positions - centers) + moved_centers
+    normals = None if rest_normals is None else rotate_by_quaternions(rotations, rest_normals)
+    return positions.astype(np.float32), normals
@@ -5,73 +5,54 @@ Animating an object from single monocular video
 name: dual-quaternion-skinning.py
 description: Perform Dual Quaternion Skinning (DQS) on a mesh object using an armature
 Run this script AFTER ASSIGNING WEIGHTS to the mesh object
+The rest pose is kept in the "rest_position" attribute, so running the script again does not compound the deformation.
 reference: https://team.inria.fr/imagine/files/2014/10/skinning_dual_quaternions.pdf
 
 how to use:
     1. Open Blender file
     2. Open the Python Console
     3. Open the script file on the Python Console
-    4. *** Change OBJECT_NAME and ARMATURE_NAME in the script ***
-    5. Run the script
+    4. *** Change OBJECT_NAME and ARMATURE_NAME in the script (set REBUILD_INFLUENCES after editing weights) ***
+    5. *** Set MODE: "pose" skins the current pose, "bake" skins every frame of the armature action into CACHE_PATH,
+           "live" re-skins the vertices of edited bones whenever the pose changes ***
+    6. Run the script
 '''
 
 import bpy
-import bmesh
-from mathutils import Vector, Quaternion
-import numpy as np
-
-class DualQuaternion:
-    """A helper class to represent dual quaternions."""
-    def __init__(self, real=Quaternion((1, 0, 0, 0)), dual=Quaternion((0, 0, 0, 0))):
-        self.real = real
-        self.dual = dual
-
-    def normalize(self):
-        """Normalize the dual quaternion."""
-        magnitude = self.real.magnitude
-        if magnitude > 0:
-            self.real = self.real * (1.0 / magnitude)
-            self.dual = self.dual * (1.0 / magnitude)
-
-    def extract_components(self):
-        """Extract normalized components of the dual quaternion."""
-        self.normalize()
-        # Real (rotation) components
-        w0, x0, y0, z0 = self.real
-        # Dual (translation) components
-        wε, xε, yε, zε = self.dual
-        return (w0, x0, y0, z0), (wε, xε, yε, zε)
-
-    def to_transformation_matrix(self):
-        """Convert the dual quaternion to a transformation matrix."""
-        (w0, x0, y0, z0), (wε, xε, yε, zε) = self.extract_components()
-
-        # Compute translation components t0, t1, t2
-        t0 = 2 * (-wε * x0 + xε * w0 - yε * z0 + zε * y0)
-        t1 = 2 * (-wε * y0 + xε * z0 + yε * w0 - zε * x0)
-        t2 = 2 * (-wε * z0 - xε * y0 + yε * x0 + zε * w0)
-
-        # Construct the transformation matrix M
-        matrix = np.array([
-            [1 - 2 * (y0**2 + z0**2), 2 * (x0 * y0 - w0 * z0), 2 * (x0 * z0 + w0 * y0), t0],
-            [2 * (x0 * y0 + w0 * z0), 1 - 2 * (x0**2 + z0**2), 2 * (y0 * z0 - w0 * x0), t1],
-            [2 * (x0 * z0 - w0 * y0), 2 * (y0 * z0 + w0 * x0), 1 - 2 * (x0**2 + y0**2), t2],
-            [0, 0, 0, 1]
-        ])
-        return matrix
-
-
-def matrix_to_dual_quaternion(matrix):
-    """Convert a transformation matrix to a dual quaternion."""
-    real = matrix.to_quaternion()
-    translation = matrix.translation
-    dual = 0.5 * Quaternion((0, translation.x, translation.y, translation.z)) @ real
-    return DualQuaternion(real, dual)
-
+import os
+import sys
+
+# Make the shared skinning engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "utils"))
+from skinning_engine import (read_rest_positions, read_rest_normals, write_positions, write_normals,
+                             build_palette, skin_with_normals, action_frames, bake_frames, collect_palettes,
+                             attach_point_cache, IncrementalSkinner, start_live_skinning, stop_live_skinning)
+from influences import ensure_influences
+from parallel_skinning import skin_frames_parallel
+from point_cache import create_point_cache, create_normal_cache
 
 OBJECT_NAME = "jumpingjacks"
 ARMATURE_NAME = "metarig"
 
+# Number of strongest bones kept per vertex
+MAX_INFLUENCES = 4
+# Rebuild the influences stored on the mesh, e.g. after the weights were edited
+REBUILD_INFLUENCES = False
+
+# Skin the rest normals too: custom split normals in pose/live mode, a "<cache>_normals.npy" file in bake mode
+SKIN_NORMALS = True
+
+# Mode: ["pose", "bake", "live"]
+MODE = "pose"
+# Point cache written in bake mode and played back with a Mesh Cache modifier
+CACHE_PATH = "//skinning_cache/dqs.pc2"
+# Worker processes for bake mode; more than 1 skins frames in parallel
+WORKERS = 1
+# Bones whose matrices changed less than this are not re-skinned in live mode
+LIVE_TOLERANCE = 1e-6
+
 # Access the objects
 obj = bpy.data.objects.get(OBJECT_NAME)
 armature = bpy.data.objects.get(ARMATURE_NAME)
@@ -85,64 +66,64 @@ bpy.ops.object.mode_set(mode='OBJECT')
 
 # Access the mesh data
 mesh = obj.data
-bm = bmesh.new()
-bm.from_mesh(mesh)
-
-# Step 1: Normalize weights
-for vert in mesh.vertices:
-    total_weight = sum(group.weight for group in vert.groups)
-    if total_weight > 0:
-        for group in vert.groups:
-            vgroup = obj.vertex_groups[group.group]
-            normalized_weight = group.weight / total_weight
-            vgroup.add([vert.index], normalized_weight, 'REPLACE')
+bone_names = [bone.name for bone in armature.pose.bones]
+rest_positions = read_rest_positions(mesh)
+rest_normals = read_rest_normals(mesh, rest_positions) if SKIN_NORMALS else None
+
+# Step 1: Read and normalize weights
+influences = ensure_influences(obj, bone_names, MAX_INFLUENCES, rebuild=REBUILD_INFLUENCES)
+indices, weights = influences.indices, influences.weights
 print("Weights normalized!")
 
 # Step 2: Precompute dual quaternions for each bone
-dual_quaternions = {}
-for bone in armature.pose.bones:
-    bone_name = bone.name
-    rest_matrix = armature.matrix_world @ bone.bone.matrix_local
-    pose_matrix = armature.matrix_world @ bone.matrix
-    transform_matrix = pose_matrix @ rest_matrix.inverted()
-
-    # Convert to dual quaternion
-    dual_quaternions[bone_name] = matrix_to_dual_quaternion(transform_matrix)
-
-print("Dual quaternions computed for all bones.")
-
+# (B, 8) palette: real (rotation) part in columns 0-3, dual (translation) part in columns 4-7
 # Step 3: Perform Dual Quaternion Skinning (DQS)
-# Transform vertex positions and normals
-for vert in mesh.vertices:
-    # Initialize blended dual quaternion
-    blended_dual_quat = DualQuaternion(Quaternion((0, 0, 0, 0)), Quaternion((0, 0, 0, 0)))
-    total_weight = 0.0
-
-    # Blend dual quaternions for all influencing bones
-    for group in vert.groups:
-        vgroup = obj.vertex_groups[group.group]
-        bone_name = vgroup.name
-        weight = group.weight
-        if weight > 0 and bone_name in dual_quaternions:
-            dq = dual_quaternions[bone_name]
-            blended_dual_quat.real += dq.real * weight
-            blended_dual_quat.dual += dq.dual * weight
-            total_weight += weight
-
-    if total_weight > 0:
-        blended_dual_quat.normalize()
-        transformation_matrix = blended_dual_quat.to_transformation_matrix()
-
-        # Transform vertex position
-        vertex_position = np.array([vert.co.x, vert.co.y, vert.co.z, 1.0])  # Homogeneous coordinates
-        transformed_position = transformation_matrix @ vertex_position
-
-        # Update vertex position
-        vert.co = Vector(transformed_position[:3])
-
-# Recalculate normals for the entire mesh
-bm.normal_update()  # Updates the vertex and face normals based on geometry changes
-mesh.update()
-
-print("Vertex positions and normals updated successfully!")
-print("Dual Quaternion Skinning applied!")
+# Blend, fix antipodality and normalize for all vertices at once, then transform the positions
+# Normals are rotated by the blended rotation quaternion in the same pass
+def skin_pose(palette):
+    return skin_with_normals("dqs", rest_positions, rest_normals, indices, weights, palette)
+
+stop_live_skinning(obj)
+
+if MODE == "pose":
+    positions, normals = skin_pose(build_palette(armature, bone_names))
+    write_positions(mesh, positions)
+    if normals is not None:
+        write_normals(mesh, normals)
+    print("Vertex positions and normals updated successfully!")
+    print("Dual Quaternion Skinning applied!")
+elif MODE == "bake":
+    frames = action_frames(armature)
+    cache_path = bpy.path.abspath(CACHE_PATH)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    cache = create_point_cache(cache_path, len(rest_positions), len(frames), start_frame=frames[0])
+    normals_cache = None
+    if SKIN_NORMALS:
+        normals_path = os.path.splitext(cache_path)[0] + "_normals.npy"
+        normals_cache = create_normal_cache(normals_path, len(rest_positions), len(frames))
+    if WORKERS > 1:
+        # Palettes are evaluated here; workers skin frame ranges from shared memory into the caches
+        palettes = collect_palettes(bpy.context.scene, armature, bone_names, frames)
+        skin_frames_parallel(rest_positions, indices, weights, palettes, cache, method="dqs", workers=WORKERS,
+                             rest_normals=rest_normals, normals_cache=normals_cache)
+    else:
+        bake_frames(bpy.context.scene, armature, bone_names, frames, skin_pose, cache, normals_cache)
+    del cache, normals_cache
+
+    # Keep the mesh in its rest pose; the Mesh Cache modifier plays the baked clip
+    write_positions(mesh, rest_positions)
+    attach_point_cache(obj, cache_path, frames[0])
+    print(f"Dual Quaternion Skinning baked for frames {frames[0]}-{frames[-1]} to {cache_path}")
+elif MODE == "live":
+    # Keeps the last palette and a bone -> vertex index; only vertices of moved bones are recomputed
+    skinner = IncrementalSkinner(rest_positions, indices, weights, method="dqs", tolerance=LIVE_TOLERANCE,
+                                 rest_normals=rest_normals)
+    positions, _ = skinner.skin(build_palette(armature, bone_names))
+    write_positions(mesh, positions)
+    if skinner.normals is not None:
+        write_normals(mesh, skinner.normals)
+    start_live_skinning(obj, armature, bone_names, skinner)
+    print("Dual Quaternion Skinning is updated live with the pose. Run with another MODE to stop.")
+else:
+    raise ValueError(f"Unknown MODE '{MODE}'.")
@@ -0,0 +1,134 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: influences.py
+description: Compact top-K influence format shared by LBS and DQS.
+Every vertex keeps its K strongest bones as uint16 indices and float32 (or float16) weights,
+pruned and renormalized in one vectorized pass. Skinning then costs O(N * K).
+The influences are persisted on the mesh as point attributes "skin_index_<k>" and "skin_weight_<k>",
+with the bone order in the mesh property "skin_bones", so they are read back in bulk on the next run.
+Vertex groups are read through utils/vertex_group_io.py, whose writes also clear the stored influences.
+This module does not import bpy.
+'''
+
+import numpy as np
+
+from vertex_group_io import read_group_triplets, clear_influences, INFLUENCE_BONES_PROPERTY
+
+DEFAULT_MAX_INFLUENCES = 4
+BONES_PROPERTY = INFLUENCE_BONES_PROPERTY
+INDEX_ATTRIBUTE = "skin_index_{}"
+WEIGHT_ATTRIBUTE = "skin_weight_{}"
+
+
+class Influences:
+    """Per-vertex top-K bone influences: (N, K) uint16 bone indices and (N, K) weights summing to 1."""
+    def __init__(self, indices, weights, bone_names):
+        self.indices = indices
+        self.weights = weights
+        self.bone_names = list(bone_names)
+
+    @property
+    def max_influences(self):
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def top_k_influences(num_vertices, rows, bones, values, bone_names,
+                     max_influences=DEFAULT_MAX_INFLUENCES, min_weight=0.0, weight_dtype=np.float32):
+    """
+    Build top-K influences from (vertex, bone, weight) triplets.
+
+    num_vertices: Number of vertices N.
+    rows, bones, values: Triplet arrays; entries with a negative bone index are ignored.
+    bone_names: Bone names, in index order.
+    max_influences: K, the number of bones kept per vertex.
+    min_weight: Weights below this are pruned before renormalizing.
+    weight_dtype: np.float32 or np.float16.
+    Vertices without any weight get all-zero rows and stay in their rest pose.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    bones = np.asarray(bones, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float32)
+    keep = (bones >= 0) & (values > max(min_weight, 0.0))
+    rows, bones, values = rows[keep], bones[keep], values[keep]
+
+    # Sort by vertex, strongest weight first, and rank the entries inside each vertex
+    order = np.lexsort((-values, rows))
+    rows, bones, values = rows[order], bones[order], values[order]
+    starts = np.searchsorted(rows, rows, side="left")
+    ranks = np.arange(len(rows)) - starts
+    top = ranks < max_influences
+
+    indices = np.zeros((num_vertices, max_influences), dtype=np.uint16)
+    weights = np.zeros((num_vertices, max_influences), dtype=np.float32)
+    indices[rows[top], ranks[top]] = bones[top]
+    weights[rows[top], ranks[top]] = values[top]
+
+    total = weights.sum(axis=1, keepdims=True)
+    np.divide(weights, total, out=weights, where=total > 0)
+    return Influences(indices, weights.astype(weight_dtype), bone_names)
+
+
+def read_vertex_group_influences(obj, bone_names, max_influences=DEFAULT_MAX_INFLUENCES,
+                                 min_weight=0.0, weight_dtype=np.float32):
+    """
+    Build top-K influences from the vertex groups of a mesh object.
+    Groups that do not match a bone are ignored.
+    """
+    bone_index = {name: i for i, name in enumerate(bone_names)}
+    group_to_bone = np.full(max((g.index for g in obj.vertex_groups), default=-1) + 1, -1, dtype=np.int64)
+    for vgroup in obj.vertex_groups:
+        group_to_bone[vgroup.index] = bone_index.get(vgroup.name, -1)
+
+    # One pass over all vertex group memberships
+    rows, groups, values = read_group_triplets(obj.data)
+    bones = group_to_bone[groups]
+    return top_k_influences(len(obj.data.vertices), rows, bones, values, bone_names,
+                            max_influences, min_weight, weight_dtype)
+
+
+def save_influences(mesh, influences):
+    """Store the influences on the mesh as point attributes, replacing any previous ones."""
+    clear_influences(mesh)
+    for k in range(influences.max_influences):
+        index_attr = mesh.attributes.new(INDEX_ATTRIBUTE.format(k), 'INT', 'POINT')
+        index_attr.data.foreach_set("value", influences.indices[:, k].astype(np.int32))
+        weight_attr = mesh.attributes.new(WEIGHT_ATTRIBUTE.format(k), 'FLOAT', 'POINT')
+        weight_attr.data.foreach_set("value", influences.weights[:, k].astype(np.float32))
+    mesh[BONES_PROPERTY] = "\n".join(influences.bone_names)
+
+
+def load_influences(mesh, bone_names, max_influences=DEFAULT_MAX_INFLUENCES, weight_dtype=np.float32):
+    """
+    Read influences stored by save_influences.
+    Returns None if there are none, or if they were built for other bones or another K.
+    """
+    if mesh.get(BONES_PROPERTY) != "\n".join(bone_names):
+        return None
+    names = [INDEX_ATTRIBUTE.format(k) for k in range(max_influences)]
+    names += [WEIGHT_ATTRIBUTE.format(k) for k in range(max_influences)]
+    if any(name not in mesh.attributes for name in names):
+        return None
+    if INDEX_ATTRIBUTE.format(max_influences) in mesh.attributes:
+        return None
+
+    num_vertices = len(mesh.vertices)
+    indices = np.empty((max_influences, num_vertices), dtype=np.int32)
+    weights = np.empty((max_influences, num_vertices), dtype=np.float32)
+    for k in range(max_influences):
+        mesh.attributes[INDEX_ATTRIBUTE.format(k)].data.foreach_get("value", indices[k])
+        mesh.attributes[WEIGHT_ATTRIBUTE.format(k)].data.foreach_get("value", weights[k])
+    return Influences(indices.T.astype(np.uint16), weights.T.astype(weight_dtype), bone_names)
+
+
+def ensure_influences(obj, bone_names, max_influences=DEFAULT_MAX_INFLUENCES, rebuild=False):
+    """Load the influences stored on the mesh, or build them from the vertex groups and store them."""
+    influences = None if rebuild else load_influences(obj.data, bone_names, max_influences)
+    if influences is None:
+        influences = read_vertex_group_influences(obj, bone_names, max_influences)
+        save_influences(obj.data, influences)
+    return influences
@@ -5,22 +5,53 @@ Animating an object from single monocular video
 name: linear-blend-skinning.py
 description: Perform Linear Blend Skinning (LBS) on a mesh object using an armature
 Run this script AFTER ASSIGNING WEIGHTS to the mesh object
+The rest pose is kept in the "rest_position" attribute, so running the script again does not compound the deformation.
 
 how to use:
     1. Open Blender file
     2. Open the Python Console
     3. Open the script file on the Python Console
-    4. *** Change OBJECT_NAME and ARMATURE_NAME in the script ***
+    4. *** Change OBJECT_NAME and ARMATURE_NAME in the script (set REBUILD_INFLUENCES after editing weights) ***
+    5. *** Set MODE: "pose" skins the current pose, "bake" skins every frame of the armature action into CACHE_PATH,
+           "live" re-skins the vertices of edited bones whenever the pose changes ***
     6. Run the script
 '''
 
 import bpy
-import bmesh
-from mathutils import Vector, Matrix
+import os
+import sys
+
+# Make the shared skinning engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "utils"))
+from skinning_engine import (read_rest_positions, read_rest_normals, write_positions, write_normals,
+                             build_palette, skin_with_normals, action_frames, bake_frames, collect_palettes,
+                             attach_point_cache, IncrementalSkinner, start_live_skinning, stop_live_skinning)
+from influences import ensure_influences
+from parallel_skinning import skin_frames_parallel
+from point_cache import create_point_cache, create_normal_cache
 
 OBJECT_NAME = "jumpingjacks"
 ARMATURE_NAME = "metarig"
 
+# Number of strongest bones kept per vertex
+MAX_INFLUENCES = 4
+# Rebuild the influences stored on the mesh, e.g. after the weights were edited
+REBUILD_INFLUENCES = False
+
+# Skin the rest normals too: custom split normals in pose/live mode, a "<cache>_normals.npy" file in bake mode
+SKIN_NORMALS = True
+
+# Mode: ["pose", "bake", "live"]
+MODE = "pose"
+# Point cache written in bake mode and played back with a Mesh Cache modifier
+CACHE_PATH = "//skinning_cache/lbs.pc2"
+# Worker processes for bake mode; more than 1 skins frames in parallel
+WORKERS = 1
+# Bones whose matrices changed less than this are not re-skinned in live mode
+LIVE_TOLERANCE = 1e-6
+
 # Access the objects
 obj = bpy.data.objects.get(OBJECT_NAME)
 armature = bpy.data.objects.get(ARMATURE_NAME)
@@ -34,44 +65,62 @@ bpy.ops.object.mode_set(mode='OBJECT')
 
 # Access the mesh data
 mesh = obj.data
-bm = bmesh.new()
-bm.from_mesh(mesh)
-
-# Step 1: Normalize weights
-# Normalize weights across all bones for each vertex
-for vert in mesh.vertices:
-    total_weight = 0.0
-    weights = []
-    for group in vert.groups:
-        vgroup = obj.vertex_groups[group.group]
-        weight = group.weight
-        total_weight += weight
-        weights.append((vgroup, weight))
-    
-    # Normalize weights
-    if total_weight > 0:
-        for vgroup, weight in weights:
-            normalized_weight = weight / total_weight
-            vgroup.add([vert.index], normalized_weight, 'REPLACE')
-print("Weights normalized!")
+bone_names = [bone.name for bone in armature.pose.bones]
+rest_positions = read_rest_positions(mesh)
+rest_normals = read_rest_normals(mesh, rest_positions) if SKIN_NORMALS else None
+
+# Step 1: Read and normalize weights
+# Top-K (N, K) bone indices and weights, normalized for each vertex and stored on the mesh
+influences = ensure_influences(obj, bone_names, MAX_INFLUENCES, rebuild=REBUILD_INFLUENCES)
+indices, weights = influences.indices, influences.weights
+print(f"Weights normalized! ({influences.max_influences} influences per vertex)")
 
 # Step 2: Perform Linear Blend Skinning (LBS)
-rest_pose_matrices = {bone.name: armature.matrix_world @ bone.bone.matrix_local for bone in armature.pose.bones}
-for vert in mesh.vertices:
-    blended_position = Vector((0, 0, 0))
-    for group in vert.groups:
-        vgroup = obj.vertex_groups[group.group]
-        bone_name = vgroup.name
-        weight = group.weight
-        if weight > 0:
-            pose_bone = armature.pose.bones.get(bone_name)
-            if pose_bone:
-                bone_matrix = (armature.matrix_world @ pose_bone.matrix) @ rest_pose_matrices[bone_name].inverted()
-                transformed_vertex = bone_matrix @ vert.co
-                blended_position += weight * transformed_vertex
-    vert.co = blended_position
-
-
-bm.free()
-mesh.update()
-print("Linear Blend Skinning applied!")
\ No newline at end of file
+# The bone palette is built once per pose and applied to all vertices in one batched pass
+# Normals use the inverse transpose of the blended matrices in the same pass
+def skin_pose(palette):
+    return skin_with_normals("lbs", rest_positions, rest_normals, indices, weights, palette)
+
+stop_live_skinning(obj)
+
+if MODE == "pose":
+    positions, normals = skin_pose(build_palette(armature, bone_names))
+    write_positions(mesh, positions)
+    if normals is not None:
+        write_normals(mesh, normals)
+    print("Linear Blend Skinning applied!")
+elif MODE == "bake":
+    frames = action_frames(armature)
+    cache_path = bpy.path.abspath(CACHE_PATH)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    cache = create_point_cache(cache_path, len(rest_positions), len(frames), start_frame=frames[0])
+    normals_cache = None
+    if SKIN_NORMALS:
+        normals_path = os.path.splitext(cache_path)[0] + "_normals.npy"
+        normals_cache = create_normal_cache(normals_path, len(rest_positions), len(frames))
+    if WORKERS > 1:
+        # Palettes are evaluated here; workers skin frame ranges from shared memory into the caches
+        palettes = collect_palettes(bpy.context.scene, armature, bone_names, frames)
+        skin_frames_parallel(rest_positions, indices, weights, palettes, cache, method="lbs", workers=WORKERS,
+                             rest_normals=rest_normals, normals_cache=normals_cache)
+    else:
+        bake_frames(bpy.context.scene, armature, bone_names, frames, skin_pose, cache, normals_cache)
+    del cache, normals_cache
+
+    # Keep the mesh in its rest pose; the Mesh Cache modifier plays the baked clip
+    write_positions(mesh, rest_positions)
+    attach_point_cache(obj, cache_path, frames[0])
+    print(f"Linear Blend Skinning baked for frames {frames[0]}-{frames[-1]} to {cache_path}")
+elif MODE == "live":
+    # Keeps the last palette and a bone -> vertex index; only vertices of moved bones are recomputed
+    skinner = IncrementalSkinner(rest_positions, indices, weights, method="lbs", tolerance=LIVE_TOLERANCE,
+                                 rest_normals=rest_normals)
+    positions, _ = skinner.skin(build_palette(armature, bone_names))
+    write_positions(mesh, positions)
+    if skinner.normals is not None:
+        write_normals(mesh, skinner.normals)
+    start_live_skinning(obj, armature, bone_names, skinner)
+    print("Linear Blend Skinning is updated live with the pose. Run with another MODE to stop.")
+else:
+    raise ValueError(f"Unknown MODE '{MODE}'.")
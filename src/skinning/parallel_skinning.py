@@ -0,0 +1,147 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: parallel_skinning.py
+description: Frame-parallel skinning over a process pool.
+The rest positions, the influences and the per-frame bone palettes are placed in multiprocessing.shared_memory,
+frame ranges are fanned out to worker processes, and every worker writes its frames straight into
+the memory-mapped output point cache (and optional normal cache). No mesh data is pickled between processes.
+Workers only import NumPy and skinning_engine, never bpy.
+'''
+
+import os
+import sys
+import types
+import contextlib
+import numpy as np
+from multiprocessing import get_context, shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+from skinning_engine import skin_with_normals
+
+# Shared state of a worker process, set up once by _attach_worker
+_worker = {}
+
+
+def share_array(array, blocks):
+    """Copy an array into a new shared memory block; returns the spec workers use to attach to it."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    blocks.append(block)
+    return block.name, array.shape, array.dtype.str
+
+
+def attach_arrays(specs, blocks):
+    """Map shared arrays from their specs; the blocks must stay referenced while the arrays are used."""
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays
+
+
+def release_blocks(blocks):
+    """Close and unlink shared memory blocks created by share_array."""
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _map_cache(spec):
+    """Map an output cache from its (filename, offset, shape) spec."""
+    if spec is None:
+        return None
+    filename, offset, shape = spec
+    return np.memmap(filename, dtype="<f4", mode="r+", offset=offset, shape=shape)
+
+
+def _cache_spec(cache):
+    return None if cache is None else (cache.filename, cache.offset, cache.shape)
+
+
+def _attach_worker(specs, cache_spec, normals_cache_spec, method):
+    """Pool initializer: map the shared inputs and the output caches once per worker."""
+    _worker["blocks"] = []
+    _worker["arrays"] = attach_arrays(specs, _worker["blocks"])
+    _worker["method"] = method
+    _worker["cache"] = _map_cache(cache_spec)
+    _worker["normals_cache"] = _map_cache(normals_cache_spec)
+
+
+def _skin_frames(start, stop):
+    """Skin frames [start, stop) into the shared output caches."""
+    arrays, cache, normals_cache = _worker["arrays"], _worker["cache"], _worker["normals_cache"]
+    for frame in range(start, stop):
+        positions, normals = skin_with_normals(_worker["method"], arrays["rest_positions"], arrays.get("rest_normals"),
+                                               arrays["indices"], arrays["weights"], arrays["palettes"][frame])
+        cache[frame] = positions
+        if normals_cache is not None:
+            normals_cache[frame] = normals
+    cache.flush()
+    if normals_cache is not None:
+        normals_cache.flush()
+    return stop - start
+
+
+@contextlib.contextmanager
+def detached_main():
+    """
+    Hide the calling script from spawned workers.
+    Inside Blender, __main__ is the running script; a spawned worker would otherwise re-run it and import bpy.
+    """
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def frame_ranges(num_frames, num_workers, chunks_per_worker=4):
+    """Split frames into contiguous ranges, a few per worker for load balancing."""
+    num_chunks = max(1, min(num_frames, num_workers * chunks_per_worker))
+    bounds = np.linspace(0, num_frames, num_chunks + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def skin_frames_parallel(rest_positions, indices, weights, palettes, cache, method="lbs", workers=None,
+                         rest_normals=None, normals_cache=None):
+    """
+    Skin all frames in parallel into a memory-mapped cache.
+
+    rest_positions: (N, 3) rest positions.
+    indices, weights: (N, K) influence layout.
+    palettes: (F, B, 4, 4) bone palettes, one per frame.
+    cache: (F, N, 3) float32 np.memmap backed by a file, e.g. from point_cache.create_point_cache.
+    method: "lbs" or "dqs".
+    workers: Number of worker processes (defaults to the number of CPUs).
+    rest_normals, normals_cache: Optional (N, 3) rest normals and (F, N, 3) float32 np.memmap for skinned normals.
+    """
+    workers = workers or os.cpu_count() or 1
+    cache.flush()
+    if normals_cache is not None:
+        normals_cache.flush()
+
+    blocks = []
+    try:
+        specs = {
+            "rest_positions": share_array(np.ascontiguousarray(rest_positions, dtype=np.float32), blocks),
+            "indices": share_array(np.ascontiguousarray(indices), blocks),
+            "weights": share_array(np.ascontiguousarray(weights), blocks),
+            "palettes": share_array(np.ascontiguousarray(palettes, dtype=np.float64), blocks),
+        }
+        if rest_normals is not None and normals_cache is not None:
+            specs["rest_normals"] = share_array(np.ascontiguousarray(rest_normals, dtype=np.float32), blocks)
+        else:
+            normals_cache = None
+        initargs = (specs, _cache_spec(cache), _cache_spec(normals_cache), method)
+
+        with detached_main(), ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                                   initializer=_attach_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_skin_frames, start, stop) for start, stop in frame_ranges(len(palettes), workers)]
+            done = sum(future.result() for future in futures)
+    finally:
+        release_blocks(blocks)
+    return done
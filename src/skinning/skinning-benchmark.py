@@ -0,0 +1,198 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: skinning-benchmark.py
+description: Benchmark the skinning kernels of linear-blend-skinning.py and dual-quaternion-skinning.py without Blender
+A synthetic capsule mesh with a chain of bones along its axis is generated for every vertex and bone count,
+every frame bends the chain differently, and LBS and DQS are timed per frame with the same engine the scripts use.
+Peak memory of one frame is measured with tracemalloc (NumPy reports its allocations to it).
+The results of the whole (vertices x bones x method) grid are written to a JSON file, so runs can be compared over time.
+
+how to use:
+    1. Open a terminal in src/skinning
+    2. Run e.g. python skinning-benchmark.py --vertices 10000 100000 1000000 --bones 1 10 100 --output benchmark.json
+    3. Compare the "results" entries of two JSON files to spot regressions
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+# influences.py imports the utils modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils"))
+from skinning_engine import skin, skin_with_normals
+from influences import top_k_influences
+
+# Vertices on each ring of the capsule
+RING_SEGMENTS = 64
+CAPSULE_RADIUS = 0.2
+CAPSULE_LENGTH = 2.0
+# Largest bend of a bone relative to its parent, in radians
+BEND_AMPLITUDE = 0.5
+
+
+def make_capsule(num_vertices, radius=CAPSULE_RADIUS, length=CAPSULE_LENGTH, segments=RING_SEGMENTS):
+    """
+    Generate a capsule along +Z from 0 to length with about num_vertices vertices.
+    Returns (positions, normals), both (N, 3) float32; N is rounded to whole rings.
+    """
+    rings = max(2, int(np.ceil(num_vertices / segments)))
+    z = np.linspace(0.0, length, rings)
+    # Hemispherical caps shrink the radius towards both ends
+    cap = np.clip(np.minimum(z, length - z) / radius, 0.0, 1.0)
+    ring_radius = radius * np.sqrt(1.0 - np.square(1.0 - cap))
+    ring_radius[[0, -1]] = 0.0
+
+    angles = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    positions = np.empty((rings, segments, 3), dtype=np.float32)
+    positions[..., 0] = ring_radius[:, None] * np.cos(angles)[None, :]
+    positions[..., 1] = ring_radius[:, None] * np.sin(angles)[None, :]
+    positions[..., 2] = z[:, None]
+
+    normals = np.zeros_like(positions)
+    normals[..., 0] = np.cos(angles)[None, :]
+    normals[..., 1] = np.sin(angles)[None, :]
+    normals[0, :] = (0.0, 0.0, -1.0)
+    normals[-1, :] = (0.0, 0.0, 1.0)
+    return positions.reshape(-1, 3), normals.reshape(-1, 3)
+
+
+def make_chain_influences(positions, num_bones, max_influences=4, length=CAPSULE_LENGTH):
+    """Weight every vertex to the max_influences bones of the chain nearest to its height, with a linear falloff."""
+    # Position along the chain in bone units, 0 at the center of the first bone
+    s = positions[:, 2].astype(np.float64) / length * num_bones - 0.5
+    first = np.floor(s).astype(np.int64) - (max_influences - 1) // 2
+    rows, bones, values = [], [], []
+    for k in range(max_influences):
+        bone = first + k
+        rows.append(np.arange(len(positions)))
+        bones.append(np.where((bone >= 0) & (bone < num_bones), bone, -1))
+        values.append(np.maximum(0.0, 1.0 - np.abs(s - bone) / (0.5 * max_influences + 0.5)))
+    bone_names = [f"bone.{b:03d}" for b in range(num_bones)]
+    return top_k_influences(len(positions), np.concatenate(rows), np.concatenate(bones), np.concatenate(values),
+                            bone_names, max_influences)
+
+
+def make_chain_palettes(num_bones, num_frames, length=CAPSULE_LENGTH):
+    """
+    Skinning matrices of a bending bone chain for every frame.
+    Each bone rotates around the X axis at its head, on top of the rotations of its parents.
+    Returns (F, B, 4, 4).
+    """
+    heads = np.arange(num_bones) * length / num_bones
+    palettes = np.empty((num_frames, num_bones, 4, 4))
+    for f in range(num_frames):
+        angles = BEND_AMPLITUDE * np.sin(2.0 * np.pi * f / max(num_frames, 1) + np.arange(num_bones)) / np.sqrt(num_bones)
+        parent = np.eye(4)
+        for b in range(num_bones):
+            c, s = np.cos(angles[b]), np.sin(angles[b])
+            rotation = np.array([[1.0, 0.0, 0.0, 0.0],
+                                 [0.0, c, -s, 0.0],
+                                 [0.0, s, c, 0.0],
+                                 [0.0, 0.0, 0.0, 1.0]])
+            to_head, from_head = np.eye(4), np.eye(4)
+            to_head[2, 3], from_head[2, 3] = heads[b], -heads[b]
+            parent = parent @ to_head @ rotation @ from_head
+            palettes[f, b] = parent
+    return palettes
+
+
+def benchmark_case(num_vertices, num_bones, method, num_frames=10, max_influences=4, normals=False, warmup=1):
+    """Time one method on one synthetic rig; returns a JSON-ready dict."""
+    positions, rest_normals = make_capsule(num_vertices)
+    influences = make_chain_influences(positions, num_bones, max_influences)
+    palettes = make_chain_palettes(num_bones, num_frames)
+    indices, weights = influences.indices, influences.weights
+
+    def skin_frame(palette):
+        if normals:
+            return skin_with_normals(method, positions, rest_normals, indices, weights, palette)
+        return skin(method, positions, indices, weights, palette)
+
+    for f in range(warmup):
+        skin_frame(palettes[f % num_frames])
+
+    frame_times = np.empty(num_frames)
+    for f in range(num_frames):
+        start = time.perf_counter()
+        skin_frame(palettes[f])
+        frame_times[f] = time.perf_counter() - start
+
+    # Memory is measured in a separate run, tracemalloc slows the allocations down
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    skin_frame(palettes[0])
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        "method": method,
+        "vertices": len(positions),
+        "bones": num_bones,
+        "max_influences": max_influences,
+        "normals": normals,
+        "frames": num_frames,
+        "frame_seconds_mean": float(frame_times.mean()),
+        "frame_seconds_median": float(np.median(frame_times)),
+        "frame_seconds_min": float(frame_times.min()),
+        "vertices_per_second": float(len(positions) / np.median(frame_times)),
+        "peak_memory_bytes": int(peak),
+        "peak_memory_bytes_per_vertex": float(peak / len(positions)),
+    }
+
+
+def environment():
+    """Machine and library versions stored with the results."""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LBS and DQS on synthetic capsule rigs.")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Vertex counts of the synthetic meshes (10k - 2M).")
+    parser.add_argument("--bones", type=int, nargs="+", default=[1, 10, 100],
+                        help="Bone counts of the synthetic chains (1 - 100).")
+    parser.add_argument("--methods", nargs="+", default=["lbs", "dqs"], choices=["lbs", "dqs"])
+    parser.add_argument("--frames", type=int, default=10, help="Timed frames per case.")
+    parser.add_argument("--max-influences", type=int, default=4, help="Bones per vertex (K).")
+    parser.add_argument("--normals", action="store_true", help="Skin normals in the same pass.")
+    parser.add_argument("--output", default="skinning_benchmark.json", help="JSON file the results are written to.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    print(f"{'method':>6} {'vertices':>9} {'bones':>5} {'ms/frame':>9} {'Mvert/s':>8} {'peak MB':>8}")
+    for num_vertices in args.vertices:
+        for num_bones in args.bones:
+            for method in args.methods:
+                result = benchmark_case(num_vertices, num_bones, method, args.frames, args.max_influences, args.normals)
+                results.append(result)
+                print(f"{method:>6} {result['vertices']:>9} {num_bones:>5} "
+                      f"{result['frame_seconds_median'] * 1e3:>9.2f} {result['vertices_per_second'] / 1e6:>8.2f} "
+                      f"{result['peak_memory_bytes'] / 2 ** 20:>8.1f}")
+
+    report = {"environment": environment(), "arguments": vars(args), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
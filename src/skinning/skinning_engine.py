@@ -0,0 +1,441 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: skinning_engine.py
+description: Vectorized skinning kernels shared by the skinning scripts.
+The bone palette is built once per pose and applied to all vertices at once with NumPy.
+Influences use the sparse (N, K) layout of influences.py: K bone indices and K weights per vertex.
+Mesh data is read and written in bulk with foreach_get / foreach_set.
+This module does not import bpy, so the kernels can also run outside Blender.
+
+how to use:
+    Imported by linear-blend-skinning.py, dual-quaternion-skinning.py and center-of-rotation-skinning.py
+'''
+
+import numpy as np
+
+REST_POSITION_ATTRIBUTE = "rest_position"
+REST_NORMAL_ATTRIBUTE = "rest_normal"
+CACHE_MODIFIER_NAME = "SkinningCache"
+
+
+def read_positions(mesh):
+    """Read the vertex positions of a mesh as an (N, 3) float32 array."""
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    return positions.reshape(-1, 3)
+
+
+def write_positions(mesh, positions):
+    """Write an (N, 3) array to the vertex positions of a mesh."""
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(positions, dtype=np.float32).ravel())
+    mesh.update()
+
+
+def read_normals(mesh):
+    """Read the vertex normals of a mesh as an (N, 3) float32 array."""
+    normals = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("normal", normals)
+    return normals.reshape(-1, 3)
+
+
+def write_normals(mesh, normals):
+    """Use (N, 3) per-vertex normals as the custom split normals of a mesh."""
+    if hasattr(mesh, "use_auto_smooth"):
+        # Custom normals need auto smooth before Blender 4.1
+        mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set_from_vertices(np.ascontiguousarray(normals, dtype=np.float32))
+
+
+def _read_vector_attribute(mesh, name):
+    """Read a FLOAT_VECTOR point attribute, or return None (dropping it if it has another type)."""
+    attr = mesh.attributes.get(name)
+    if attr is None:
+        return None
+    if attr.domain != 'POINT' or attr.data_type != 'FLOAT_VECTOR':
+        mesh.attributes.remove(attr)
+        return None
+    values = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    attr.data.foreach_get("vector", values)
+    return values.reshape(-1, 3)
+
+
+def _write_vector_attribute(mesh, name, values):
+    """Store (N, 3) values in a new FLOAT_VECTOR point attribute."""
+    attr = mesh.attributes.new(name, 'FLOAT_VECTOR', 'POINT')
+    attr.data.foreach_set("vector", np.ascontiguousarray(values, dtype=np.float32).ravel())
+
+
+def read_rest_positions(mesh):
+    """
+    Read the rest pose of a mesh as an (N, 3) float32 array.
+
+    The first call stores the current positions in a "rest_position" point attribute.
+    Later calls read that attribute, so skinning always starts from the rest pose
+    instead of compounding on the previous result. Remove the attribute to capture a new rest pose.
+    """
+    positions = _read_vector_attribute(mesh, REST_POSITION_ATTRIBUTE)
+    if positions is None:
+        positions = read_positions(mesh)
+        _write_vector_attribute(mesh, REST_POSITION_ATTRIBUTE, positions)
+    return positions
+
+
+def read_rest_normals(mesh, rest_positions):
+    """
+    Read the rest pose vertex normals of a mesh as an (N, 3) float32 array.
+    They are stored in a "rest_normal" point attribute the first time, computed with the mesh in its rest pose.
+    """
+    normals = _read_vector_attribute(mesh, REST_NORMAL_ATTRIBUTE)
+    if normals is None:
+        write_positions(mesh, rest_positions)
+        normals = read_normals(mesh)
+        _write_vector_attribute(mesh, REST_NORMAL_ATTRIBUTE, normals)
+    return normals
+
+
+def build_palette(armature, bone_names):
+    """
+    Build the bone matrix palette of the current pose.
+
+    Returns a (B, 4, 4) array of (matrix_world @ pose matrix) @ (matrix_world @ rest matrix)^-1,
+    one matrix per bone in bone_names.
+    """
+    world = np.array(armature.matrix_world, dtype=np.float64)
+    pose_bones = [armature.pose.bones[name] for name in bone_names]
+    pose = np.array([pb.matrix for pb in pose_bones], dtype=np.float64)
+    rest = np.array([pb.bone.matrix_local for pb in pose_bones], dtype=np.float64)
+    return (world @ pose) @ np.linalg.inv(world @ rest)
+
+
+def blend_matrices(indices, weights, palette):
+    """
+    Blend the palette into one affine transform per vertex.
+
+    indices, weights: (N, K) influence layout.
+    palette: (B, 4, 4) bone matrices.
+    Returns (N, 3, 4) blended transforms. Vertices without weights get the identity.
+    """
+    weights = weights.astype(np.float32, copy=False)
+    affine = palette[:, :3, :].astype(np.float32)
+    blended = np.zeros((len(indices), 3, 4), dtype=np.float32)
+    for k in range(indices.shape[1]):
+        blended += weights[:, k, None, None] * affine[indices[:, k]]
+
+    # Unweighted vertices keep their rest position
+    missing = 1.0 - weights.sum(axis=1)
+    blended[:, 0, 0] += missing
+    blended[:, 1, 1] += missing
+    blended[:, 2, 2] += missing
+    return blended
+
+
+def apply_matrices(blended, points):
+    """Apply (N, 3, 4) per-vertex transforms to (N, 3) points."""
+    return np.einsum("nij,nj->ni", blended[:, :, :3], points) + blended[:, :, 3]
+
+
+def apply_matrices_to_normals(blended, normals):
+    """
+    Transform (N, 3) normals by the inverse transpose of (N, 3, 4) per-vertex transforms.
+    Uses the cofactor matrix (the inverse transpose up to the determinant), so nothing is inverted.
+    """
+    a0, a1, a2 = blended[:, :, 0], blended[:, :, 1], blended[:, :, 2]
+    c0, c1, c2 = np.cross(a1, a2), np.cross(a2, a0), np.cross(a0, a1)
+    transformed = c0 * normals[:, :1] + c1 * normals[:, 1:2] + c2 * normals[:, 2:]
+    # A mirroring transform (negative determinant) flips the cofactor
+    transformed *= np.where(np.sum(a0 * c0, axis=1) < 0, -1.0, 1.0)[:, None]
+    return _normalized(transformed)
+
+
+def _normalized(vectors):
+    length = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(length > 0, length, 1.0)
+
+
+def linear_blend_skinning(rest_positions, indices, weights, palette):
+    """Linear Blend Skinning of (N, 3) rest positions with one batched pass over the palette."""
+    return apply_matrices(blend_matrices(indices, weights, palette), rest_positions)
+
+
+def matrices_to_quaternions(matrices):
+    """
+    Convert the rotation part of (B, 4, 4) or (B, 3, 3) matrices to (B, 4) unit quaternions (w, x, y, z).
+    Scale is removed by normalizing the matrix axes first.
+    """
+    m = matrices[:, :3, :3] / np.linalg.norm(matrices[:, :3, :3], axis=1, keepdims=True)
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+    trace = m00 + m11 + m22
+
+    # Pick the numerically stable branch per matrix
+    case = np.argmax(np.stack([trace, m00, m11, m22], axis=1), axis=1)
+    quats = np.empty((len(m), 4), dtype=np.float64)
+
+    c = case == 0
+    s = np.sqrt(1.0 + trace[c]) * 2.0
+    quats[c] = np.stack([0.25 * s, (m21[c] - m12[c]) / s, (m02[c] - m20[c]) / s, (m10[c] - m01[c]) / s], axis=1)
+    c = case == 1
+    s = np.sqrt(1.0 + m00[c] - m11[c] - m22[c]) * 2.0
+    quats[c] = np.stack([(m21[c] - m12[c]) / s, 0.25 * s, (m01[c] + m10[c]) / s, (m02[c] + m20[c]) / s], axis=1)
+    c = case == 2
+    s = np.sqrt(1.0 + m11[c] - m00[c] - m22[c]) * 2.0
+    quats[c] = np.stack([(m02[c] - m20[c]) / s, (m01[c] + m10[c]) / s, 0.25 * s, (m12[c] + m21[c]) / s], axis=1)
+    c = case == 3
+    s = np.sqrt(1.0 + m22[c] - m00[c] - m11[c]) * 2.0
+    quats[c] = np.stack([(m10[c] - m01[c]) / s, (m02[c] + m20[c]) / s, (m12[c] + m21[c]) / s, 0.25 * s], axis=1)
+
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def matrices_to_dual_quaternions(palette):
+    """
+    Convert a (B, 4, 4) bone palette to (B, 8) dual quaternions.
+
+    Columns 0-3 hold the real (rotation) part (w, x, y, z),
+    columns 4-7 the dual (translation) part 0.5 * (0, t) @ real.
+    """
+    real = matrices_to_quaternions(palette)
+    t = palette[:, :3, 3]
+    w, v = real[:, :1], real[:, 1:]
+    dual_w = -0.5 * np.sum(t * v, axis=1, keepdims=True)
+    dual_v = 0.5 * (w * t + np.cross(t, v))
+    return np.concatenate([real, dual_w, dual_v], axis=1)
+
+
+def blend_dual_quaternions(indices, weights, dq_palette):
+    """
+    Blend the dual quaternion palette for all vertices at once.
+
+    indices, weights: (N, K) influence layout.
+    dq_palette: (B, 8) bone dual quaternions.
+    Returns (N, 8) blended dual quaternions normalized by the magnitude of their real part.
+    Each influence is flipped into the hemisphere of the vertex's heaviest bone (antipodality),
+    and vertices without weights get the identity.
+    """
+    weights = weights.astype(np.float32, copy=False)
+    dq_palette = dq_palette.astype(np.float32)
+    rows = np.arange(len(indices))
+    pivot = dq_palette[indices[rows, np.argmax(weights, axis=1)], :4]
+
+    blended = np.zeros((len(indices), 8), dtype=np.float32)
+    for k in range(indices.shape[1]):
+        dq = dq_palette[indices[:, k]]
+        sign = np.where(np.sum(dq[:, :4] * pivot, axis=1) < 0.0, -1.0, 1.0).astype(np.float32)
+        blended += (weights[:, k] * sign)[:, None] * dq
+
+    # Unweighted vertices keep their rest position
+    blended[:, 0] += 1.0 - weights.sum(axis=1)
+
+    magnitude = np.linalg.norm(blended[:, :4], axis=1, keepdims=True)
+    return blended / np.where(magnitude > 0, magnitude, 1.0)
+
+
+def rotate_by_quaternions(quats, vectors):
+    """Rotate (N, 3) vectors by (N, 4) unit quaternions (w, x, y, z)."""
+    w, v = quats[:, :1], quats[:, 1:]
+    uv = np.cross(v, vectors)
+    return vectors + 2.0 * (w * uv + np.cross(v, uv))
+
+
+def apply_dual_quaternions(blended, points):
+    """Transform (N, 3) points by (N, 8) normalized dual quaternions without building matrices."""
+    real_w, real_v = blended[:, :1], blended[:, 1:4]
+    dual_w, dual_v = blended[:, 4:5], blended[:, 5:]
+    # Translation t = 2 * dual @ conjugate(real)
+    translation = 2.0 * (real_w * dual_v - dual_w * real_v + np.cross(real_v, dual_v))
+    return rotate_by_quaternions(blended[:, :4], points) + translation
+
+
+def dual_quaternion_skinning(rest_positions, indices, weights, dq_palette):
+    """Dual Quaternion Skinning of (N, 3) rest positions with a (B, 8) dual quaternion palette."""
+    return apply_dual_quaternions(blend_dual_quaternions(indices, weights, dq_palette), rest_positions)
+
+
+def skin_with_normals(method, rest_positions, rest_normals, indices, weights, palette):
+    """
+    Skin positions and normals in the same batched pass.
+    LBS transforms normals by the inverse transpose of the blended matrices,
+    DQS rotates them by the blended rotation quaternion.
+    Returns (positions, normals); normals is None if rest_normals is None.
+    """
+    if rest_normals is None:
+        return skin(method, rest_positions, indices, weights, palette), None
+    if method == "lbs":
+        blended = blend_matrices(indices, weights, palette)
+        return apply_matrices(blended, rest_positions), apply_matrices_to_normals(blended, rest_normals)
+    if method == "dqs":
+        blended = blend_dual_quaternions(indices, weights, matrices_to_dual_quaternions(palette))
+        return apply_dual_quaternions(blended, rest_positions), rotate_by_quaternions(blended[:, :4], rest_normals)
+    raise ValueError(f"Unknown skinning method '{method}'.")
+
+
+def skin(method, rest_positions, indices, weights, palette):
+    """Skin (N, 3) rest positions with a (B, 4, 4) palette using "lbs" or "dqs"."""
+    if method == "lbs":
+        return linear_blend_skinning(rest_positions, indices, weights, palette)
+    if method == "dqs":
+        return dual_quaternion_skinning(rest_positions, indices, weights, matrices_to_dual_quaternions(palette))
+    raise ValueError(f"Unknown skinning method '{method}'.")
+
+
+def skin_mesh_data(method, mesh_data, indices, weights, palette):
+    """Skin a rest-pose MeshData (utils/mesh_data.py); returns a copy with the skinned positions."""
+    return mesh_data.copy(positions=skin(method, mesh_data.positions, indices, weights, palette))
+
+
+class IncrementalSkinner:
+    """
+    Re-skins only the vertices influenced by bones whose matrices changed since the last pose.
+
+    Keeps the last bone palette, the last skinned positions and an inverted index
+    from each bone to the vertices it influences, so a pose edit costs O(affected vertices).
+    """
+    def __init__(self, rest_positions, indices, weights, method="lbs", tolerance=1e-6, rest_normals=None):
+        self.rest_positions = rest_positions
+        self.rest_normals = rest_normals
+        self.indices = indices
+        self.weights = weights
+        self.method = method
+        self.tolerance = tolerance
+        self.palette = None
+        self.positions = np.array(rest_positions, dtype=np.float32)
+        self.normals = None if rest_normals is None else np.array(rest_normals, dtype=np.float32)
+
+        # Inverted index bone -> vertices as CSR (offsets, vertices)
+        rows, slots = np.nonzero(weights > 0)
+        bones = indices[rows, slots].astype(np.int64)
+        order = np.argsort(bones, kind="stable")
+        num_bones = int(indices.max(initial=0)) + 1
+        self.bone_offsets = np.concatenate(([0], np.cumsum(np.bincount(bones, minlength=num_bones))))
+        self.bone_vertices = rows[order]
+
+    def dirty_vertices(self, palette):
+        """
+        Bones whose matrix changed beyond the tolerance since their vertices were last skinned, and the
+        vertices they touch. Returns (changed, dirty); changed is None when everything is re-skinned.
+        """
+        if self.palette is None or len(palette) != len(self.palette):
+            return None, np.arange(len(self.rest_positions))
+        delta = np.abs(palette - self.palette).max(axis=(1, 2))
+        changed = np.flatnonzero(delta > self.tolerance)
+        changed = changed[changed < len(self.bone_offsets) - 1]
+        if len(changed) == 0:
+            return changed, np.empty(0, dtype=np.int64)
+        return changed, np.unique(np.concatenate([self.bone_vertices[self.bone_offsets[b]:self.bone_offsets[b + 1]]
+                                                  for b in changed]))
+
+    def skin(self, palette):
+        """
+        Update the skinned positions (and normals, if rest normals were given) for a new palette.
+        Returns (positions, dirty): all (N, 3) positions and the indices of the recomputed vertices.
+        """
+        changed, dirty = self.dirty_vertices(palette)
+        if len(dirty) > 0:
+            rest_normals = None if self.rest_normals is None else self.rest_normals[dirty]
+            positions, normals = skin_with_normals(self.method, self.rest_positions[dirty], rest_normals,
+                                                   self.indices[dirty], self.weights[dirty], palette)
+            self.positions[dirty] = positions
+            if normals is not None:
+                self.normals[dirty] = normals
+        # Only the re-skinned bones take the new matrices, so a bone moving below the tolerance on every
+        # edit still accumulates its change against the matrix its vertices were skinned with
+        if changed is None:
+            self.palette = np.array(palette, copy=True)
+        else:
+            self.palette[changed] = palette[changed]
+        return self.positions, dirty
+
+
+def action_frames(armature):
+    """Return the frame range of the armature's action as a range of ints."""
+    action = armature.animation_data.action if armature.animation_data else None
+    if action is None:
+        raise ValueError(f"Armature '{armature.name}' has no action to bake.")
+    start, end = action.frame_range
+    return range(int(round(start)), int(round(end)) + 1)
+
+
+def bake_frames(scene, armature, bone_names, frames, skin_pose, cache, normals_cache=None):
+    """
+    Skin every frame from the rest pose and stream the results into a cache.
+
+    scene: The scene used to evaluate the armature at each frame.
+    frames: Frames to bake, in cache order.
+    skin_pose: Callable mapping a (B, 4, 4) bone palette to (positions, normals), both (N, 3).
+    cache: Writable (F, N, 3) array, e.g. a memory-mapped point cache.
+    normals_cache: Optional writable (F, N, 3) array for the skinned normals.
+    """
+    current_frame = scene.frame_current
+    try:
+        for i, frame in enumerate(frames):
+            scene.frame_set(frame)
+            positions, normals = skin_pose(build_palette(armature, bone_names))
+            cache[i] = positions
+            if normals_cache is not None:
+                normals_cache[i] = normals
+    finally:
+        scene.frame_set(current_frame)
+    for array in (cache, normals_cache):
+        if hasattr(array, "flush"):
+            array.flush()
+
+
+def collect_palettes(scene, armature, bone_names, frames):
+    """Evaluate the armature at every frame and return the (F, B, 4, 4) bone palettes."""
+    current_frame = scene.frame_current
+    try:
+        palettes = np.empty((len(frames), len(bone_names), 4, 4), dtype=np.float64)
+        for i, frame in enumerate(frames):
+            scene.frame_set(frame)
+            palettes[i] = build_palette(armature, bone_names)
+    finally:
+        scene.frame_set(current_frame)
+    return palettes
+
+
+def attach_point_cache(obj, filepath, start_frame):
+    """Play a PC2 file back on the object with a Mesh Cache modifier, starting at start_frame."""
+    modifier = obj.modifiers.get(CACHE_MODIFIER_NAME)
+    if modifier is None:
+        modifier = obj.modifiers.new(CACHE_MODIFIER_NAME, 'MESH_CACHE')
+    modifier.cache_format = 'PC2'
+    modifier.filepath = filepath
+    modifier.play_mode = 'SCENE'
+    modifier.time_mode = 'FRAME'
+    modifier.frame_start = start_frame
+    modifier.frame_scale = 1.0
+    return modifier
+
+
+def start_live_skinning(obj, armature, bone_names, skinner):
+    """
+    Re-skin the object whenever the armature pose changes.
+    Replaces the handler registered by a previous run; returns the registered handler.
+    """
+    import bpy
+
+    stop_live_skinning(obj)
+
+    def on_depsgraph_update(scene, depsgraph=None):
+        positions, dirty = skinner.skin(build_palette(armature, bone_names))
+        # Writing the mesh triggers another update, which finds no changed bones and returns here
+        if len(dirty) > 0:
+            write_positions(obj.data, positions)
+            if skinner.normals is not None:
+                write_normals(obj.data, skinner.normals)
+
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.driver_namespace[f"live_skinning:{obj.name}"] = on_depsgraph_update
+    return on_depsgraph_update
+
+
+def stop_live_skinning(obj):
+    """Unregister the live skinning handler of the object, if any."""
+    import bpy
+
+    handler = bpy.app.driver_namespace.pop(f"live_skinning:{obj.name}", None)
+    if handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(handler)
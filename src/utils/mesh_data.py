@@ -0,0 +1,300 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: mesh_data.py
+description: Blender-independent mesh container.
+MeshData holds the vertex positions, the faces as CSR (face_offsets + face_indices), the unique edges and
+named attributes as NumPy arrays, so skinning, weighting, subdivision and smoothing run on plain arrays,
+outside Blender or on headless nodes. from_blender / to_blender are thin adapters that move the data in bulk
+with foreach_get / foreach_set; they are the only place bpy is touched, and it is imported lazily.
+
+how to use:
+    mesh_data = MeshData.from_blender(obj.data, attribute_names=["color"])
+    ... run array code on mesh_data.positions, mesh_data.vertex_adjacency(), ...
+    mesh_data.to_blender(obj.data)
+'''
+
+import numpy as np
+
+# foreach_get property and number of components for every Blender attribute data type
+ATTRIBUTE_LAYOUTS = {
+    'FLOAT': ("value", 1, np.float32),
+    'INT': ("value", 1, np.int32),
+    'INT8': ("value", 1, np.int32),
+    'BOOLEAN': ("value", 1, bool),
+    'FLOAT2': ("vector", 2, np.float32),
+    'INT32_2D': ("value", 2, np.int32),
+    'FLOAT_VECTOR': ("vector", 3, np.float32),
+    'FLOAT_COLOR': ("color", 4, np.float32),
+    'BYTE_COLOR': ("color", 4, np.float32),
+    'QUATERNION': ("value", 4, np.float32),
+}
+# Data types whose values can be interpolated (colors, UV maps, float layers)
+FLOAT_DATA_TYPES = ('FLOAT', 'FLOAT2', 'FLOAT_VECTOR', 'FLOAT_COLOR', 'BYTE_COLOR')
+
+
+class MeshData:
+    """
+    Polygon mesh stored as NumPy arrays.
+
+    positions: (N, 3) float64 vertex positions.
+    face_offsets: (F + 1,) int64; the corners of face f are face_indices[face_offsets[f]:face_offsets[f + 1]].
+    face_indices: (L,) int64 vertex index of every face corner.
+    edges: (E, 2) int64 unique edges; derived from the faces (in order of first occurrence) if None.
+    attributes: Named arrays whose first axis runs over the elements of their domain.
+    attribute_domains: Domain of every attribute: 'POINT', 'EDGE', 'FACE' or 'CORNER' (default 'POINT').
+    """
+    def __init__(self, positions, face_offsets, face_indices, edges=None, attributes=None, attribute_domains=None):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.face_offsets = np.asarray(face_offsets, dtype=np.int64)
+        self.face_indices = np.asarray(face_indices, dtype=np.int64)
+        self.edges = face_edges(self.face_offsets, self.face_indices) if edges is None \
+            else np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.attributes = dict(attributes or {})
+        self.attribute_domains = {name: 'POINT' for name in self.attributes}
+        self.attribute_domains.update(attribute_domains or {})
+        self._adjacency = None
+
+    @classmethod
+    def from_faces(cls, positions, faces, **kwargs):
+        """Build from a list of faces, each a sequence of vertex indices."""
+        sizes = np.array([len(face) for face in faces], dtype=np.int64)
+        offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        indices = np.fromiter((v for face in faces for v in face), dtype=np.int64, count=int(offsets[-1]))
+        return cls(positions, offsets, indices, **kwargs)
+
+    @property
+    def num_vertices(self):
+        return len(self.positions)
+
+    @property
+    def num_faces(self):
+        return len(self.face_offsets) - 1
+
+    @property
+    def num_corners(self):
+        return len(self.face_indices)
+
+    @property
+    def face_sizes(self):
+        return np.diff(self.face_offsets)
+
+    def domain_size(self, domain):
+        return {'POINT': self.num_vertices, 'EDGE': len(self.edges),
+                'FACE': self.num_faces, 'CORNER': self.num_corners}[domain]
+
+    def set_attribute(self, name, values, domain='POINT'):
+        values = np.asarray(values)
+        if len(values) != self.domain_size(domain):
+            raise ValueError(f"Attribute '{name}' has {len(values)} values, the {domain} domain has {self.domain_size(domain)}.")
+        self.attributes[name] = values
+        self.attribute_domains[name] = domain
+
+    def copy(self, positions=None):
+        """Copy the mesh, optionally with new positions; topology arrays are shared, attributes are copied."""
+        mesh = MeshData(self.positions.copy() if positions is None else positions, self.face_offsets,
+                        self.face_indices, self.edges,
+                        {name: values.copy() for name, values in self.attributes.items()}, self.attribute_domains)
+        mesh._adjacency = self._adjacency
+        return mesh
+
+    # ------------------------------------------------------------------ topology
+
+    def corner_faces(self):
+        """(L,) face index of every corner."""
+        return np.repeat(np.arange(self.num_faces, dtype=np.int64), self.face_sizes)
+
+    def corner_next(self):
+        """(L,) index of the next corner of the same face (wrapping around)."""
+        following = np.arange(1, self.num_corners + 1, dtype=np.int64)
+        following[self.face_offsets[1:] - 1] = self.face_offsets[:-1]
+        return following
+
+    def triangles(self):
+        """(T, 3) fan triangulation of the faces: (first, i, i + 1) for every inner corner i of each face."""
+        inner = np.ones(self.num_corners, dtype=bool)
+        inner[self.face_offsets[:-1]] = False
+        inner[self.face_offsets[1:] - 1] = False
+        corners = np.flatnonzero(inner)
+        first = self.face_offsets[:-1][self.corner_faces()[corners]]
+        return np.stack([self.face_indices[first], self.face_indices[corners], self.face_indices[corners + 1]], axis=1)
+
+    def edge_face_counts(self):
+        """(E,) number of faces using every edge."""
+        keys = _edge_keys(self.edges, self.num_vertices)
+        corner_keys = _edge_keys(np.stack([self.face_indices, self.face_indices[self.corner_next()]], axis=1),
+                                 self.num_vertices)
+        order = np.argsort(keys)
+        slots = order[np.clip(np.searchsorted(keys[order], corner_keys), 0, len(keys) - 1)]
+        found = keys[slots] == corner_keys
+        return np.bincount(slots[found], minlength=len(self.edges))
+
+    def boundary_vertices(self):
+        """(N,) bool mask of vertices on an edge used by exactly one face."""
+        mask = np.zeros(self.num_vertices, dtype=bool)
+        mask[self.edges[self.edge_face_counts() == 1].ravel()] = True
+        return mask
+
+    def vertex_adjacency(self):
+        """
+        Vertex neighbors along the edges as CSR, computed once.
+        Returns (offsets, neighbors); the neighbors of vertex v are neighbors[offsets[v]:offsets[v + 1]].
+        """
+        if self._adjacency is None:
+            self._adjacency = adjacency_from_edges(self.edges, self.num_vertices)
+        return self._adjacency
+
+    # ------------------------------------------------------------------ geometry
+
+    def face_normals(self):
+        """(F, 3) unit face normals (Newell's method, so n-gons need not be planar)."""
+        current = self.positions[self.face_indices]
+        following = self.positions[self.face_indices[self.corner_next()]]
+        corner_terms = np.cross(current, following)
+        normals = np.zeros((self.num_faces, 3))
+        for axis in range(3):
+            normals[:, axis] = np.bincount(self.corner_faces(), weights=corner_terms[:, axis], minlength=self.num_faces)
+        return _normalized(normals)
+
+    def vertex_normals(self):
+        """(N, 3) unit vertex normals, the face normals weighted by the corner angles like Blender."""
+        following = self.corner_next()
+        previous = np.empty_like(following)
+        previous[following] = np.arange(self.num_corners)
+        to_next = _normalized(self.positions[self.face_indices[following]] - self.positions[self.face_indices])
+        to_previous = _normalized(self.positions[self.face_indices[previous]] - self.positions[self.face_indices])
+        angles = np.arccos(np.clip(np.sum(to_next * to_previous, axis=1), -1.0, 1.0))
+
+        corner_normals = self.face_normals()[self.corner_faces()] * angles[:, None]
+        normals = np.zeros((self.num_vertices, 3))
+        for axis in range(3):
+            normals[:, axis] = np.bincount(self.face_indices, weights=corner_normals[:, axis], minlength=self.num_vertices)
+        return _normalized(normals)
+
+    # ------------------------------------------------------------------ Blender adapters
+
+    @classmethod
+    def from_blender(cls, mesh, attribute_names=()):
+        """
+        Read a bpy.types.Mesh in bulk.
+
+        attribute_names: Names of mesh attributes to read as well, any domain and data type of ATTRIBUTE_LAYOUTS.
+        """
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", positions)
+        face_offsets = np.empty(len(mesh.polygons) + 1, dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", face_offsets[:-1])
+        face_offsets[-1] = len(mesh.loops)
+        face_indices = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", face_indices)
+        edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", edges)
+
+        attributes, domains = {}, {}
+        for name in attribute_names:
+            attribute = mesh.attributes[name]
+            prop, components, dtype = ATTRIBUTE_LAYOUTS[attribute.data_type]
+            values = np.empty(len(attribute.data) * components, dtype=dtype)
+            attribute.data.foreach_get(prop, values)
+            attributes[name] = values.reshape(-1, components) if components > 1 else values
+            domains[name] = attribute.domain
+        return cls(positions, face_offsets, face_indices, edges, attributes, domains)
+
+    def to_blender(self, mesh):
+        """
+        Write into a bpy.types.Mesh in bulk.
+        If the vertex, corner and face counts match, only positions and attributes are written;
+        otherwise the geometry is rebuilt and Blender recomputes the edges.
+        """
+        import bpy
+
+        same_topology = (len(mesh.vertices) == self.num_vertices and len(mesh.loops) == self.num_corners
+                         and len(mesh.polygons) == self.num_faces)
+        if not same_topology:
+            mesh.clear_geometry()
+            mesh.vertices.add(self.num_vertices)
+            mesh.loops.add(self.num_corners)
+            mesh.polygons.add(self.num_faces)
+            mesh.loops.foreach_set("vertex_index", self.face_indices.astype(np.int32))
+            mesh.polygons.foreach_set("loop_start", self.face_offsets[:-1].astype(np.int32))
+            # loop_total is derived from loop_start and read-only since Blender 4.0
+            if bpy.app.version < (4, 0, 0):
+                mesh.polygons.foreach_set("loop_total", self.face_sizes.astype(np.int32))
+        mesh.vertices.foreach_set("co", self.positions.astype(np.float32).ravel())
+        if not same_topology:
+            mesh.update(calc_edges=True)
+
+        for name, values in self.attributes.items():
+            domain = self.attribute_domains[name]
+            if domain == 'EDGE' and not same_topology:
+                continue
+            data_type = _attribute_data_type(values)
+            attribute = mesh.attributes.get(name)
+            if attribute is not None and (attribute.domain != domain or attribute.data_type != data_type):
+                mesh.attributes.remove(attribute)
+                attribute = None
+            if attribute is None:
+                attribute = mesh.attributes.new(name, data_type, domain)
+            prop, _, dtype = ATTRIBUTE_LAYOUTS[data_type]
+            attribute.data.foreach_set(prop, np.ascontiguousarray(values, dtype=dtype).ravel())
+        mesh.update()
+
+
+def float_attribute_names(mesh, domains=('POINT', 'CORNER')):
+    """Names of the float attributes of a bpy.types.Mesh in the given domains, without positions and internal layers."""
+    return [attribute.name for attribute in mesh.attributes
+            if attribute.domain in domains and attribute.data_type in FLOAT_DATA_TYPES
+            and attribute.name != "position" and not attribute.name.startswith(".")]
+
+
+def update_attribute(mesh, name, elements, values):
+    """Overwrite the values of some elements (vertices, corners, ...) of an existing mesh attribute in bulk."""
+    attribute = mesh.attributes[name]
+    prop, components, dtype = ATTRIBUTE_LAYOUTS[attribute.data_type]
+    current = np.empty(len(attribute.data) * components, dtype=dtype)
+    attribute.data.foreach_get(prop, current)
+    current = current.reshape(len(attribute.data), -1)
+    current[elements] = np.asarray(values).reshape(len(current[elements]), -1)
+    attribute.data.foreach_set(prop, current.ravel())
+
+
+def _normalized(vectors):
+    length = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(length > 0, length, 1.0)
+
+
+def _edge_keys(edges, num_vertices):
+    """Order-independent int64 key of every (v0, v1) edge."""
+    return np.minimum(edges[:, 0], edges[:, 1]) * num_vertices + np.maximum(edges[:, 0], edges[:, 1])
+
+
+def _attribute_data_type(values):
+    components = 1 if values.ndim == 1 else values.shape[1]
+    if values.dtype == bool:
+        return 'BOOLEAN'
+    if np.issubdtype(values.dtype, np.integer):
+        return {1: 'INT', 2: 'INT32_2D'}[components]
+    return {1: 'FLOAT', 2: 'FLOAT2', 3: 'FLOAT_VECTOR', 4: 'FLOAT_COLOR'}[components]
+
+
+def face_edges(face_offsets, face_indices):
+    """Unique undirected (E, 2) edges of the faces, in order of first occurrence around the faces."""
+    if len(face_indices) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    following = np.arange(1, len(face_indices) + 1, dtype=np.int64)
+    following[face_offsets[1:] - 1] = face_offsets[:-1]
+    corner_edges = np.stack([face_indices, face_indices[following]], axis=1)
+    _, first = np.unique(_edge_keys(corner_edges, int(face_indices.max()) + 1), return_index=True)
+    return corner_edges[np.sort(first)]
+
+
+def adjacency_from_edges(edges, num_vertices):
+    """Vertex adjacency CSR (offsets, neighbors) of an undirected (E, 2) edge list."""
+    sources = np.concatenate([edges[:, 0], edges[:, 1]])
+    targets = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.argsort(sources, kind="stable")
+    offsets = np.zeros(num_vertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_vertices), out=offsets[1:])
+    return offsets, targets[order]
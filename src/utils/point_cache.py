@@ -0,0 +1,58 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: point_cache.py
+description: Read and write PC2 point caches as memory-mapped (F, N, 3) float32 arrays.
+A PC2 file is a 32-byte header followed by the raw float32 positions of every frame,
+so the whole cache is mapped once and frames are streamed into it without holding the clip in memory.
+Blender plays PC2 files back with the Mesh Cache modifier.
+This module does not import bpy.
+'''
+
+import struct
+import numpy as np
+
+PC2_SIGNATURE = b"POINTCACHE2\0"
+PC2_VERSION = 1
+# signature, version, number of points, start frame, sample rate, number of samples
+PC2_HEADER = struct.Struct("<12siiffi")
+
+
+def create_point_cache(filepath, num_points, num_frames, start_frame=0.0, sample_rate=1.0):
+    """
+    Create a PC2 file and map its frames for writing.
+
+    filepath: Path of the .pc2 file (created or overwritten).
+    num_points: Number of vertices per frame.
+    num_frames: Number of frames in the cache.
+    start_frame: First frame the cache plays at.
+    sample_rate: Frame step between two samples.
+    Returns a writable (F, N, 3) float32 memmap backed by the file.
+    """
+    with open(filepath, "wb") as f:
+        f.write(PC2_HEADER.pack(PC2_SIGNATURE, PC2_VERSION, num_points, start_frame, sample_rate, num_frames))
+        f.truncate(PC2_HEADER.size + num_frames * num_points * 3 * 4)
+    return np.memmap(filepath, dtype="<f4", mode="r+", offset=PC2_HEADER.size, shape=(num_frames, num_points, 3))
+
+
+def open_point_cache(filepath, mode="r"):
+    """
+    Map an existing PC2 file.
+
+    Returns (frames, start_frame, sample_rate) where frames is an (F, N, 3) float32 memmap.
+    """
+    with open(filepath, "rb") as f:
+        signature, _, num_points, start_frame, sample_rate, num_frames = PC2_HEADER.unpack(f.read(PC2_HEADER.size))
+    if signature != PC2_SIGNATURE:
+        raise ValueError(f"'{filepath}' is not a PC2 point cache.")
+    frames = np.memmap(filepath, dtype="<f4", mode=mode, offset=PC2_HEADER.size, shape=(num_frames, num_points, 3))
+    return frames, start_frame, sample_rate
+
+
+def create_normal_cache(filepath, num_points, num_frames):
+    """
+    Create a .npy file holding (F, N, 3) float32 per-frame normals and map it for writing.
+    The file loads with np.load(filepath, mmap_mode="r").
+    """
+    return np.lib.format.open_memmap(filepath, mode="w+", dtype="<f4", shape=(num_frames, num_points, 3))
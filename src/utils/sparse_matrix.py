@@ -0,0 +1,117 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: sparse_matrix.py
+description: Minimal compressed sparse row (CSR) matrix on NumPy.
+Blender's Python ships NumPy but not SciPy, so sparse operators (smoothing, subdivision stencils, ...)
+are stored with this class: built from (row, column, value) triplets, multiplied with dense (N, C) arrays
+(one product per iteration instead of per-vertex Python loops) and with other CSR matrices to compose operators.
+The entries of a row are summed in their stored order, so results are reproducible.
+This module does not import bpy.
+
+how to use:
+    operator = CSRMatrix.from_coo(rows, cols, values, shape=(N, N))
+    smoothed = operator @ weights        # (N, G) dense
+    composed = operator @ operator       # CSRMatrix
+'''
+
+import numpy as np
+
+
+class CSRMatrix:
+    """
+    Sparse matrix in CSR layout.
+
+    indptr: (R + 1,) int64; the entries of row r are indices/data[indptr[r]:indptr[r + 1]].
+    indices: (nnz,) int64 column of every entry.
+    data: (nnz,) value of every entry.
+    shape: (R, C).
+    """
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data)
+        self.shape = (int(shape[0]), int(shape[1]))
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape, sum_duplicates=False):
+        """
+        Build from triplets.
+        Entries keep their given order inside a row; with sum_duplicates, rows are sorted by column
+        and repeated (row, column) entries are added up.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values)
+        if sum_duplicates and len(rows):
+            order = np.lexsort((cols, rows))
+            rows, cols, values = rows[order], cols[order], values[order]
+            first = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+            values = np.add.reduceat(values, first)
+            rows, cols = rows[first], cols[first]
+        else:
+            order = np.argsort(rows, kind="stable")
+            rows, cols, values = rows[order], cols[order], values[order]
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, cols, values, shape)
+
+    @classmethod
+    def identity(cls, size, dtype=np.float64):
+        return cls(np.arange(size + 1), np.arange(size), np.ones(size, dtype=dtype), (size, size))
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def row_counts(self):
+        """(R,) number of stored entries in every row."""
+        return np.diff(self.indptr)
+
+    def row_ids(self):
+        """(nnz,) row of every entry."""
+        return np.repeat(np.arange(self.shape[0], dtype=np.int64), self.row_counts())
+
+    def row_sums(self):
+        return np.bincount(self.row_ids(), weights=self.data, minlength=self.shape[0])
+
+    def scale_rows(self, factors):
+        """Return a copy with every row multiplied by its factor, e.g. 1 / row_sums() to row-normalize."""
+        return CSRMatrix(self.indptr, self.indices, self.data * np.repeat(factors, self.row_counts()), self.shape)
+
+    def transpose(self):
+        return CSRMatrix.from_coo(self.indices, self.row_ids(), self.data, (self.shape[1], self.shape[0]))
+
+    def toarray(self):
+        dense = np.zeros(self.shape, dtype=self.data.dtype)
+        np.add.at(dense, (self.row_ids(), self.indices), self.data)
+        return dense
+
+    def dot(self, dense):
+        """Product with a dense (C,) or (C, K) array."""
+        dense = np.asarray(dense)
+        products = self.data.reshape((-1,) + (1,) * (dense.ndim - 1)) * dense[self.indices]
+        result = np.zeros((self.shape[0],) + dense.shape[1:], dtype=products.dtype)
+        filled = self.row_counts() > 0
+        if filled.any():
+            # reduceat adds the entries of every row in their stored order
+            result[filled] = np.add.reduceat(products, self.indptr[:-1][filled], axis=0)
+        return result
+
+    def matmul(self, other):
+        """Product with another CSRMatrix, as a CSRMatrix."""
+        if self.shape[1] != other.shape[0]:
+            raise ValueError(f"Cannot multiply {self.shape} by {other.shape}.")
+        # Every entry (i, k) of self meets every entry (k, j) of other
+        counts = other.row_counts()[self.indices]
+        rows = np.repeat(self.row_ids(), counts)
+        entries = np.repeat(other.indptr[self.indices] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        values = np.repeat(self.data, counts) * other.data[entries]
+        return CSRMatrix.from_coo(rows, other.indices[entries], values, (self.shape[0], other.shape[1]),
+                                  sum_duplicates=True)
+
+    def __matmul__(self, other):
+        if isinstance(other, CSRMatrix):
+            return self.matmul(other)
+        return self.dot(other)
@@ -0,0 +1,116 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: vertex_group_io.py
+description: Bulk vertex group reads and writes shared by the weighting and skinning scripts.
+All memberships of all vertex groups are read in a single pass over the vertices into sparse (vertex, group, weight)
+triplets, or an (N, G) CSRMatrix. Writes clamp the weights to [0, 1], round them to float32 like Blender stores them,
+and issue one vgroup.add call per distinct value of a group; vertices whose weight becomes 0 are removed from the
+group with one vgroup.remove call. Every write batch drops the skinning influences stored on the mesh once (see
+skinning/influences.py), so the skinning scripts rebuild them from the new weights; callers of the single-group
+write_group_weights call clear_influences themselves after their last group.
+This module does not import bpy.
+
+how to use:
+    rows, groups, weights = read_group_triplets(mesh)
+    matrix = read_group_matrix(obj)                          # (N, G) CSRMatrix
+    write_sparse_weights(vgroups, num_vertices, rows, groups, weights)
+'''
+
+import numpy as np
+
+from sparse_matrix import CSRMatrix
+
+# Mesh data written by skinning/influences.py from the vertex group weights
+INFLUENCE_ATTRIBUTE_PREFIXES = ("skin_index_", "skin_weight_")
+INFLUENCE_BONES_PROPERTY = "skin_bones"
+
+
+def read_group_triplets(mesh):
+    """
+    Read every vertex group membership of a mesh in one pass.
+    Returns (rows, groups, weights) arrays: vertex index, vertex group index and float32 weight.
+    """
+    counts = np.empty(len(mesh.vertices), dtype=np.int64)
+    groups, weights = [], []
+    for i, vert in enumerate(mesh.vertices):
+        memberships = vert.groups
+        counts[i] = len(memberships)
+        for group in memberships:
+            groups.append(group.group)
+            weights.append(group.weight)
+    rows = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    return rows, np.asarray(groups, dtype=np.int64), np.asarray(weights, dtype=np.float32)
+
+
+def read_group_matrix(obj):
+    """All vertex group weights of a mesh object as an (N, G) CSRMatrix, column g being the group of index g."""
+    num_groups = max((vgroup.index for vgroup in obj.vertex_groups), default=-1) + 1
+    rows, groups, weights = read_group_triplets(obj.data)
+    return CSRMatrix.from_coo(rows, groups, weights, (len(obj.data.vertices), num_groups))
+
+
+def clear_influences(mesh):
+    """Remove the skinning influences stored on the mesh, e.g. after the vertex group weights changed."""
+    for name in [attr.name for attr in mesh.attributes]:
+        if name.startswith(INFLUENCE_ATTRIBUTE_PREFIXES):
+            mesh.attributes.remove(mesh.attributes[name])
+    if INFLUENCE_BONES_PROPERTY in mesh:
+        del mesh[INFLUENCE_BONES_PROPERTY]
+
+
+def write_group_weights(vgroup, vertex_indices, weights):
+    """
+    Set the weights of vertices in a vertex group with one vgroup.add call per distinct value.
+    Weights are clamped to [0, 1] and rounded to float32 like Blender stores them, so more values coincide;
+    vertices whose weight is 0 are removed from the group. The skinning influences are not cleared here;
+    call clear_influences once after the last group.
+    """
+    vertex_indices = np.asarray(vertex_indices)
+    values = np.clip(np.asarray(weights, dtype=np.float32), 0.0, 1.0)
+    zero = values == 0
+    if zero.any():
+        vgroup.remove(vertex_indices[zero].tolist())
+        vertex_indices, values = vertex_indices[~zero], values[~zero]
+
+    order = np.argsort(values, kind="stable")
+    bounds = np.flatnonzero(np.diff(values[order])) + 1
+    for run in np.split(order, bounds):
+        if len(run):
+            vgroup.add(vertex_indices[run].tolist(), float(values[run[0]]), 'REPLACE')
+
+
+def write_sparse_weights(vgroups, num_vertices, rows, groups, weights):
+    """
+    Replace the weights of the vertex groups by sparse (vertex, group, weight) triplets.
+    groups index into vgroups; vertices without a triplet (or with weight 0) are removed from the group.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    order = np.argsort(groups, kind="stable")
+    rows, groups, weights = rows[order], groups[order], np.asarray(weights)[order]
+    bounds = np.searchsorted(groups, np.arange(len(vgroups) + 1))
+    for g, vgroup in enumerate(vgroups):
+        group_rows = rows[bounds[g]:bounds[g + 1]]
+        vgroup.remove(np.setdiff1d(np.arange(num_vertices), group_rows, assume_unique=True).tolist())
+        write_group_weights(vgroup, group_rows, weights[bounds[g]:bounds[g + 1]])
+    if len(vgroups):
+        clear_influences(vgroups[0].id_data.data)
+
+
+def write_group_matrix(vgroups, weights):
+    """
+    Replace the weights of the vertex groups by an (N, G) dense array or CSRMatrix, column g for vgroups[g].
+    Zero entries are removed from the groups. Raises ValueError when G differs from the number of groups.
+    """
+    if weights.shape[1] != len(vgroups):
+        raise ValueError(f"{weights.shape[1]} columns of weights for {len(vgroups)} vertex groups.")
+    if isinstance(weights, CSRMatrix):
+        rows, groups, values = weights.row_ids(), weights.indices, weights.data
+        num_vertices = weights.shape[0]
+    else:
+        rows, groups = np.nonzero(np.asarray(weights))
+        values = np.asarray(weights)[rows, groups]
+        num_vertices = len(weights)
+    write_sparse_weights(vgroups, num_vertices, rows, groups, values)
@@ -0,0 +1,101 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: cluster_engine.py
+description: Cluster-based weighting, the "cluster" method of distance-based-weighting.py.
+Every bone owns a few cluster centers seeded along its segment: one at its midpoint, and any extra ones on
+alternating sides of it.
+Mini-batch k-means moves the centers onto the vertices: each step assigns a random batch of vertices to the
+nearest center and moves every center towards the mean of its batch points with a per-center learning rate
+1 / (points seen), so a step costs O(batch x clusters) however large the mesh is.
+Each vertex then gets soft memberships from its distances to all centers, summed per owning bone.
+reference: Sculley, "Web-Scale K-Means Clustering", WWW 2010
+This module does not import bpy.
+
+how to use:
+    Imported by distance-based-weighting.py
+'''
+
+import numpy as np
+
+from weighting_engine import vertex_chunks
+
+
+def seed_centers(heads, tails, clusters_per_bone=1):
+    """
+    Cluster centers along every bone: the midpoint first, then the other k - 1 on alternating sides of it,
+    evenly spaced between the midpoint and the ends.
+    Returns ((B * k, 3) centers, (B * k,) owning bone).
+    """
+    extra = np.arange(1, clusters_per_bone)
+    step = 0.5 / (clusters_per_bone // 2 + 1)
+    t = np.concatenate([[0.5], 0.5 + np.where(extra % 2 == 1, 1.0, -1.0) * ((extra + 1) // 2) * step])
+    centers = heads[:, None, :] + t[None, :, None] * (tails - heads)[:, None, :]
+    owners = np.repeat(np.arange(len(heads)), clusters_per_bone)
+    return centers.reshape(-1, 3), owners
+
+
+def squared_distances(points, centers):
+    """(P, C) squared distances between points and centers."""
+    return (np.einsum("pi,pi->p", points, points)[:, None] - 2.0 * points @ centers.T
+            + np.einsum("ci,ci->c", centers, centers)[None, :]).clip(min=0.0)
+
+
+def minibatch_kmeans(points, centers, batch_size=4096, iterations=100, seed=0):
+    """
+    Mini-batch k-means from the given initial centers.
+    Returns the (C, 3) moved centers; centers that never receive a point stay where they were seeded.
+    """
+    rng = np.random.default_rng(seed)
+    centers = np.array(centers, dtype=np.float64)
+    seen = np.zeros(len(centers))
+    for _ in range(iterations):
+        batch = points[rng.integers(0, len(points), min(batch_size, len(points)))]
+        nearest = np.argmin(squared_distances(batch, centers), axis=1)
+        counts = np.bincount(nearest, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, nearest, batch)
+
+        hit = counts > 0
+        seen[hit] += counts[hit]
+        # Equivalent to moving a center towards each of its points in turn with rate 1 / seen
+        rate = counts[hit] / seen[hit]
+        centers[hit] += rate[:, None] * (sums[hit] / counts[hit, None] - centers[hit])
+    return centers
+
+
+def cluster_weights(points, heads, tails, clusters_per_bone=1, batch_size=4096, iterations=100, softness=0.05,
+                    min_weight=0.0, seed=0):
+    """
+    Soft bone weights from mini-batch k-means clusters owned by the bones.
+
+    softness: Distance scale of the soft assignment; the membership of a cluster falls off as
+              exp(-(d - d_nearest) / softness), normalized over all clusters.
+    min_weight: Weights below this are dropped.
+    Returns sparse (rows, bones, weights); the weights of a vertex sum to 1 before dropping.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    heads = np.asarray(heads, dtype=np.float64)
+    tails = np.asarray(tails, dtype=np.float64)
+    centers, owners = seed_centers(heads, tails, clusters_per_bone)
+    centers = minibatch_kmeans(points, centers, batch_size, iterations, seed)
+
+    ownership = np.eye(len(heads))[owners]
+
+    rows, bones, weights = [], [], []
+    for start, stop in vertex_chunks(len(points), len(centers)):
+        distances = np.sqrt(squared_distances(points[start:stop], centers))
+        memberships = np.exp(-(distances - distances.min(axis=1, keepdims=True)) / softness)
+        memberships /= memberships.sum(axis=1, keepdims=True)
+
+        # Sum the memberships of the clusters of every bone
+        bone_weights = memberships @ ownership
+        chunk_rows, chunk_bones = np.nonzero((bone_weights > 0) & (bone_weights >= min_weight))
+        rows.append(chunk_rows + start)
+        bones.append(chunk_bones)
+        weights.append(bone_weights[chunk_rows, chunk_bones])
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(rows), np.concatenate(bones), np.concatenate(weights)
@@ -4,7 +4,13 @@ Animating an object from single monocular video
 
 name: distance-based-weighting.py
 description: Assign weights to vertices based on the distance to bones
-ex) linear, sigmoid, exponential, noise
+ex) linear, sigmoid, exponential, noise, cluster, heat
+"cluster" clusters the vertices with mini-batch k-means around centers seeded on the bones and gives every
+vertex soft memberships of the bones owning the nearby clusters.
+"heat" diffuses each bone's heat over the surface (Baran & Popovic bone heat), so limbs close to each other
+(e.g. arms next to the torso) do not bleed into each other. It uses SciPy's sparse LU when SciPy is installed.
+With SWEEP = True, every combination of the SWEEP_* values is scored (coverage of the vertices minus the weight
+entropy) on one shared vertex-bone distance structure, and only the best one is written.
 
 how to use:
     1. Open Blender file
@@ -15,16 +21,27 @@ how to use:
 '''
 
 import bpy
-import bmesh
-from mathutils import Vector
-import math
+import os
+import sys
+import numpy as np
+from mathutils.bvhtree import BVHTree
+
+# Make the weighting engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "utils"))
+from mesh_data import MeshData
+from weighting_engine import sparse_distance_weights, sweep_candidates, sweep_distance_weights
+from vertex_group_io import write_sparse_weights
+from heat_engine import heat_weights
+from cluster_engine import cluster_weights
 
 ### ------------ TODO: Set up the parameters ------------- ###
 # mesh object, armature
 OBJECT_NAME = "jumpingjacks"
 ARMATURE_NAME = "metarig"
 
-# Method: ["linear", "sigmoid", "exponential", "noise", "cluster"]
+# Method: ["linear", "sigmoid", "exponential", "noise", "cluster", "heat"]
 SKINNING_METHOD = "exponential"
 
 # Parameters
@@ -36,6 +53,31 @@ WEIGHT_SHARPNESS = 10.0
 # Exponential weight function
 DECAY_FACTOR = 30.0
 
+# Cluster weight function: centers per bone (the bone midpoint first), mini-batch size and steps,
+# distance scale of the soft memberships
+CLUSTERS_PER_BONE = 2
+CLUSTER_BATCH_SIZE = 4096
+CLUSTER_ITERATIONS = 100
+CLUSTER_SOFTNESS = 0.05
+# Heat weight function: threads solving the bones in parallel
+HEAT_WORKERS = 1
+
+# Parameter sweep: try every combination of the values below and keep the best-scoring one
+# (replaces SKINNING_METHOD, INFLUENCE_RADIUS, WEIGHT_SHARPNESS, DECAY_FACTOR and the factor 4 of the bone factors)
+SWEEP = False
+SWEEP_METHODS = ["linear", "sigmoid", "exponential"]
+SWEEP_INFLUENCE_RADII = [0.1, 0.2, 0.3]
+SWEEP_WEIGHT_SHARPNESS = [5.0, 10.0, 20.0]
+SWEEP_DECAY_FACTORS = [15.0, 30.0, 60.0]
+SWEEP_FACTOR_SCALES = [2.0, 4.0, 6.0]
+# How much a spread-out (high entropy) weighting is penalized against covering every vertex
+SWEEP_ENTROPY_WEIGHT = 0.5
+SWEEP_WORKERS = 4
+
+# Weights below this are not written and the vertex is removed from the group (0 writes every weight)
+# Bones farther than the distance where the weight drops below it are skipped with a spatial grid
+MIN_WEIGHT = 1e-3
+
 # Bone-specific factors for weighting
 BONE_WEIGHT_FACTORS = {  
     "Hips": 2.0,
@@ -66,8 +108,6 @@ bpy.ops.object.mode_set(mode='OBJECT')
 
 # Access the mesh data
 mesh = obj.data
-bm = bmesh.new()
-bm.from_mesh(mesh)
 
 # Ensure vertex groups exist for each bone
 for bone in armature.pose.bones:
@@ -75,52 +115,75 @@ for bone in armature.pose.bones:
         obj.vertex_groups.new(name=bone.name)
 print(f"Vertex groups created for {len(armature.pose.bones)} bones")
 
+# World-space vertex positions, read in bulk
+matrix_world = np.array(obj.matrix_world)
+mesh_data = MeshData.from_blender(mesh)
+positions = mesh_data.positions @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+
+# World-space bone segments and the bone-specific weighting FACTOR of every bone
+bones = list(armature.pose.bones)
+heads = np.array([armature.matrix_world @ bone.head for bone in bones])
+tails = np.array([armature.matrix_world @ bone.tail for bone in bones])
+factors = np.array([BONE_WEIGHT_FACTORS.get(bone.name, 1.0) * 4 for bone in bones])
+vgroups = [obj.vertex_groups[bone.name] for bone in bones]
+
+def bone_visibility(positions, faces):
+    """
+    Ray test against the mesh: whether the segment from each point to its target on a bone is unobstructed.
+    heat_attachment asks for the nearest bone of every vertex first and for the next ones only while hidden;
+    the rays are set up with NumPy, so the loop only calls ray_cast.
+    """
+    bvh = BVHTree.FromPolygons(positions.tolist(), faces)
+    offset = 1e-4 * float(np.linalg.norm(positions.max(axis=0) - positions.min(axis=0)))
+
+    def is_visible(points, targets):
+        directions = targets - points
+        lengths = np.linalg.norm(directions, axis=1)
+        visible = np.ones(len(points), dtype=bool)
+        # Points closer to the bone than the offset see it without a ray
+        tested = np.flatnonzero(lengths > 2 * offset)
+        directions = directions[tested] / lengths[tested, None]
+        # Start slightly off the surface so the ray does not hit the vertex's own faces
+        origins = points[tested] + directions * offset
+        ray_cast = bvh.ray_cast
+        visible[tested] = [ray_cast(origin, direction, distance)[0] is None for origin, direction, distance
+                           in zip(origins.tolist(), directions.tolist(), (lengths[tested] - offset).tolist())]
+        return visible
+    return is_visible
+
 # Assign weights
-for bone in armature.pose.bones:
-    print(f"Processing bone: {bone.name}")
-    bone_head = armature.matrix_world @ bone.head
-    bone_tail = armature.matrix_world @ bone.tail
-    bone_vec = bone_tail - bone_head
-    
-    vgroup = obj.vertex_groups[bone.name]
-    for vert in mesh.vertices:
-        vertex_pos = obj.matrix_world @ Vector(vert.co)
-        
-        proj = (vertex_pos - bone_head).project(bone_vec)
-        closest_point_on_bone = bone_head + proj
-        
-        if proj.dot(bone_vec) < 0:
-            closest_point_on_bone = bone_head
-        elif proj.length > bone_vec.length:
-            closest_point_on_bone = bone_tail
-        
-        dist = (vertex_pos - closest_point_on_bone).length
-        
-        # Get the bone-specific weighting FACTOR
-        FACTOR = BONE_WEIGHT_FACTORS.get(bone.name, 1.0)*4
-        
-        weight : float = 0.0
-        # Weight functions
-        if SKINNING_METHOD == "linear":
-            weight = max(min_weight_threshold, (1.0 - (dist / INFLUENCE_RADIUS)) * FACTOR)
-        elif SKINNING_METHOD == "sigmoid":
-            weight = 1 / (1 + math.exp(WEIGHT_SHARPNESS * (dist - INFLUENCE_RADIUS / 2)))
-            weight = max(min_weight_threshold, weight * FACTOR)
-        elif SKINNING_METHOD == "exponential":
-            weight = max(min_weight_threshold, math.exp(-DECAY_FACTOR * dist) * FACTOR)
-        elif SKINNING_METHOD == "noise":
-            import random
-            noise_intensity = 0.5  # Maximum noise variation (0 to 1)
-            random.seed(42)
-            base_weight = max(min_weight_threshold, (1.0 - (dist / INFLUENCE_RADIUS)))
-            # Add noise
-            noise = random.uniform(-noise_intensity, noise_intensity)
-            weight = max(min_weight_threshold, base_weight + noise)
-        
-        # Assign weight
-        vgroup.add([vert.index], weight, 'REPLACE')
-            
-bm.free()
+if SWEEP:
+    # One distance structure for all candidates, scored in parallel
+    candidates = sweep_candidates(SWEEP_METHODS, SWEEP_INFLUENCE_RADII, SWEEP_WEIGHT_SHARPNESS,
+                                  SWEEP_DECAY_FACTORS, SWEEP_FACTOR_SCALES)
+    results, best = sweep_distance_weights(positions, heads, tails, factors / 4, candidates, MIN_WEIGHT,
+                                           min_weight_threshold, SWEEP_ENTROPY_WEIGHT, SWEEP_WORKERS)
+    if best is None:
+        raise ValueError("No sweep candidate produced weights above MIN_WEIGHT.")
+    scored = sorted((r for r in results if r[1] is not None), key=lambda r: r[1])
+    for candidate, score, coverage, entropy in scored:
+        print(f"  score {score:.4f} (coverage {coverage:.3f}, entropy {entropy:.3f}): {candidate}")
+    print(f"Best candidate: {scored[-1][0]}")
+    rows, bone_indices, weights = best
+elif SKINNING_METHOD == "heat":
+    # Cotangent Laplacian + heat matrix factorized once (SciPy LU or the NumPy block Cholesky),
+    # all bones solved as right-hand sides
+    faces = [mesh_data.face_indices[a:b].tolist() for a, b in zip(mesh_data.face_offsets[:-1], mesh_data.face_offsets[1:])]
+    rows, bone_indices, weights = heat_weights(positions, mesh_data.triangles(), heads, tails,
+                                               bone_visibility(positions, faces), workers=HEAT_WORKERS,
+                                               min_weight=MIN_WEIGHT)
+elif SKINNING_METHOD == "cluster":
+    # Mini-batch k-means seeded at the bones, then soft memberships from the cluster distances
+    rows, bone_indices, weights = cluster_weights(positions, heads, tails, CLUSTERS_PER_BONE, CLUSTER_BATCH_SIZE,
+                                                  CLUSTER_ITERATIONS, CLUSTER_SOFTNESS, MIN_WEIGHT)
+else:
+    # Sparse (vertex, bone, weight) triplets: only the bones near each vertex are evaluated
+    rows, bone_indices, weights = sparse_distance_weights(positions, heads, tails, SKINNING_METHOD, factors,
+                                                          INFLUENCE_RADIUS, WEIGHT_SHARPNESS, DECAY_FACTOR,
+                                                          MIN_WEIGHT, min_weight_threshold)
+print(f"{len(weights)} weights above {MIN_WEIGHT} ({len(weights) / max(len(positions) * len(bones), 1):.1%} of all pairs)")
+write_sparse_weights(vgroups, len(positions), rows, bone_indices, weights)
+
 mesh.update()
 
-print(f"{SKINNING_METHOD.capitalize()}-based weights assigned!")
\ No newline at end of file
+print(f"{'Sweep' if SWEEP else SKINNING_METHOD.capitalize()}-based weights assigned!")
\ No newline at end of file
@@ -4,24 +4,52 @@ Animating an object from single monocular video
 
 name: graph-distance-filtering.py
 description: Filters vertices in each bone's vertex group based on graph distance to the highest-weight vertex.
-Vertices that exceed a specified edge distance threshold from the highest-weight vertex will have their weight set to 0.
+Vertices that exceed a specified edge distance threshold from the highest-weight vertex are removed from the group.
+The mesh graph is built once as CSR arrays, all weights are read in one pass, and a single breadth-first search
+carries one bit per vertex group, so every group is searched at the same time.
+The "geodesic" mode measures the distance along the edges instead of counting them, so the filter does not
+change with the mesh resolution (e.g. after subdivision).
+ISLAND_FILTER also removes the parts of a group that are not connected to the rest (e.g. a hand group leaking
+onto the thigh), even if they lie within the distance threshold: the connected components of every group's
+support are labeled with one union-find over the mesh edges.
 
 how to use:
     1. Open the Blender file.
     2. Open the Python Console in Blender.
     3. Load this script into the Python Console.
     4. Adjust the parameters:
-        - `EDGE_THRESHOLD`: Maximum allowed edge distance from the highest-weight vertex.
+        - `FILTER_MODE`: "hops" counts edges, "geodesic" measures the edge lengths, "none" skips the distance filter.
+        - `EDGE_THRESHOLD`: Maximum allowed edge distance from the highest-weight vertex ("hops").
+        - `GEODESIC_RADIUS`: Maximum allowed distance along the edges, in object space units ("geodesic").
+        - `ISLAND_FILTER`: "peak" keeps the component containing the highest-weight vertex,
+          "mass" keeps the `KEEP_COMPONENTS` components with the largest total weight, None disables it.
+        - `ISLAND_EPSILON`: Weights above this form the support of a group.
         - `OBJECT_NAME`: Name of the mesh object to process.
     5. Run the script.
 '''
 
 import bpy
-import bmesh
-from mathutils import Vector
+import os
+import sys
 import time
-
+import numpy as np
+
+# Make the graph engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "utils"))
+from mesh_data import MeshData
+from graph_engine import group_peaks, bounded_bfs, has_bits, edge_lengths, bounded_geodesic, island_filter
+from vertex_group_io import read_group_triplets, write_group_weights, clear_influences
+
+# Mode: ["hops", "geodesic", "none"]
+FILTER_MODE = "hops"
 EDGE_THRESHOLD = 100 
+GEODESIC_RADIUS = 0.5
+# Island removal: ["peak", "mass", None]
+ISLAND_FILTER = "peak"
+KEEP_COMPONENTS = 1
+ISLAND_EPSILON = 0.0
 OBJECT_NAME = "standup" 
 
 obj = bpy.data.objects.get(OBJECT_NAME)
@@ -32,79 +60,65 @@ bpy.ops.object.mode_set(mode='OBJECT')
 
 # Access the mesh data
 mesh = obj.data
-bm = bmesh.new()
-bm.from_mesh(mesh)
 
 # Create graph representation of mesh edges
-edges = {v.index: [] for v in mesh.vertices}
-for edge in bm.edges:
-    v1, v2 = edge.verts[0].index, edge.verts[1].index
-    edges[v1].append(v2)
-    edges[v2].append(v1)
+# Vertex adjacency CSR: the neighbors of vertex v are neighbors[offsets[v]:offsets[v + 1]]
+mesh_data = MeshData.from_blender(mesh)
+offsets, neighbors = mesh_data.vertex_adjacency()
 
 print("Graph created for edge connections.")
 
-# BFS for shortest edge distance
-def calculate_distances_from_vertex(start_vertex):
-    """Returns a dictionary of shortest distances from start_vertex to all other vertices."""
-    visited = set()
-    queue = [(start_vertex, 0)]
-    distances = {start_vertex: 0}
-
-    while queue:
-        current, distance = queue.pop(0)
-        if current in visited:
-            continue
-        visited.add(current)
-
-        for neighbor in edges[current]:
-            if neighbor not in distances:
-                distances[neighbor] = distance + 1
-                queue.append((neighbor, distance + 1))
-    
-    return distances
-
-# Process a single vertex group
-def process_vertex_group(vgroup):
-    start_time = time.time()
-    print(f"Processing vertex group: {vgroup.name}")
-
-    # Extract weights for all vertices in the vertex group
-    weights = []
-    for vert in mesh.vertices:
-        weight = next((g.weight for g in vert.groups if g.group == vgroup.index), 0.0)
-        if weight > 0:
-            weights.append((vert.index, weight))
-
-    if not weights:
-        print(f"  - No vertices with weight > 0 in group '{vgroup.name}'.")
-        return
-
-    # Find the vertex with the highest weight
-    weights.sort(key=lambda x: x[1], reverse=True)
-    highest_weight_vertex = weights[0][0]  # Index of the vertex with the highest weight
-    print(f"  - Highest weight vertex: {highest_weight_vertex}")
-
-    # Calculate distances from the highest weight vertex
-    distances = calculate_distances_from_vertex(highest_weight_vertex)
+# Extract the weights of all vertex groups in one pass
+rows, groups, weights = read_group_triplets(mesh)
+positive = weights > 0
+rows, groups, weights = rows[positive], groups[positive], weights[positive]
+vgroups = list(obj.vertex_groups)
 
-    # Filter vertices based on distance
-    filtered_count = 0
-    for vert_index, weight in weights:
-        if distances.get(vert_index, float('inf')) > EDGE_THRESHOLD:
-            vgroup.add([vert_index], 0.0, 'REPLACE')
-            filtered_count += 1
+# Find the vertex with the highest weight of every group
+peaks = group_peaks(rows, groups, weights, len(vgroups))
 
-    elapsed = time.time() - start_time
-    print(f"Vertex group '{vgroup.name}' processed. Filtered {filtered_count} vertices. Time: {elapsed:.2f}s")
-
-# Process all vertex groups
 start_time = time.time()
-for vgroup in obj.vertex_groups:
-    process_vertex_group(vgroup)
+if FILTER_MODE == "hops":
+    # BFS for shortest edge distance, from every group's peak at once
+    reached = bounded_bfs(offsets, neighbors, peaks, EDGE_THRESHOLD)
+elif FILTER_MODE == "geodesic":
+    # Dijkstra on edge lengths from every group's peak, stopped at GEODESIC_RADIUS
+    reached = bounded_geodesic(offsets, neighbors, edge_lengths(mesh_data.positions, offsets, neighbors),
+                               peaks, GEODESIC_RADIUS)
+elif FILTER_MODE == "none":
+    reached = None
+else:
+    raise ValueError(f"Unknown FILTER_MODE '{FILTER_MODE}'.")
+print(f"Graph distances calculated for {len(vgroups)} vertex groups. Time: {time.time() - start_time:.2f}s")
+
+# Filter vertices based on distance
+filtered = np.zeros(len(rows), dtype=bool) if reached is None else ~has_bits(reached, rows, groups)
+
+# Remove the islands of every group in one union-find sweep
+if ISLAND_FILTER == "peak":
+    filtered |= island_filter(mesh_data.edges, rows, groups, weights, len(vgroups), peaks=peaks,
+                              epsilon=ISLAND_EPSILON)
+elif ISLAND_FILTER == "mass":
+    filtered |= island_filter(mesh_data.edges, rows, groups, weights, len(vgroups),
+                              keep_components=KEEP_COMPONENTS, epsilon=ISLAND_EPSILON)
+elif ISLAND_FILTER is not None:
+    raise ValueError(f"Unknown ISLAND_FILTER '{ISLAND_FILTER}'.")
+
+for vgroup in vgroups:
+    if peaks[vgroup.index] < 0:
+        print(f"  - No vertices with weight > 0 in group '{vgroup.name}'.")
+        continue
+    filtered_vertices = rows[filtered & (groups == vgroup.index)]
+    if len(filtered_vertices):
+        # Weight 0: the vertices are removed from the group
+        write_group_weights(vgroup, filtered_vertices, np.zeros(len(filtered_vertices)))
+    print(f"Vertex group '{vgroup.name}' processed. Highest weight vertex: {peaks[vgroup.index]}. "
+          f"Filtered {len(filtered_vertices)} vertices.")
+
+# The skinning influences no longer match the weights
+clear_influences(mesh)
 
 elapsed = time.time() - start_time
 print(f"Weight filtering completed for all vertex groups. Total time: {elapsed:.2f}s")
 
-bm.free()
 mesh.update()
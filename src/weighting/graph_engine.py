@@ -0,0 +1,228 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: graph_engine.py
+description: Vectorized graph searches over the vertex adjacency CSR of MeshData, used by graph-distance-filtering.py.
+Vertex group weights are handled as sparse (vertex, group, weight) triplets (see utils/vertex_group_io.py).
+The hop-distance filter runs one breadth-first search for all groups at once: every vertex carries a bitset
+with one bit per group (uint64 words), and each level only expands the vertices on the current frontier.
+The geodesic filter runs Dijkstra on edge lengths from every group's peak and stops as soon as the closest
+unsettled vertex is beyond the radius, so each search only touches the influence region of its group.
+Island removal labels the connected components of every group's support (weight > epsilon) with one array-based
+union-find over (vertex, group) memberships: every mesh edge joins the memberships its two vertices share,
+roots are hooked to the smaller label and paths are halved by pointer jumping until no edge crosses two components.
+This module does not import bpy.
+
+how to use:
+    Imported by graph-distance-filtering.py
+'''
+
+import heapq
+import numpy as np
+
+WORD_BITS = 64
+
+
+def group_peaks(rows, groups, weights, num_groups):
+    """
+    Highest-weight vertex of every group, the lowest vertex index on ties; -1 for groups without positive weights.
+    """
+    positive = weights > 0
+    rows, groups, weights = rows[positive], groups[positive], weights[positive]
+    order = np.lexsort((rows, -weights, groups))
+    peaks = np.full(num_groups, -1, dtype=np.int64)
+    first = np.unique(groups[order], return_index=True)[1]
+    peaks[groups[order][first]] = rows[order][first]
+    return peaks
+
+
+def _expand(offsets, neighbors, vertices):
+    """Edges leaving the given vertices as (position in vertices, target vertex) arrays."""
+    degree = offsets[vertices + 1] - offsets[vertices]
+    sources = np.repeat(np.arange(len(vertices)), degree)
+    edge_ids = np.repeat(offsets[vertices] - np.cumsum(degree) + degree, degree) + np.arange(len(sources))
+    return sources, neighbors[edge_ids]
+
+
+def group_bit(groups):
+    """Word index and bit mask of every group in a bitset."""
+    groups = np.asarray(groups, dtype=np.int64)
+    return groups // WORD_BITS, np.left_shift(np.uint64(1), (groups % WORD_BITS).astype(np.uint64))
+
+
+def bounded_bfs(offsets, neighbors, sources, max_depth):
+    """
+    Level-synchronous breadth-first search from one source vertex per group, all groups at once.
+
+    offsets, neighbors: Vertex adjacency CSR.
+    sources: (G,) source vertex of every group, -1 for groups without a source.
+    max_depth: Maximum number of edges (hops) from the source.
+    Returns an (N, ceil(G / 64)) uint64 bitset; bit g of vertex v is set if v is within max_depth hops of source g.
+    """
+    num_vertices = len(offsets) - 1
+    sources = np.asarray(sources, dtype=np.int64)
+    reached = np.zeros((num_vertices, max(1, -(-len(sources) // WORD_BITS))), dtype=np.uint64)
+    active = np.flatnonzero(sources >= 0)
+    words, bits = group_bit(active)
+    np.bitwise_or.at(reached, (sources[active], words), bits)
+
+    frontier = np.unique(sources[active])
+    frontier_bits = reached[frontier]
+    for _ in range(max_depth):
+        if len(frontier) == 0:
+            break
+        # OR the bits of all frontier vertices into their neighbors
+        sources_pos, targets = _expand(offsets, neighbors, frontier)
+        order = np.argsort(targets, kind="stable")
+        targets, incoming = targets[order], frontier_bits[sources_pos[order]]
+        if len(targets) == 0:
+            break
+        vertices, first = np.unique(targets, return_index=True)
+        incoming = np.bitwise_or.reduceat(incoming, first, axis=0)
+
+        # Only bits a vertex did not have yet move on to the next level
+        new_bits = incoming & ~reached[vertices]
+        grew = new_bits.any(axis=1)
+        frontier, frontier_bits = vertices[grew], new_bits[grew]
+        reached[frontier] |= frontier_bits
+    return reached
+
+
+def has_bits(bitset, rows, groups):
+    """Whether bit groups[i] is set for vertex rows[i]."""
+    words, bits = group_bit(groups)
+    return (bitset[rows, words] & bits) != 0
+
+
+def edge_lengths(positions, offsets, neighbors):
+    """Length of every edge of the adjacency CSR, aligned with neighbors."""
+    owners = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return np.linalg.norm(positions[neighbors] - positions[owners], axis=1)
+
+
+def bounded_dijkstra(offsets, neighbors, lengths, source, radius):
+    """
+    Geodesic (edge-length) distances from source to every vertex within radius.
+    The search stops once the closest unsettled vertex is farther than radius.
+    Returns a dict vertex -> distance.
+    """
+    distances = {source: 0.0}
+    settled = {}
+    heap = [(0.0, source)]
+    while heap:
+        distance, current = heapq.heappop(heap)
+        if distance > radius:
+            break
+        if current in settled:
+            continue
+        settled[current] = distance
+
+        start, stop = offsets[current], offsets[current + 1]
+        for neighbor, length in zip(neighbors[start:stop].tolist(), lengths[start:stop].tolist()):
+            candidate = distance + length
+            if candidate <= radius and candidate < distances.get(neighbor, np.inf):
+                distances[neighbor] = candidate
+                heapq.heappush(heap, (candidate, neighbor))
+    return settled
+
+
+def bounded_geodesic(offsets, neighbors, lengths, sources, radius):
+    """
+    Bounded Dijkstra from one source vertex per group.
+    Returns the same (N, ceil(G / 64)) uint64 bitset as bounded_bfs, with bit g set within radius of source g.
+    """
+    num_vertices = len(offsets) - 1
+    reached = np.zeros((num_vertices, max(1, -(-len(sources) // WORD_BITS))), dtype=np.uint64)
+    for group, source in enumerate(sources):
+        if source < 0:
+            continue
+        vertices = np.fromiter(bounded_dijkstra(offsets, neighbors, lengths, int(source), radius), dtype=np.int64)
+        word, bit = group_bit(group)
+        reached[vertices, word] |= bit
+    return reached
+
+
+def support_edges(edges, rows, groups, num_groups):
+    """
+    Mesh edges inside the support of every group, as pairs of membership indices.
+
+    edges: (E, 2) mesh edges.
+    rows, groups: Vertex and group of every membership (entries of the support).
+    Returns ((K,) first, (K,) second) indices into rows/groups with the same group and adjacent vertices.
+    """
+    keys = rows * num_groups + groups
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    counts = np.bincount(rows, minlength=int(edges.max(initial=-1)) + 1)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    # Every membership of the first vertex of an edge, looked up at the second vertex
+    heads = edges[:, 0].astype(np.int64)
+    tails = edges[:, 1].astype(np.int64)
+    edge_pos, first = _expand(offsets, order, heads)
+    wanted = tails[edge_pos] * num_groups + groups[first]
+    slots = np.searchsorted(sorted_keys, wanted).clip(max=len(sorted_keys) - 1)
+    found = sorted_keys[slots] == wanted
+    return first[found], order[slots[found]]
+
+
+def union_find(num_nodes, first, second):
+    """
+    Connected components of a graph given as an edge list, without Python loops over the edges.
+    Every round hooks the root of the larger label onto the smaller one, then flattens the trees by pointer jumping.
+    Returns (num_nodes,) labels; each component is labeled by its smallest node index.
+    """
+    labels = np.arange(num_nodes)
+    while True:
+        a, b = labels[first], labels[second]
+        crossing = a != b
+        if not crossing.any():
+            return labels
+        a, b = a[crossing], b[crossing]
+        np.minimum.at(labels, np.maximum(a, b), np.minimum(a, b))
+        # Pointer jumping until every node points at its root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+def island_filter(edges, rows, groups, weights, num_groups, peaks=None, keep_components=1, epsilon=0.0):
+    """
+    Remove the disconnected islands of every vertex group at once.
+
+    edges: (E, 2) mesh edges.
+    rows, groups, weights: Vertex group memberships (see vertex_group_io.read_group_triplets).
+    peaks: (G,) peak vertex of every group: keep only the component containing it.
+           None keeps the keep_components components with the largest total weight instead.
+    epsilon: Memberships with weight <= epsilon are not part of the support and are never removed.
+    Returns a bool mask over the memberships, True where the weight should be set to 0.
+    """
+    support = np.flatnonzero(weights > epsilon)
+    first, second = support_edges(edges, rows[support], groups[support], num_groups)
+    labels = union_find(len(support), first, second)
+    support_groups = groups[support]
+
+    if peaks is not None:
+        # The component of the membership (peak, group) survives
+        is_peak = rows[support] == np.asarray(peaks)[support_groups]
+        keep = np.zeros(len(support), dtype=bool)
+        keep[labels[is_peak]] = True
+        kept = keep[labels]
+    else:
+        # Rank the components of every group by mass and keep the first keep_components
+        mass = np.bincount(labels, weights=weights[support], minlength=len(support))
+        roots = np.flatnonzero(labels == np.arange(len(support)))
+        order = np.lexsort((roots, -mass[roots], support_groups[roots]))
+        roots, root_groups = roots[order], support_groups[roots[order]]
+        group_start = np.searchsorted(root_groups, root_groups)
+        keep = np.zeros(len(support), dtype=bool)
+        keep[roots[np.arange(len(roots)) - group_start < keep_components]] = True
+        kept = keep[labels]
+
+    removed = np.zeros(len(rows), dtype=bool)
+    removed[support[~kept]] = True
+    return removed
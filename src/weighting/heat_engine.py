@@ -0,0 +1,292 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: heat_engine.py
+description: Bone heat weighting (heat diffusion), the "heat" method of distance-based-weighting.py.
+Every vertex is attached to its nearest visible bone with heat H = 1 / d^2, and the weight of bone j solves
+    (L + M H) w_j = M H p_j
+where L is the cotangent Laplacian, M the lumped vertex areas and p_j marks the vertices attached to bone j.
+The matrix is the same for all bones, so it is assembled and factorized once and all bones are solved as
+right-hand sides, in column blocks over a thread pool; each block is turned into sparse (vertex, bone, weight)
+triplets right away, so no (N, B) array is ever built. The factorization is SciPy's sparse LU if available.
+Without SciPy (e.g. Blender's bundled Python) it is a block Cholesky in NumPy: the vertices are ordered by the
+Cuthill-McKee level structure of the mesh (BFS levels from a pseudo-peripheral vertex), where every edge joins
+the same or adjacent levels, so the matrix is block tridiagonal and factorizes with dense level blocks only.
+The weights of every vertex sum to 1.
+reference: Baran and Popovic, "Automatic Rigging and Animation of 3D Characters", SIGGRAPH 2007
+This module does not import bpy.
+
+how to use:
+    Imported by distance-based-weighting.py
+'''
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from sparse_matrix import CSRMatrix
+from weighting_engine import vertex_chunks, point_segment_distances
+from graph_engine import union_find
+
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+except ImportError:
+    scipy = None
+
+# Bones per vertex tried in distance order until one is visible
+VISIBILITY_CANDIDATES = 4
+# Right-hand sides (bones) solved together
+BLOCK_SIZE = 8
+# Relative diagonal shift keeping parts of the mesh without any visible bone solvable
+REGULARIZATION = 1e-10
+# Minimum size of a diagonal block of BlockCholesky; smaller BFS levels are merged with the next ones
+MIN_BLOCK_SIZE = 64
+
+
+def cotangent_laplacian(positions, triangles):
+    """
+    Cotangent Laplacian (positive semi-definite) and lumped vertex areas of a triangle mesh.
+    Returns (L as CSRMatrix, (N,) areas).
+    """
+    num_vertices = len(positions)
+    corners = positions[triangles]
+    rows, cols, values = [], [], []
+    for k in range(3):
+        # Angle at corner k, opposite to the edge (i, j)
+        i, j = (k + 1) % 3, (k + 2) % 3
+        e1, e2 = corners[:, i] - corners[:, k], corners[:, j] - corners[:, k]
+        cross = np.linalg.norm(np.cross(e1, e2), axis=1)
+        cot = np.einsum("ti,ti->t", e1, e2) / np.where(cross > 0, cross, 1.0)
+        half_cot = np.where(cross > 0, 0.5 * cot, 0.0)
+        a, b = triangles[:, i], triangles[:, j]
+        rows += [a, b, a, b]
+        cols += [b, a, a, b]
+        values += [-half_cot, -half_cot, half_cot, half_cot]
+    laplacian = CSRMatrix.from_coo(np.concatenate(rows), np.concatenate(cols), np.concatenate(values),
+                                   (num_vertices, num_vertices), sum_duplicates=True)
+
+    triangle_areas = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    areas = np.bincount(triangles.ravel(), weights=np.repeat(triangle_areas / 3.0, 3), minlength=num_vertices)
+    return laplacian, areas
+
+
+def nearest_bones(points, heads, tails, count=VISIBILITY_CANDIDATES):
+    """The count nearest bone segments of every point, closest first: ((N, k) bone indices, (N, k) distances)."""
+    count = min(count, len(heads))
+    indices = np.empty((len(points), count), dtype=np.int64)
+    distances = np.empty((len(points), count))
+    for start, stop in vertex_chunks(len(points), len(heads)):
+        chunk = point_segment_distances(points[start:stop], heads, tails)
+        nearest = np.argsort(chunk, axis=1, kind="stable")[:, :count]
+        indices[start:stop] = nearest
+        distances[start:stop] = np.take_along_axis(chunk, nearest, axis=1)
+    return indices, distances
+
+
+def closest_points_on_bones(points, heads, tails):
+    """Closest point on the segment heads[i] -> tails[i] to points[i]."""
+    directions = tails - heads
+    length_sq = np.einsum("ni,ni->n", directions, directions)
+    t = np.einsum("ni,ni->n", points - heads, directions) / np.where(length_sq > 0, length_sq, 1.0)
+    return heads + np.clip(np.where(length_sq > 0, t, 0.0), 0.0, 1.0)[:, None] * directions
+
+
+def heat_attachment(points, heads, tails, is_visible=None, candidates=VISIBILITY_CANDIDATES):
+    """
+    Attach every vertex to its nearest visible bone.
+
+    is_visible: Callable (points (M, 3), targets (M, 3)) -> (M,) bool telling whether the segment from a point to
+                its target is unobstructed by the mesh; None treats every bone as visible.
+    Returns ((N,) attached bone or -1, (N,) heat H = 1 / d^2 or 0 if no candidate bone is visible).
+    """
+    heads = np.asarray(heads, dtype=np.float64)
+    tails = np.asarray(tails, dtype=np.float64)
+    indices, distances = nearest_bones(points, heads, tails, candidates)
+    bones = np.full(len(points), -1, dtype=np.int64)
+    heat = np.zeros(len(points))
+
+    # Try the candidates in distance order, only for the vertices still without a visible bone
+    pending = np.arange(len(points))
+    for k in range(indices.shape[1]):
+        if len(pending) == 0:
+            break
+        candidate = indices[pending, k]
+        visible = np.ones(len(pending), dtype=bool) if is_visible is None else np.asarray(
+            is_visible(points[pending], closest_points_on_bones(points[pending], heads[candidate], tails[candidate])))
+        attached = pending[visible]
+        bones[attached] = candidate[visible]
+        heat[attached] = 1.0 / np.maximum(distances[attached, k], 1e-8) ** 2
+        pending = pending[~visible]
+    return bones, heat
+
+
+def _to_scipy(matrix):
+    return scipy.sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _bfs_levels(matrix, seeds):
+    """BFS level of every node from the seeds over the sparsity graph of a CSR matrix (-1 if not reached)."""
+    levels = np.full(matrix.shape[0], -1, dtype=np.int64)
+    frontier, level = np.asarray(seeds, dtype=np.int64), 0
+    levels[frontier] = 0
+    while len(frontier):
+        degree = matrix.indptr[frontier + 1] - matrix.indptr[frontier]
+        entries = np.repeat(matrix.indptr[frontier] - np.cumsum(degree) + degree, degree) + np.arange(degree.sum())
+        neighbors = matrix.indices[entries]
+        frontier = np.unique(neighbors[levels[neighbors] < 0])
+        level += 1
+        levels[frontier] = level
+    return levels
+
+
+def level_blocks(matrix, min_block_size=MIN_BLOCK_SIZE):
+    """
+    Cuthill-McKee level structure of a structurally symmetric sparse matrix.
+    Every connected component is swept by BFS from a pseudo-peripheral node (the farthest node of a first sweep),
+    and the nodes are ordered by (component, level). Entries only join nodes of the same or adjacent levels, so
+    consecutive levels merged into blocks of at least min_block_size nodes make the reordered matrix block
+    tridiagonal.
+    Returns (order, (K + 1,) block offsets into order).
+    """
+    num_nodes = matrix.shape[0]
+    if num_nodes == 0:
+        return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    labels = union_find(num_nodes, matrix.row_ids(), matrix.indices)
+    levels = _bfs_levels(matrix, np.unique(labels))
+    # Restart every component from its farthest node, which gives fewer, narrower levels
+    order = np.lexsort((-levels, labels))
+    first = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]])
+    levels = _bfs_levels(matrix, order[first])
+
+    order = np.lexsort((levels, labels))
+    keys = labels[order] * num_nodes + levels[order]
+    bounds = [0]
+    for start in np.flatnonzero(keys[1:] != keys[:-1]) + 1:
+        if start - bounds[-1] >= min_block_size:
+            bounds.append(int(start))
+    bounds.append(num_nodes)
+    return order, np.asarray(bounds, dtype=np.int64)
+
+
+class BlockCholesky:
+    """
+    Cholesky factorization A = L L^T of a sparse symmetric positive definite matrix, computed once with NumPy and
+    reused for any number of right-hand sides.
+
+    In the order of level_blocks, A is block tridiagonal with diagonal blocks D_k and subdiagonal blocks B_k, so L
+    has diagonal blocks L_k and subdiagonal blocks C_k:
+        L_k L_k^T = D_k - C_{k-1} C_{k-1}^T,   C_k = B_k L_k^-T
+    The inverses of the L_k are stored, so both triangular solves are dense matrix products over the blocks.
+    """
+    def __init__(self, matrix, min_block_size=MIN_BLOCK_SIZE):
+        self.order, self.bounds = level_blocks(matrix, min_block_size)
+        num_blocks = len(self.bounds) - 1
+        position = np.empty(matrix.shape[0], dtype=np.int64)
+        position[self.order] = np.arange(matrix.shape[0])
+        block_of = np.repeat(np.arange(num_blocks), np.diff(self.bounds))
+        rows, cols = position[matrix.row_ids()], position[matrix.indices]
+        row_blocks, col_blocks = block_of[rows], block_of[cols]
+        if np.any(np.abs(row_blocks - col_blocks) > 1):
+            raise ValueError("The matrix is not structurally symmetric.")
+
+        # Entries of the diagonal blocks and of the subdiagonal blocks, grouped by column block
+        diagonal = np.flatnonzero(row_blocks == col_blocks)
+        diagonal = diagonal[np.argsort(col_blocks[diagonal], kind="stable")]
+        diagonal_starts = np.searchsorted(col_blocks[diagonal], np.arange(num_blocks + 1))
+        below = np.flatnonzero(row_blocks == col_blocks + 1)
+        below = below[np.argsort(col_blocks[below], kind="stable")]
+        below_starts = np.searchsorted(col_blocks[below], np.arange(num_blocks + 1))
+
+        self.inverses, self.couplings = [], []
+        schur = None
+        for k in range(num_blocks):
+            lo, hi = self.bounds[k], self.bounds[k + 1]
+            entries = diagonal[diagonal_starts[k]:diagonal_starts[k + 1]]
+            block = np.zeros((hi - lo, hi - lo))
+            block[rows[entries] - lo, cols[entries] - lo] = matrix.data[entries]
+            if schur is not None:
+                block -= schur
+            inverse = np.linalg.inv(np.linalg.cholesky(block))
+            self.inverses.append(inverse)
+            if k + 1 < num_blocks:
+                entries = below[below_starts[k]:below_starts[k + 1]]
+                coupling = np.zeros((self.bounds[k + 2] - hi, hi - lo))
+                coupling[rows[entries] - hi, cols[entries] - lo] = matrix.data[entries]
+                coupling = coupling @ inverse.T
+                self.couplings.append(coupling)
+                schur = coupling @ coupling.T
+
+    def solve(self, rhs):
+        """Solve A x = rhs for a (N,) or (N, C) right-hand side."""
+        rhs = np.asarray(rhs, dtype=np.float64)
+        values = rhs.reshape(len(rhs), -1)[self.order]
+        # Forward: L y = b
+        for k, inverse in enumerate(self.inverses):
+            lo, hi = self.bounds[k], self.bounds[k + 1]
+            if k > 0:
+                values[lo:hi] -= self.couplings[k - 1] @ values[self.bounds[k - 1]:lo]
+            values[lo:hi] = inverse @ values[lo:hi]
+        # Backward: L^T x = y
+        for k in range(len(self.inverses) - 1, -1, -1):
+            lo, hi = self.bounds[k], self.bounds[k + 1]
+            if k + 1 < len(self.inverses):
+                values[lo:hi] -= self.couplings[k].T @ values[hi:self.bounds[k + 2]]
+            values[lo:hi] = self.inverses[k].T @ values[lo:hi]
+        result = np.empty_like(values)
+        result[self.order] = values
+        return result.reshape(rhs.shape)
+
+
+def heat_weights(positions, triangles, heads, tails, is_visible=None, workers=1, block_size=BLOCK_SIZE,
+                 min_weight=0.0):
+    """
+    Bone heat weights of every vertex.
+
+    positions: (N, 3) vertex positions (same space as the bones).
+    triangles: (T, 3) triangulated faces.
+    heads, tails: (B, 3) bone segments.
+    is_visible: Visibility test of heat_attachment.
+    workers: Threads solving blocks of bones in parallel.
+    min_weight: Weights below this (and all weights <= 0) are dropped.
+    Returns sparse (rows, bones, weights), the weights clipped to 1.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    num_vertices, num_bones = len(positions), len(heads)
+    laplacian, areas = cotangent_laplacian(positions, triangles)
+    bones, heat = heat_attachment(positions, heads, tails, is_visible)
+
+    # L + M H, assembled once for all bones
+    diagonal = areas * heat
+    diagonal += REGULARIZATION * max(float(np.abs(laplacian.data).max(initial=0.0)), 1e-12)
+    vertices = np.arange(num_vertices)
+    system = CSRMatrix.from_coo(np.concatenate([laplacian.row_ids(), vertices]),
+                                np.concatenate([laplacian.indices, vertices]),
+                                np.concatenate([laplacian.data, diagonal]),
+                                (num_vertices, num_vertices), sum_duplicates=True)
+
+    attached = np.flatnonzero(bones >= 0)
+    blocks = [(start, min(start + block_size, num_bones)) for start in range(0, num_bones, block_size)]
+
+    # Factorized once, reused by every block of bones
+    if scipy is not None:
+        solve = scipy.sparse.linalg.splu(_to_scipy(system).tocsc()).solve
+    else:
+        solve = BlockCholesky(system).solve
+
+    def solve_block(block):
+        start, stop = block
+        # M H p_j: the heat of every vertex flows into the bone it is attached to
+        rhs = np.zeros((num_vertices, stop - start))
+        in_block = (bones[attached] >= start) & (bones[attached] < stop)
+        rhs[attached[in_block], bones[attached[in_block]] - start] = (areas * heat)[attached[in_block]]
+        solution = solve(rhs)
+        rows, columns = np.nonzero((solution > 0) & (solution >= min_weight))
+        return rows, columns + start, np.minimum(solution[rows, columns], 1.0)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        triplets = list(pool.map(solve_block, blocks))
+    if not triplets:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    rows, bone_indices, weights = (np.concatenate(parts) for parts in zip(*triplets))
+    return rows, bone_indices, weights
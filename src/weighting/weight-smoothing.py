@@ -6,6 +6,8 @@ name: weight-smoothing.py
 description: processing graph-distance-filtering.py makes weight flow discrete due to clamping by graph distance.
              This script smooths those weights. It iteratively adjusts the weights of each vertex by averaging them with the weights 
              of neighboring vertices, creating a smoother transition between vertex weights. 
+             All vertex groups are smoothed at once: the weights are read in one pass into an (N, G) matrix and
+             every iteration is one sparse product with the row-normalized (I + A) adjacency operator.
 
 how to use:
     1. Open the Blender file.
@@ -18,9 +20,18 @@ how to use:
 '''
 
 import bpy
-import bmesh
+import os
+import sys
 import time
 
+# Make the weighting engine next to this script and the utils modules importable
+SCRIPT_DIR = os.path.dirname(bpy.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.join(SCRIPT_DIR, "..", "utils"))
+from mesh_data import MeshData
+from weighting_engine import smooth_weights
+from vertex_group_io import read_group_matrix, write_group_matrix
+
 
 SMOOTHING_ITERATIONS = 3  # Number of smoothing iterations
 OBJECT_NAME = "" 
@@ -32,44 +43,26 @@ if not obj:
 bpy.ops.object.mode_set(mode='OBJECT')
 
 mesh = obj.data
-bm = bmesh.new()
-bm.from_mesh(mesh)
 
-edges = {v.index: [] for v in mesh.vertices}
-for edge in bm.edges:
-    v1, v2 = edge.verts[0].index, edge.verts[1].index
-    edges[v1].append(v2)
-    edges[v2].append(v1)
+# Vertex adjacency CSR: the neighbors of vertex v are neighbors[offsets[v]:offsets[v + 1]]
+offsets, neighbors = MeshData.from_blender(mesh).vertex_adjacency()
 
 print("Graph created for edge connections.")
 
-# Smoothing function
-def smooth_vertex_group_weights(vgroup, edges, iterations):
-    for _ in range(iterations):
-        # Store new weights temporarily
-        new_weights = {vert.index: 0.0 for vert in mesh.vertices}
-        for vert in mesh.vertices:
-            weight = next((g.weight for g in vert.groups if g.group == vgroup.index), 0.0)
-            neighbor_weights = [
-                next((g.weight for g in mesh.vertices[neighbor].groups if g.group == vgroup.index), 0.0)
-                for neighbor in edges[vert.index]
-            ]
-            
-            if neighbor_weights:
-                new_weights[vert.index] = (weight + sum(neighbor_weights)) / (1 + len(neighbor_weights))
-            else:
-                new_weights[vert.index] = weight
-        
-        for vert_index, smoothed_weight in new_weights.items():
-            vgroup.add([vert_index], smoothed_weight, 'REPLACE')
-
 start_time = time.time()
-for vgroup in obj.vertex_groups:
-    print(f"Smoothing vertex group: {vgroup.name}")
-    smooth_vertex_group_weights(vgroup, edges, SMOOTHING_ITERATIONS)
+vgroups = list(obj.vertex_groups)
+
+# (N, G) weights of all vertex groups, read in one pass; vertices outside a group have weight 0
+weights = read_group_matrix(obj).toarray()
+
+# Smoothing: (weight + sum of neighbor weights) / (1 + number of neighbors), for all groups at once
+if SMOOTHING_ITERATIONS > 0:
+    weights = smooth_weights(weights, offsets, neighbors, SMOOTHING_ITERATIONS)
+    print(f"Smoothed vertex groups: {', '.join(vgroup.name for vgroup in vgroups)}")
+    # One vgroup.add per distinct value of every group; vertices smoothed to 0 leave the group
+    write_group_matrix(vgroups, weights)
 
 elapsed = time.time() - start_time
 print(f"Weight smoothing completed for all vertex groups. Total time: {elapsed:.2f}s")
 
-bm.free()
-mesh.update()
\ No newline at end of file
+mesh.update()
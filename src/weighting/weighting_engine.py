@@ -0,0 +1,345 @@
+'''
+2024 Graphics Programming Final Project
+Animating an object from single monocular video
+
+name: weighting_engine.py
+description: Vectorized distance-based weighting shared by the weighting scripts.
+The distance of every vertex to every bone segment is evaluated as an (N, B) array with NumPy,
+in vertex chunks so memory stays bounded on multi-million-vertex meshes
+(the weights are written back through utils/vertex_group_io.py).
+When the weights vanish beyond a cutoff distance, a uniform grid over the bone capsules (segments inflated
+by the cutoff) returns only the nearby bones of each vertex, so the output is sparse (vertex, bone, weight) triplets.
+A parameter sweep queries the grid once with the largest cutoff of all candidates and evaluates every
+falloff and parameter combination on those (vertex, bone, distance) pairs in a thread pool.
+Weight smoothing applies the umbrella operator (I + A) / (1 + degree) to the (N, G) weights of all groups at once.
+This module does not import bpy.
+
+how to use:
+    Imported by distance-based-weighting.py and weight-smoothing.py
+'''
+
+import math
+import random
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from sparse_matrix import CSRMatrix
+
+# Vertex x bone entries evaluated at once
+CHUNK_ENTRIES = 1 << 20
+# Upper bound of the number of cells of the bone grid
+MAX_GRID_CELLS = 1 << 21
+# Weight functions of distance-based-weighting.py
+WEIGHT_FUNCTIONS = ("linear", "sigmoid", "exponential", "noise")
+
+
+def vertex_chunks(num_vertices, num_bones, chunk_entries=CHUNK_ENTRIES):
+    """Contiguous (start, stop) vertex ranges holding about chunk_entries vertex x bone pairs each."""
+    step = max(1, chunk_entries // max(num_bones, 1))
+    return [(start, min(start + step, num_vertices)) for start in range(0, num_vertices, step)]
+
+
+def point_segment_distances(points, heads, tails):
+    """
+    Distance from every point to every segment.
+
+    points: (C, 3) points.
+    heads, tails: (B, 3) segment end points.
+    Returns (C, B) distances to the closest point head + t * (tail - head), t = clamp(dot / |tail - head|^2, 0, 1).
+    """
+    return segment_distances(points[:, None, :], heads[None, :, :], tails[None, :, :])
+
+
+def segment_distances(points, heads, tails):
+    """Distance from points to segments, broadcasting over all leading axes of the (..., 3) arrays."""
+    directions = tails - heads
+    offsets = points - heads
+    length_sq = np.sum(directions * directions, axis=-1)
+    t = np.sum(offsets * directions, axis=-1) / np.where(length_sq > 0, length_sq, 1.0)
+    # Zero-length bones behave like points at their head
+    t = np.clip(np.where(length_sq > 0, t, 0.0), 0.0, 1.0)
+    return np.linalg.norm(offsets - t[..., None] * directions, axis=-1)
+
+
+def constant_noise(noise_intensity=0.5, seed=42):
+    """The noise offset of the "noise" method; the generator is re-seeded for every vertex, so it is one value."""
+    rng = random.Random(seed)
+    return rng.uniform(-noise_intensity, noise_intensity)
+
+
+def falloff_weights(method, distances, factors, influence_radius, weight_sharpness, decay_factor,
+                    min_weight_threshold=0.0, noise_intensity=0.5):
+    """
+    Weights from (C, B) distances.
+
+    method: "linear", "sigmoid", "exponential" or "noise".
+    factors: (B,) bone-specific weighting factors.
+    Methods without a distance weight function get all-zero weights.
+    """
+    if method == "linear":
+        weights = (1.0 - distances / influence_radius) * factors
+    elif method == "sigmoid":
+        with np.errstate(over="ignore"):
+            weights = factors / (1.0 + np.exp(weight_sharpness * (distances - influence_radius / 2)))
+    elif method == "exponential":
+        weights = np.exp(-decay_factor * distances) * factors
+    elif method == "noise":
+        base_weights = np.maximum(min_weight_threshold, 1.0 - distances / influence_radius)
+        weights = base_weights + constant_noise(noise_intensity)
+    else:
+        return np.zeros_like(distances)
+    return np.maximum(min_weight_threshold, weights)
+
+
+def distance_weights(points, heads, tails, method, factors, influence_radius, weight_sharpness, decay_factor,
+                     min_weight_threshold=0.0, chunk_entries=CHUNK_ENTRIES):
+    """Yield (start, stop, (C, B) weights) for consecutive vertex chunks."""
+    heads = np.asarray(heads, dtype=np.float64)
+    tails = np.asarray(tails, dtype=np.float64)
+    factors = np.asarray(factors, dtype=np.float64)
+    for start, stop in vertex_chunks(len(points), len(heads), chunk_entries):
+        distances = point_segment_distances(np.asarray(points[start:stop], dtype=np.float64), heads, tails)
+        yield start, stop, falloff_weights(method, distances, factors, influence_radius, weight_sharpness,
+                                           decay_factor, min_weight_threshold)
+
+
+def cutoff_distance(method, max_factor, influence_radius, weight_sharpness, decay_factor, min_weight,
+                    min_weight_threshold=0.0, noise_intensity=0.5):
+    """
+    Distance beyond which every weight of the method is below min_weight (and not written).
+    Returns math.inf if far vertices still get weights, e.g. for the noise method or min_weight 0.
+    """
+    if method == "linear":
+        return influence_radius
+    if method == "noise":
+        # The constant noise offset is added to a base weight that vanishes at the influence radius
+        missing = max(min_weight, min_weight_threshold) - constant_noise(noise_intensity)
+        return influence_radius * (1.0 - missing) if missing > 0 else math.inf
+    if method not in WEIGHT_FUNCTIONS:
+        return 0.0
+    if min_weight <= 0 or min_weight_threshold >= min_weight:
+        return math.inf
+    if max_factor <= min_weight:
+        return 0.0
+    if method == "exponential":
+        return math.log(max_factor / min_weight) / decay_factor if decay_factor > 0 else math.inf
+    # sigmoid
+    return influence_radius / 2 + math.log(max_factor / min_weight - 1.0) / weight_sharpness \
+        if weight_sharpness > 0 else math.inf
+
+
+class BoneSegmentGrid:
+    """
+    Uniform grid over the axis-aligned bounding boxes of bone capsules.
+    Every cell lists the bones whose capsule (segment inflated by radius) may overlap it,
+    so a query only measures the distance to the few bones around each point.
+    """
+    def __init__(self, heads, tails, radius, max_cells=MAX_GRID_CELLS):
+        self.heads = np.asarray(heads, dtype=np.float64)
+        self.tails = np.asarray(tails, dtype=np.float64)
+        self.radius = radius
+        lower = np.minimum(self.heads, self.tails) - radius
+        upper = np.maximum(self.heads, self.tails) + radius
+        self.origin = lower.min(axis=0)
+        extent = np.maximum(upper.max(axis=0) - self.origin, 1e-9)
+        # Cells about the size of the radius, coarser if the grid would get too large
+        self.cell_size = max(radius, float(np.prod(extent) / max_cells) ** (1.0 / 3.0), 1e-9)
+        self.dims = np.floor(extent / self.cell_size).astype(np.int64) + 1
+
+        keys, bones = [], []
+        for b, (low, high) in enumerate(zip(self._cells(lower), self._cells(upper))):
+            cells = np.stack(np.meshgrid(*[np.arange(l, h + 1) for l, h in zip(low, high)], indexing="ij"), axis=-1)
+            keys.append(self._keys(cells.reshape(-1, 3)))
+            bones.append(np.full(keys[-1].shape, b, dtype=np.int64))
+        keys, bones = np.concatenate(keys), np.concatenate(bones)
+        order = np.argsort(keys, kind="stable")
+        # Cell -> bones CSR over the occupied cells only
+        self.cell_keys, first = np.unique(keys[order], return_index=True)
+        self.cell_offsets = np.append(first, len(keys))
+        self.cell_bones = bones[order]
+
+    def _cells(self, points):
+        return np.clip(np.floor((points - self.origin) / self.cell_size).astype(np.int64), 0, self.dims - 1)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+
+    def query(self, points):
+        """
+        Find the bones within radius of every point.
+        Returns (rows, bones, distances): point index, bone index and distance of every pair found.
+        """
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        inside = np.all((cells >= 0) & (cells < self.dims), axis=1)
+        keys = self._keys(np.clip(cells, 0, self.dims - 1))
+        slots = np.clip(np.searchsorted(self.cell_keys, keys), 0, len(self.cell_keys) - 1)
+        found = inside & (self.cell_keys[slots] == keys)
+
+        counts = np.where(found, self.cell_offsets[slots + 1] - self.cell_offsets[slots], 0)
+        rows = np.repeat(np.arange(len(points)), counts)
+        # Position of every candidate inside the bone list of its cell
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        bones = self.cell_bones[np.repeat(self.cell_offsets[slots], counts) + within]
+
+        distances = segment_distances(points[rows], self.heads[bones], self.tails[bones])
+        near = distances <= self.radius
+        return rows[near], bones[near], distances[near]
+
+
+def sparse_distance_weights(points, heads, tails, method, factors, influence_radius, weight_sharpness, decay_factor,
+                            min_weight, min_weight_threshold=0.0, chunk_entries=CHUNK_ENTRIES):
+    """
+    Distance-based weights as sparse triplets, dropping weights below min_weight (and zero weights).
+
+    Bones near each vertex come from a BoneSegmentGrid when the method has a finite cutoff distance;
+    otherwise all bones are evaluated in chunks.
+    Returns (rows, bones, weights) arrays.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    factors = np.asarray(factors, dtype=np.float64)
+    cutoff = cutoff_distance(method, float(factors.max(initial=0.0)), influence_radius, weight_sharpness,
+                             decay_factor, min_weight, min_weight_threshold)
+
+    rows, bones, weights = [], [], []
+    if math.isinf(cutoff):
+        for start, _, chunk in distance_weights(points, heads, tails, method, factors, influence_radius,
+                                                weight_sharpness, decay_factor, min_weight_threshold, chunk_entries):
+            chunk_rows, chunk_bones = np.nonzero((chunk > 0) & (chunk >= min_weight))
+            rows.append(chunk_rows + start)
+            bones.append(chunk_bones)
+            weights.append(chunk[chunk_rows, chunk_bones])
+    elif cutoff > 0:
+        grid = BoneSegmentGrid(heads, tails, cutoff * (1.0 + 1e-6))
+        for start, stop in vertex_chunks(len(points), 8, chunk_entries):
+            chunk_rows, chunk_bones, distances = grid.query(points[start:stop])
+            chunk = falloff_weights(method, distances, factors[chunk_bones], influence_radius, weight_sharpness,
+                                    decay_factor, min_weight_threshold)
+            keep = (chunk > 0) & (chunk >= min_weight)
+            rows.append(chunk_rows[keep] + start)
+            bones.append(chunk_bones[keep])
+            weights.append(chunk[keep])
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(rows), np.concatenate(bones), np.concatenate(weights)
+
+
+def sweep_candidates(methods, influence_radii, weight_sharpnesses, decay_factors, factor_scales):
+    """
+    Parameter combinations of a sweep, as dicts; every method only varies the parameters it uses.
+    factor_scales multiply the bone-specific factors.
+    """
+    uses = {"linear": ("influence_radius",), "sigmoid": ("influence_radius", "weight_sharpness"),
+            "exponential": ("decay_factor",), "noise": ("influence_radius",)}
+    values = {"influence_radius": influence_radii, "weight_sharpness": weight_sharpnesses,
+              "decay_factor": decay_factors}
+    candidates = []
+    for method in methods:
+        names = uses[method]
+        for combination in itertools.product(*[values[name] for name in names], factor_scales):
+            candidate = {"method": method, "influence_radius": influence_radii[0],
+                         "weight_sharpness": weight_sharpnesses[0], "decay_factor": decay_factors[0]}
+            candidate.update(zip(names, combination[:-1]))
+            candidate["factor_scale"] = combination[-1]
+            candidates.append(candidate)
+    return candidates
+
+
+def score_weights(num_vertices, rows, weights, entropy_weight=0.5):
+    """
+    Cheap quality score of sparse weights, higher is better:
+    coverage (fraction of vertices with any weight) minus entropy_weight times the mean normalized entropy
+    of the weights of the covered vertices (0 for one bone, 1 for an even split).
+    Weights are clamped to [0, 1] first, like Blender stores them.
+    """
+    weights = np.minimum(weights, 1.0)
+    totals = np.bincount(rows, weights=weights, minlength=num_vertices)
+    counts = np.bincount(rows, minlength=num_vertices)
+    covered = totals > 0
+    if not covered.any():
+        return 0.0, 0.0, 0.0
+    p = weights / totals[rows]
+    entropy = np.bincount(rows, weights=-p * np.log(np.maximum(p, 1e-300)), minlength=num_vertices)
+    normalized = np.where(counts > 1, entropy / np.log(np.maximum(counts, 2)), 0.0)
+    coverage = float(covered.mean())
+    mean_entropy = float(normalized[covered].mean())
+    return coverage - entropy_weight * mean_entropy, coverage, mean_entropy
+
+
+def sweep_distance_weights(points, heads, tails, factors, candidates, min_weight, min_weight_threshold=0.0,
+                           entropy_weight=0.5, workers=1, chunk_entries=CHUNK_ENTRIES):
+    """
+    Evaluate weighting candidates (from sweep_candidates) on one shared sparse distance structure.
+
+    Candidates whose weights never vanish (infinite cutoff, e.g. noise or min_weight 0) are skipped.
+    Returns (results, best): results is a list of (candidate, score, coverage, entropy) in candidate order,
+    best the (rows, bones, weights) triplets of the highest-scoring candidate, or None.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    factors = np.asarray(factors, dtype=np.float64)
+    cutoffs = [cutoff_distance(c["method"], float(factors.max(initial=0.0)) * c["factor_scale"], c["influence_radius"],
+                               c["weight_sharpness"], c["decay_factor"], min_weight, min_weight_threshold)
+               for c in candidates]
+    finite = [cutoff for cutoff in cutoffs if not math.isinf(cutoff)]
+    if not finite or max(finite) <= 0:
+        return [(c, None, None, None) for c in candidates], None
+
+    # Vertex-bone pairs within the largest cutoff, computed once
+    grid = BoneSegmentGrid(heads, tails, max(finite) * (1.0 + 1e-6))
+    rows, bones, distances = [], [], []
+    for start, stop in vertex_chunks(len(points), 8, chunk_entries):
+        chunk_rows, chunk_bones, chunk_distances = grid.query(points[start:stop])
+        rows.append(chunk_rows + start)
+        bones.append(chunk_bones)
+        distances.append(chunk_distances)
+    rows, bones, distances = np.concatenate(rows), np.concatenate(bones), np.concatenate(distances)
+
+    def evaluate(index):
+        candidate = candidates[index]
+        if math.isinf(cutoffs[index]):
+            return None
+        weights = falloff_weights(candidate["method"], distances, factors[bones] * candidate["factor_scale"],
+                                  candidate["influence_radius"], candidate["weight_sharpness"],
+                                  candidate["decay_factor"], min_weight_threshold)
+        keep = (weights > 0) & (weights >= min_weight)
+        return score_weights(len(points), rows[keep], weights[keep], entropy_weight)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        scores = list(pool.map(evaluate, range(len(candidates))))
+    results = [(c, *(score if score is not None else (None, None, None))) for c, score in zip(candidates, scores)]
+
+    scored = [i for i, score in enumerate(scores) if score is not None]
+    if not scored:
+        return results, None
+    best = candidates[max(scored, key=lambda i: scores[i][0])]
+    weights = falloff_weights(best["method"], distances, factors[bones] * best["factor_scale"], best["influence_radius"],
+                              best["weight_sharpness"], best["decay_factor"], min_weight_threshold)
+    keep = (weights > 0) & (weights >= min_weight)
+    return results, (rows[keep], bones[keep], weights[keep])
+
+
+def umbrella_operator(offsets, neighbors):
+    """
+    The (I + A) adjacency operator of the vertex adjacency CSR, and its (N,) row counts 1 + degree.
+    In every row the neighbors come first and the vertex itself last.
+    """
+    num_vertices = len(offsets) - 1
+    owners = np.repeat(np.arange(num_vertices), np.diff(offsets))
+    vertices = np.arange(num_vertices)
+    operator = CSRMatrix.from_coo(np.concatenate([owners, vertices]), np.concatenate([neighbors, vertices]),
+                                  np.ones(len(neighbors) + num_vertices), (num_vertices, num_vertices))
+    return operator, operator.row_counts()
+
+
+def smooth_weights(weights, offsets, neighbors, iterations):
+    """
+    Average every vertex weight with its neighbors, for all (N, G) groups at once.
+    Each iteration is one sparse-dense product with the row-normalized (I + A) operator; the sum is divided by
+    1 + degree and rounded to float32 like Blender stores weights, so the results match per-vertex smoothing.
+    """
+    operator, counts = umbrella_operator(offsets, neighbors)
+    weights = np.asarray(weights, dtype=np.float32)
+    for _ in range(iterations):
+        weights = ((operator @ weights.astype(np.float64)) / counts[:, None]).astype(np.float32)
+    return weights